@@ -0,0 +1,139 @@
+"""
+API响应缓存模块（SQLite）：按接口设置有效期，缓存登录状态、已购课程列表和课程详情等很少变化的响应，
+总大小超过上限时淘汰最久未使用的条目
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# 各接口的默认有效期（秒）：nav 登录状态，paid 已购课程列表的每一页，season 课程详情
+DEFAULT_TTLS = {'nav': 3600, 'paid': 3600, 'season': 12 * 3600}
+
+
+class ApiCache:
+    """API响应缓存：以账号、接口和查询参数为键，只缓存成功的响应"""
+
+    def __init__(self, db_path: str, account: str = '', ttls: Optional[Dict[str, float]] = None,
+                 max_bytes: int = 50 * 1024 * 1024, refresh: bool = False):
+        """
+        初始化缓存，数据库不存在时自动创建
+        :param db_path: 数据库文件路径
+        :param account: 账号标识（如SESSDATA），只保存其哈希，切换账号后不会读到其他账号的缓存
+        :param ttls: 按接口覆盖的有效期（秒），如 {"season": 3600}，0表示不缓存该接口
+        :param max_bytes: 缓存的总大小上限（字节）
+        :param refresh: 为True时不读取缓存，所有请求都重新获取并更新缓存
+        """
+        self.db_path = db_path
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_bytes = max(0, int(max_bytes))
+        self.refresh = refresh
+        self._account = hashlib.sha256(account.encode('utf-8')).hexdigest()
+        self._stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # 同时获取多个课程详情的线程共用一个连接，由锁保证串行访问
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+
+    def get(self, endpoint: str, params: Dict) -> Optional[Dict]:
+        """
+        读取未过期的缓存
+        :param endpoint: 接口名（nav/paid/season）
+        :param params: 查询参数
+        :return: 响应JSON，没有缓存、已过期或要求刷新时返回None
+        """
+        ttl = self.ttls.get(endpoint, 0)
+        if self.refresh or not ttl:
+            return None
+        key = self._key(endpoint, params)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT body, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > ttl:
+                self._stats['misses'] += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._stats['hits'] += 1
+        return json.loads(row[0])
+
+    def put(self, endpoint: str, params: Dict, data: Dict) -> None:
+        """
+        写入缓存，并淘汰过期和超出大小上限的条目
+        :param endpoint: 接口名
+        :param params: 查询参数
+        :param data: 响应JSON
+        """
+        if not self.ttls.get(endpoint, 0):
+            return
+        body = json.dumps(data, ensure_ascii=False)
+        size = len(body.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO responses (key, endpoint, body, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (self._key(endpoint, params), endpoint, body, size, now, now))
+            self._evict(now)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取缓存统计
+        :return: 命中、未命中和淘汰的次数
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def _key(self, endpoint: str, params: Dict) -> str:
+        """
+        计算缓存键
+        :param endpoint: 接口名
+        :param params: 查询参数
+        :return: 键
+        """
+        text = json.dumps([self._account, endpoint, params], sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _evict(self, now: float) -> None:
+        """
+        删除已过期的条目，总大小仍超过上限时按最久未使用的顺序删除，调用方持有锁
+        :param now: 当前时间
+        """
+        evicted = 0
+        for endpoint, ttl in self.ttls.items():
+            evicted += self._conn.execute(
+                "DELETE FROM responses WHERE endpoint = ? AND created_at < ?", (endpoint, now - ttl)
+            ).rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        self._stats['evicted'] += evicted
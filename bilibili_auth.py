@@ -5,6 +5,8 @@ import requests
 import json
 import os
 from typing import Dict, Optional
+from http_pool import PooledHTTPAdapter
+from throttle import Throttle
 
 
 class BilibiliAuth:
@@ -22,7 +24,12 @@ class BilibiliAuth:
             'Referer': 'https://www.bilibili.com',
         }
         self.session.headers.update(self.headers)
+        # 全局限速器，修改配置文件中的限速项后无需重启即可生效
+        self.throttle = Throttle(config_path=config_path)
+        self.set_pool_size(10)
+        self.config = {}
         self._load_config()
+        self.throttle.load_config(self.config)
     
     def _load_config(self) -> None:
         """加载配置文件"""
@@ -32,6 +39,7 @@ class BilibiliAuth:
         
         with open(self.config_path, 'r', encoding='utf-8') as f:
             config = json.load(f)
+        self.config = config
         
         # 设置cookie
         if 'cookie' in config and config['cookie']:
@@ -65,15 +73,37 @@ class BilibiliAuth:
         
         requests.utils.add_dict_to_cookiejar(self.session.cookies, cookies)
     
-    def check_login(self) -> bool:
+    def set_pool_size(self, pool_size: int) -> None:
+        """
+        设置每个主机的连接池大小，应在发出请求之前调用
+        :param pool_size: 每个主机保持的最大连接数
+        """
+        self.adapter = PooledHTTPAdapter(pool_size, throttle=self.throttle)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+    
+    def get_connection_stats(self) -> Dict[str, int]:
+        """
+        获取连接复用统计
+        :return: 请求数、新建连接数、复用连接的请求数
+        """
+        return self.adapter.get_stats()
+    
+    def check_login(self, cache=None) -> bool:
         """
         检查是否已登录
+        :param cache: 可选的API响应缓存（ApiCache），有效期内不再请求
         :return: 是否已登录
         """
         try:
             url = "https://api.bilibili.com/x/web-interface/nav"
-            response = self.session.get(url)
-            data = response.json()
+            data = cache.get('nav', {}) if cache is not None else None
+            if data is None:
+                response = self.session.get(url)
+                data = response.json()
+                # 只缓存已登录的结果，未登录时下次启动重新检查
+                if cache is not None and data.get('code') == 0 and data['data'].get('isLogin'):
+                    cache.put('nav', {}, data)
             
             if data['code'] == 0 and data['data']['isLogin']:
                 print(f"登录成功! 用户名: {data['data']['uname']}")
@@ -4,89 +4,144 @@ B站课程获取模块
 import requests
 import json
 import os
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlsplit
 from bilibili_auth import BilibiliAuth
+from retry_policy import RetryPolicy, RetryableError, RETRYABLE_API_CODES
+from api_cache import ApiCache
+from stream_selector import DEFAULT_FNVAL
 
 
 class BilibiliCourse:
     """B站课程类"""
     
-    def __init__(self, auth: BilibiliAuth):
+    def __init__(self, auth: BilibiliAuth, retry_policy: Optional[RetryPolicy] = None, debug: bool = False,
+                 cache: Optional[ApiCache] = None, fnval: int = DEFAULT_FNVAL):
         """
         初始化课程对象
         :param auth: 认证对象
+        :param retry_policy: 共享的重试策略
+        :param debug: 输出API原始响应，用于排查接口变化
+        :param cache: API响应缓存，用于已购课程列表和课程详情
+        :param fnval: 请求播放地址时的fnval，由流选择策略决定（StreamPolicy.fnval）
         """
         self.auth = auth
         self.session = auth.get_session()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.debug = debug
+        self.cache = cache
+        self.fnval = fnval
     
-    def get_purchased_courses(self) -> List[Dict]:
+    def _get_api(self, url: str, params: Dict, name: str, endpoint: Optional[str] = None) -> Dict:
         """
-        获取已购买的课程列表
+        请求API并解析JSON。超时、连接中断、5xx、412和-412等可重试的错误按重试策略重试；
+        业务码-101（未登录）、-404等由调用方按原逻辑处理，不重试
+        :param url: API地址
+        :param params: 查询参数
+        :param name: 请求名称，用于日志和重试统计
+        :param endpoint: 缓存中的接口名，传入时优先读取缓存，成功的响应写入缓存
+        :return: 响应JSON
+        """
+        use_cache = endpoint is not None and self.cache is not None
+        if use_cache:
+            cached = self.cache.get(endpoint, params)
+            if cached is not None:
+                return cached
+        
+        def request() -> Dict:
+            response = self.session.get(url, params=params, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+            if data.get('code') in RETRYABLE_API_CODES:
+                raise RetryableError(f"API返回 {data.get('code')}: {data.get('message', '')}")
+            return data
+        
+        data = self.retry_policy.call(request, name, host=urlsplit(url).netloc, wait_open=True)
+        if use_cache and data.get('code') == 0:
+            self.cache.put(endpoint, params, data)
+        return data
+    
+    def get_purchased_courses(self, page_size: int = 20, workers: int = 4) -> List[Dict]:
+        """
+        获取已购买的课程列表。先请求第一页得到课程总数，其余各页同时请求（请求频率由全局限速器控制），
+        结果按页码顺序合并并去除重复的课程
+        :param page_size: 每页课程数
+        :param workers: 同时请求的页数
         :return: 课程列表
         """
-        courses = []
-        page = 1
-        page_size = 20
+        print("正在请求第 1 页...")
+        first = self._get_paid_page(1, page_size)
+        if first is None:
+            return []
+        items, total = first
         
-        while True:
-            try:
-                # 使用正确的已购课程API
-                url = "https://api.bilibili.com/pugv/pay/web/my/paid"
-                params = {
-                    'pn': page,
-                    'ps': page_size
+        pages = [items]
+        page_count = (total + page_size - 1) // page_size
+        if len(items) == page_size and page_count > 1:
+            print(f"共 {total} 个课程，同时请求其余 {page_count - 1} 页...")
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, page_count - 1))) as executor:
+                for page, result in zip(range(2, page_count + 1),
+                                        executor.map(lambda pn: self._get_paid_page(pn, page_size),
+                                                     range(2, page_count + 1))):
+                    if result is None:
+                        print(f"第 {page} 页获取失败，课程列表可能不完整")
+                        continue
+                    pages.append(result[0])
+        
+        # 请求期间购买或退款会使分页错位，同一课程可能出现在相邻两页
+        courses = []
+        seen = set()
+        for page_items in pages:
+            for item in page_items:
+                course_info = {
+                    'season_id': item.get('id') or item.get('season_id'),  # API返回的是id字段
+                    'title': item.get('title'),
+                    'ep_count': item.get('ep_count', 0),
+                    'cover': item.get('cover', '')
                 }
-                
-                print(f"正在请求第 {page} 页...")
-                response = self.session.get(url, params=params, timeout=10)
-                
-                print(f"HTTP状态码: {response.status_code}")
-                
-                if response.status_code != 200:
-                    print(f"HTTP状态码异常: {response.status_code}")
-                    break
-                
-                data = response.json()
-                print(f"API响应: {json.dumps(data, ensure_ascii=False)[:200]}")
-                
-                if data['code'] != 0:
-                    print(f"获取课程列表失败: {data.get('message', '未知错误')}")
-                    break
-                
-                # 从data.data中获取课程列表（注意是双层data）
-                data_obj = data.get('data', {})
-                items = data_obj.get('data', [])  # 注意这里是data.data
-                
-                if not items:
-                    break
-                
-                # 处理每个课程，提取正确的字段
-                for item in items:
-                    course_info = {
-                        'season_id': item.get('id') or item.get('season_id'),  # API返回的是id字段
-                        'title': item.get('title'),
-                        'ep_count': item.get('ep_count', 0),
-                        'cover': item.get('cover', '')
-                    }
-                    courses.append(course_info)
-                print(f"已获取 {len(courses)} 个课程...")
-                
-                # 检查是否还有更多页
-                total = data.get('data', {}).get('total', 0)
-                if len(courses) >= total or len(items) < page_size:
-                    break
-                
-                page += 1
-                
-            except Exception as e:
-                print(f"获取课程列表出错: {e}")
-                import traceback
-                traceback.print_exc()
-                break
+                if course_info['season_id'] in seen:
+                    continue
+                seen.add(course_info['season_id'])
+                courses.append(course_info)
         
         print(f"共获取到 {len(courses)} 个已购买的课程")
         return courses
     
+    def _get_paid_page(self, page: int, page_size: int) -> Optional[Tuple[List[Dict], int]]:
+        """
+        请求已购课程列表的一页
+        :param page: 页码
+        :param page_size: 每页课程数
+        :return: (本页课程, 课程总数)，失败时返回None
+        """
+        try:
+            url = "https://api.bilibili.com/pugv/pay/web/my/paid"
+            params = {
+                'pn': page,
+                'ps': page_size
+            }
+            
+            data = self._get_api(url, params, "获取课程列表", 'paid')
+            if self.debug:
+                print(f"API响应: {json.dumps(data, ensure_ascii=False)[:200]}")
+            
+            if data['code'] != 0:
+                print(f"获取课程列表失败: {data.get('message', '未知错误')}")
+                return None
+            
+            # 从data.data中获取课程列表（注意是双层data）
+            data_obj = data.get('data', {})
+            items = data_obj.get('data', []) or []  # 注意这里是data.data
+            return items, data_obj.get('total', 0)
+            
+        except Exception as e:
+            print(f"获取课程列表出错: {e}")
+            if self.debug:
+                import traceback
+                traceback.print_exc()
+            return None
+    
     def _get_courses_alternative(self) -> List[Dict]:
         """
         使用备用API获取课程列表
@@ -170,6 +225,28 @@ class BilibiliCourse:
         
         return courses
     
+    def get_course_details(self, season_ids: List[int], workers: int = 4, rounds: int = 2) -> Dict[int, Optional[Dict]]:
+        """
+        同时获取多个课程的详情。单个请求的可重试错误由重试策略在各自的线程中重试，不影响其他课程；
+        仍然失败的课程在其他课程完成后再整体重试一轮
+        :param season_ids: 课程ID列表
+        :param workers: 同时请求的课程数
+        :param rounds: 最多请求几轮
+        :return: {课程ID: 课程详情}，始终失败的课程为None
+        """
+        details: Dict[int, Optional[Dict]] = {season_id: None for season_id in season_ids}
+        pending = list(dict.fromkeys(season_ids))
+        for round_index in range(rounds):
+            if not pending:
+                break
+            if round_index > 0:
+                print(f"重新获取 {len(pending)} 个课程的详情...")
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as executor:
+                for season_id, detail in zip(pending, executor.map(self.get_course_detail, pending)):
+                    details[season_id] = detail
+            pending = [season_id for season_id in pending if details[season_id] is None]
+        return details
+    
     def get_course_detail(self, season_id: int) -> Optional[Dict]:
         """
         获取课程详情
@@ -182,8 +259,7 @@ class BilibiliCourse:
                 'season_id': season_id
             }
             
-            response = self.session.get(url, params=params)
-            data = response.json()
+            data = self._get_api(url, params, "获取课程详情", 'season')
             
             if data['code'] != 0:
                 print(f"获取课程详情失败: {data.get('message', '未知错误')}")
@@ -208,12 +284,11 @@ class BilibiliCourse:
                 'ep_id': ep_id,
                 'cid': cid,
                 'qn': 127,  # 清晰度，127表示最高画质（8K），会自动降级到可用的最高画质
-                'fnval': 16,  # 格式，16表示dash格式
+                'fnval': self.fnval,  # DASH格式；配置了编码偏好时同时返回4K/8K和AV1流，由下载器按策略选择
                 'fourk': 1
             }
             
-            response = self.session.get(url, params=params)
-            data = response.json()
+            data = self._get_api(url, params, "获取播放地址")
             
             if data['code'] != 0:
                 print(f"获取播放地址失败: {data.get('message', '未知错误')}")
@@ -4,22 +4,72 @@ B站视频下载模块
 import requests
 import os
 import re
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple, Union
 from pathlib import Path
 import time
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from segment_downloader import SegmentDownloader, DownloadCancelled
+from cdn_selector import MirrorSelector, stream_urls
+from download_ledger import DownloadLedger
+from playurl_prefetcher import PlayurlPrefetcher
+from throttle import Throttle
+from retry_policy import RetryPolicy
+from merge_queue import MergeQueue, merge_tracks
+from progress import ProgressRenderer
+from integrity import Manifest, hash_file
+from stream_selector import StreamPolicy, video_codec
+from dash_index import index_range
+from connection_controller import ConnectionController
 
 
 class BilibiliDownloader:
     """B站视频下载器"""
     
-    def __init__(self, session: requests.Session, download_path: str = "./downloads"):
+    def __init__(self, session: requests.Session, download_path: str = "./downloads",
+                 max_connections: int = 4, course=None, ledger: Optional[DownloadLedger] = None,
+                 prefetcher: Optional[PlayurlPrefetcher] = None, throttle: Optional[Throttle] = None,
+                 retry_policy: Optional[RetryPolicy] = None, stream_merge: bool = False,
+                 merge_engine: str = 'auto', merge_queue: Optional[MergeQueue] = None,
+                 progress: Optional[ProgressRenderer] = None, stream_policy: Optional[StreamPolicy] = None,
+                 controller: Optional[ConnectionController] = None):
         """
         初始化下载器
         :param session: requests会话
         :param download_path: 下载路径
+        :param max_connections: 单个文件的并发连接数，1表示单连接下载
+        :param course: 共享的课程API对象（BilibiliCourse），用于获取播放地址
+        :param ledger: 下载账本，已完成的剧集不再请求播放地址
+        :param prefetcher: 播放地址预取器，提前解析后续剧集的播放地址
+        :param throttle: 全局限速器
+        :param retry_policy: 共享的重试策略
+        :param stream_merge: 边下载边通过管道交给ffmpeg合并，不生成临时.m4s文件（仅支持Linux/macOS）
+        :param merge_engine: 合并方式，auto先用内置合并、文件结构不支持时改用ffmpeg；ffmpeg始终使用ffmpeg
+        :param merge_queue: 合并队列，下载完成后交给独立的进程池合并，未传入时在下载线程中合并
+        :param progress: 进度绘制器，与课件下载共享
+        :param stream_policy: 视频流和音频流的选择策略，可按课程单独配置
+        :param controller: 自适应连接数控制器，与课件下载共享，未传入时每个文件固定max_connections个连接
         """
         self.session = session
         self.download_path = download_path
+        self.course = course
+        self.ledger = ledger
+        self.prefetcher = prefetcher
+        self.mirror_selector = MirrorSelector(session)
+        self.segment_downloader = SegmentDownloader(session, max_connections,
+                                                    mirror_selector=self.mirror_selector,
+                                                    throttle=throttle,
+                                                    retry_policy=retry_policy,
+                                                    progress=progress,
+                                                    controller=controller)
+        self.merge_engine = merge_engine
+        self.merge_queue = merge_queue
+        self.stream_policy = stream_policy or StreamPolicy()
+        # ffmpeg通过 pipe:N 读取继承的文件描述符，Windows不支持向子进程传递描述符
+        self.stream_merge = stream_merge and os.name == 'posix'
+        if stream_merge and not self.stream_merge:
+            print("当前系统不支持管道合并，使用临时文件合并")
         os.makedirs(download_path, exist_ok=True)
     
     def sanitize_filename(self, filename: str) -> str:
@@ -38,87 +88,90 @@ class BilibiliDownloader:
             filename = filename[:200]
         return filename
     
-    def download_file(self, url: str, filepath: str, headers: Optional[Dict] = None) -> bool:
+    def download_file(self, url: str, filepath: str, headers: Optional[Dict] = None,
+                      cancel: Optional[threading.Event] = None, mirrors: Optional[List[str]] = None,
+                      result: Optional[Dict] = None, index_range: Optional[Tuple[int, int]] = None) -> bool:
         """
         下载文件
         :param url: 文件URL
         :param filepath: 保存路径
         :param headers: 请求头
+        :param cancel: 取消事件，置位后下载中止
+        :param mirrors: 备用镜像地址，与url一起测速后选择最快的主机，传输中失败时切换
+        :param result: 可选，用于返回文件大小和内容哈希
+        :param index_range: DASH流中sidx索引的位置，分段按分片边界对齐
         :return: 是否成功
         """
         try:
-            if headers is None:
-                headers = {}
-            
-            # 合并默认headers
-            download_headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'https://www.bilibili.com'
-            }
-            download_headers.update(headers)
-            
-            response = self.session.get(url, headers=download_headers, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
+            download_headers = self._download_headers(headers)
             
             os.makedirs(os.path.dirname(filepath), exist_ok=True)
             
-            with open(filepath, 'wb') as f:
-                downloaded = 0
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        # 显示下载进度
-                        if total_size > 0:
-                            percent = (downloaded / total_size) * 100
-                            print(f"\r下载进度: {percent:.1f}% ({downloaded}/{total_size})", end='')
-            
-            print()  # 换行
-            return True
+            candidates = [url]
+            if mirrors:
+                candidates = self.mirror_selector.rank([url] + list(mirrors), download_headers)
+            
+            # 服务器支持Range时多连接分段下载，否则单连接流式下载
+            return self.segment_downloader.download(candidates[0], filepath, download_headers, cancel,
+                                                    candidates[1:], result=result, index_range=index_range)
             
         except Exception as e:
+            # 未完成的数据保留在.part文件中，下次运行从断点继续
             print(f"\n下载失败: {e}")
-            if os.path.exists(filepath):
-                os.remove(filepath)
             return False
     
-    def download_video_dash(self, playurl_data: Dict, output_path: str, title: str) -> bool:
+    def _download_headers(self, headers: Optional[Dict] = None) -> Dict:
+        """
+        合并默认请求头
+        :param headers: 额外的请求头
+        :return: 请求头
+        """
+        download_headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Referer': 'https://www.bilibili.com'
+        }
+        download_headers.update(headers or {})
+        return download_headers
+    
+    def download_video_dash(self, playurl_data: Dict, output_path: str, title: str,
+                            result: Optional[Dict] = None, policy: Optional[StreamPolicy] = None) -> bool:
         """
         下载DASH格式视频（视频和音频分离）
         :param playurl_data: 播放地址数据
         :param output_path: 输出路径
         :param title: 视频标题
+        :param result: 可选，用于返回输出文件、画质、各流字节数和输出文件的内容哈希
+        :param policy: 流选择策略，默认为下载器的策略
         :return: 是否成功
         """
+        if result is None:
+            result = {}
+        if policy is None:
+            policy = self.stream_policy
         try:
             dash = playurl_data.get('dash')
             if not dash:
                 print("未找到DASH格式视频")
                 return False
             
-            # 获取最高质量的视频流（列表中第一个通常是最高画质）
-            video_list = dash.get('video', [])
-            if not video_list:
+            # 按策略选择视频流和音频流
+            video, audio = policy.select(dash)
+            if video is None:
                 print("未找到视频流")
                 return False
-            video = video_list[0]
-            print(f"视频画质: {video.get('id', 'unknown')} - {video.get('width', 0)}x{video.get('height', 0)}")
+            print(f"视频画质: {video.get('id', 'unknown')} - {video.get('width', 0)}x{video.get('height', 0)} "
+                  f"{video_codec(video)} {video.get('bandwidth', 0) // 1000}kbps")
             
-            # 获取音频流
-            audio_list = dash.get('audio', [])
-            if not audio_list:
+            if audio is None:
                 print("错误: 未找到音频流，无法下载完整视频")
                 return False
-            audio = audio_list[0]
+            print(f"音频: {audio.get('id', 'unknown')} {audio.get('bandwidth', 0) // 1000}kbps")
             
-            # 尝试不同的URL字段名
-            video_url = video.get('baseUrl') or video.get('base_url') or video.get('url')
-            audio_url = audio.get('baseUrl') or audio.get('base_url') or audio.get('url')
+            # 主地址（baseUrl/base_url/url）和备用镜像（backupUrl/backup_url）
+            video_urls = stream_urls(video)
+            audio_urls = stream_urls(audio)
             
-            if not video_url or not audio_url:
+            if not video_urls or not audio_urls:
                 print(f"错误: 无法获取视频URL")
                 print(f"视频数据: {video}")
                 print(f"音频数据: {audio}")
@@ -128,27 +181,56 @@ class BilibiliDownloader:
             video_file = os.path.join(output_path, f"{safe_title}_video.m4s")
             audio_file = os.path.join(output_path, f"{safe_title}_audio.m4s")
             output_file = os.path.join(output_path, f"{safe_title}.mp4")
+            result['output_file'] = output_file
+            result['quality'] = video.get('id')
             
             # 如果已存在，跳过
             if os.path.exists(output_file):
                 print(f"文件已存在，跳过: {output_file}")
                 return True
             
-            print(f"\n下载视频流...")
-            if not self.download_file(video_url, video_file):
-                return False
+            if self.stream_merge:
+                print(f"\n同时下载视频流和音频流，边下载边合并...")
+                sizes = self.stream_merge_tracks([('视频', video_urls, index_range(video)),
+                                                  ('音频', audio_urls, index_range(audio))], output_file)
+                if sizes is None:
+                    return False
+                if not (self.check_track_size('视频', video, sizes[0], dash.get('duration'))
+                        and self.check_track_size('音频', audio, sizes[1], dash.get('duration'))):
+                    os.remove(output_file)
+                    return False
+                result['video_bytes'], result['audio_bytes'] = sizes
+                # 输出由ffmpeg写入，只能在合并后读取一遍计算哈希
+                result['content_hash'] = hash_file(output_file)
+                return True
             
-            print(f"下载音频流...")
-            if not self.download_file(audio_url, audio_file):
-                # 清理已下载的视频文件
-                if os.path.exists(video_file):
-                    os.remove(video_file)
+            print(f"\n同时下载视频流和音频流...")
+            # SegmentBase中有sidx的位置时，先读取索引，再按分片边界分段下载
+            tracks = [
+                ('视频', video_urls, video_file, index_range(video)),
+                ('音频', audio_urls, audio_file, index_range(audio)),
+            ]
+            if not self.download_tracks(tracks):
+                return False
+            result['video_bytes'] = os.path.getsize(video_file)
+            result['audio_bytes'] = os.path.getsize(audio_file)
+            if not (self.check_track_size('视频', video, result['video_bytes'], dash.get('duration'))
+                    and self.check_track_size('音频', audio, result['audio_bytes'], dash.get('duration'))):
+                os.remove(video_file)
+                os.remove(audio_file)
                 return False
             
+            # 交给合并队列，下载线程继续下载下一集
+            if self.merge_queue is not None:
+                print("下载完成，加入合并队列")
+                result['merge'] = self.merge_queue.submit(video_file, audio_file, output_file, self.merge_engine,
+                                                          result)
+                return True
+            
             # 合并视频和音频
             print("合并视频和音频...")
             try:
-                success = self.merge_video_audio(video_file, audio_file, output_file)
+                success = self.merge_video_audio(video_file, audio_file, output_file, result)
                 
                 # 删除临时文件
                 if os.path.exists(video_file):
@@ -170,70 +252,290 @@ class BilibiliDownloader:
             print(f"下载视频失败: {e}")
             return False
     
-    def merge_video_audio(self, video_path: str, audio_path: str, output_path: str) -> bool:
+    def estimate_size(self, playurl_data: Dict, season_id: Optional[int] = None) -> Optional[int]:
+        """
+        按课程的选择策略估计剧集的下载字节数：流中有size时直接使用，否则按码率(bandwidth)乘以时长估算
+        :param playurl_data: 播放地址数据
+        :param season_id: 课程ID
+        :return: 视频流和音频流合计的字节数，无法估计时返回None
+        """
+        dash = playurl_data.get('dash') or {}
+        duration = dash.get('duration') or 0
+        total = 0
+        for stream in self.stream_policy.for_course(season_id).select(dash):
+            if stream is None:
+                return None
+            size = stream.get('size') or stream.get('bandwidth', 0) * duration // 8
+            if not size:
+                return None
+            total += size
+        return total
+    
+    @staticmethod
+    def check_track_size(name: str, stream: Dict, size: int, duration: Optional[float]) -> bool:
+        """
+        用播放地址中的元数据检查下载的字节数：有size时必须一致；否则按平均码率(bandwidth)和时长估算，
+        明显偏小时认为被截断（如代理在中途断开但返回了与截断后长度一致的Content-Length）
+        :param name: 轨道名称
+        :param stream: 播放地址中的视频流或音频流
+        :param size: 下载的字节数
+        :param duration: 时长（秒）
+        :return: 是否正常
+        """
+        expected = stream.get('size')
+        if expected and size != expected:
+            print(f"{name}流大小与播放地址不一致: {size}/{expected} 字节")
+            return False
+        bandwidth = stream.get('bandwidth')
+        if bandwidth and duration:
+            estimate = bandwidth * duration / 8
+            if size < estimate / 4:
+                print(f"{name}流只有 {size} 字节，按码率估算应约为 {int(estimate)} 字节，可能被截断")
+                return False
+        return True
+    
+    def download_tracks(self, tracks: List[Tuple[str, List[str], str, Optional[Tuple[int, int]]]]) -> bool:
+        """
+        同时下载多个DASH轨道，任一轨道失败时取消其余轨道并清理临时文件
+        :param tracks: [(轨道名称, 候选URL列表, 保存路径, sidx索引的位置)]
+        :return: 是否全部成功
+        """
+        cancel = threading.Event()
+        
+        def download_track(track: Tuple[str, List[str], str, Optional[Tuple[int, int]]]) -> bool:
+            name, urls, filepath, sidx_range = track
+            success = self.download_file(urls[0], filepath, cancel=cancel, mirrors=urls[1:],
+                                         index_range=sidx_range)
+            if not success:
+                # 通知其他轨道停止下载
+                if not cancel.is_set():
+                    print(f"{name}流下载失败，取消其余轨道")
+                cancel.set()
+            return success
+        
+        with ThreadPoolExecutor(max_workers=len(tracks)) as executor:
+            results = list(executor.map(download_track, tracks))
+        
+        if all(results):
+            return True
+        
+        # 清理已下载的临时文件
+        for _, _, filepath, _ in tracks:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        return False
+    
+    def stream_merge_tracks(self, tracks: List[Tuple[str, List[str], Optional[Tuple[int, int]]]],
+                            output_file: str) -> Optional[List[int]]:
+        """
+        边下载边合并：各轨道按文件顺序写入管道，ffmpeg从管道读取后直接封装为MP4，
+        不生成临时.m4s文件。输出先写入output_file.part，成功后改名
+        :param tracks: [(轨道名称, 候选URL列表, sidx索引的位置)]，按ffmpeg输入顺序排列
+        :param output_file: 输出文件路径
+        :return: 各轨道字节数，失败时返回None
+        """
+        headers = self._download_headers()
+        part_file = output_file + '.part'
+        pipes = [os.pipe() for _ in tracks]
+        read_fds = [read_fd for read_fd, _ in pipes]
+        
+        cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error']
+        for read_fd in read_fds:
+            cmd += ['-i', f'pipe:{read_fd}']
+        for index in range(len(tracks)):
+            cmd += ['-map', str(index)]
+        cmd += ['-c', 'copy', '-f', 'mp4', '-y', part_file]
+        
+        try:
+            process = subprocess.Popen(cmd, pass_fds=read_fds, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            print("错误: 未找到ffmpeg，请确保ffmpeg已安装并添加到系统PATH")
+            for read_fd, write_fd in pipes:
+                os.close(read_fd)
+                os.close(write_fd)
+            return None
+        # 读取端已交给ffmpeg，父进程只保留写入端
+        for read_fd in read_fds:
+            os.close(read_fd)
+        
+        # ffmpeg的错误输出在后台读取，避免输出过多时阻塞ffmpeg
+        stderr = []
+        stderr_thread = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        stderr_thread.start()
+        
+        cancel = threading.Event()
+        sizes = [0] * len(tracks)
+        
+        def feed_track(index: int) -> bool:
+            name, urls, sidx_range = tracks[index]
+            try:
+                with os.fdopen(pipes[index][1], 'wb') as pipe:
+                    candidates = self.mirror_selector.rank(urls, headers)
+                    sizes[index] = self.segment_downloader.download_stream(
+                        candidates[0], pipe.write, headers, cancel, candidates[1:],
+                        f"{os.path.basename(output_file)} {name}", sidx_range)
+                return True
+            except DownloadCancelled:
+                return False
+            except Exception as e:
+                print(f"\n{name}流下载失败: {e}，取消其余轨道")
+                cancel.set()
+                # 结束ffmpeg，阻塞在管道写入上的其他轨道随之退出
+                process.kill()
+                return False
+        
+        with ThreadPoolExecutor(max_workers=len(tracks)) as executor:
+            results = list(executor.map(feed_track, range(len(tracks))))
+        
+        returncode = process.wait()
+        stderr_thread.join()
+        if all(results) and returncode == 0:
+            os.replace(part_file, output_file)
+            print("合并成功!")
+            return sizes
+        
+        error = stderr[0].decode('utf-8', errors='replace').strip() if stderr and stderr[0] else ''
+        if error:
+            print(f"合并失败 (ffmpeg返回码 {returncode}): {error}")
+        if os.path.exists(part_file):
+            os.remove(part_file)
+        return None
+    
+    def merge_video_audio(self, video_path: str, audio_path: str, output_path: str,
+                          result: Optional[Dict] = None) -> bool:
         """
-        使用ffmpeg合并视频和音频
+        合并视频和音频，内置合并不支持时使用ffmpeg
         :param video_path: 视频文件路径
         :param audio_path: 音频文件路径
         :param output_path: 输出文件路径
+        :param result: 可选，用于返回输出文件的内容哈希
         :return: 是否成功
         """
-        try:
-            import subprocess
-            
-            cmd = [
-                'ffmpeg',
-                '-i', video_path,
-                '-i', audio_path,
-                '-c', 'copy',
-                '-y',  # 覆盖输出文件
-                output_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                print("合并成功!")
-                return True
-            else:
-                print(f"合并失败: {result.stderr}")
-                raise Exception(f"ffmpeg合并失败，返回码: {result.returncode}")
-                
-        except FileNotFoundError:
-            print("错误: 未找到ffmpeg，请确保ffmpeg已安装并添加到系统PATH")
-            raise Exception("ffmpeg未安装或未添加到PATH")
-        except Exception as e:
-            print(f"合并出错: {e}")
-            raise
+        return merge_tracks(video_path, audio_path, output_path, self.merge_engine, result)
+    
+    def _get_course(self):
+        """
+        获取共享的课程API对象，未传入时只创建一次
+        :return: BilibiliCourse对象
+        """
+        if self.course is None:
+            from bilibili_auth import BilibiliAuth
+            from bilibili_course import BilibiliCourse
+            self.course = BilibiliCourse(BilibiliAuth())
+        return self.course
     
-    def download_episode(self, episode: Dict, course_path: str, index: int) -> bool:
+    def download_episode(self, episode: Dict, course_path: str, index: int,
+                         season_id: Optional[int] = None,
+                         manifest: Optional[Manifest] = None,
+                         result: Optional[Dict] = None) -> Union[bool, Future]:
         """
         下载单个课程剧集
         :param episode: 剧集信息
         :param course_path: 课程目录
         :param index: 剧集序号
-        :return: 是否成功
+        :param season_id: 课程ID，用于在下载账本中查找和记录剧集
+        :param manifest: 课程的校验清单，下载完成后记录输出文件的大小和内容哈希
+        :param result: 可选，用于返回输出文件、画质和各流字节数
+        :return: 是否成功；下载完成后在合并队列中合并时返回Future，结果为是否成功
         """
-        from bilibili_course import BilibiliCourse
-        
         ep_id = episode.get('id')
         cid = episode.get('cid')
         title = episode.get('title', f'第{index}集')
+        use_ledger = self.ledger is not None and season_id is not None
+        
+        if use_ledger:
+            record = self.ledger.get_episode(season_id, ep_id, cid)
+            # 账本中已完成且文件完整的剧集直接跳过，不再请求播放地址
+            if DownloadLedger.is_record_done(record):
+                print(f"已下载，跳过: {index:02d}. {title}")
+                return True
+            # 记录为已完成但文件大小不一致（被截断或损坏），删除后重新下载
+            if record and record['status'] == DownloadLedger.DONE and record['file_path'] \
+                    and os.path.exists(record['file_path']):
+                print(f"文件与下载记录不一致，重新下载: {record['file_path']}")
+                os.remove(record['file_path'])
         
         print(f"\n{'='*60}")
         print(f"准备下载: {index:02d}. {title}")
         print(f"{'='*60}")
         
-        # 创建课程对象以获取播放地址
-        from bilibili_auth import BilibiliAuth
-        auth = BilibiliAuth()
-        course = BilibiliCourse(auth)
-        
-        playurl_data = course.get_episode_playurl(ep_id, cid)
+        if self.prefetcher is not None:
+            playurl_data = self.prefetcher.get(ep_id, cid)
+        else:
+            playurl_data = self._get_course().get_episode_playurl(ep_id, cid)
         if not playurl_data:
             print("获取播放地址失败")
+            if use_ledger:
+                self.ledger.mark_episode(season_id, ep_id, cid, DownloadLedger.FAILED,
+                                         error="获取播放地址失败")
             return False
         
         filename = f"{index:02d}. {title}"
         
-        return self.download_video_dash(playurl_data, course_path, filename)
+        # 已存在但与校验清单大小不一致的文件（如被截断）删除后重新下载
+        output_file = os.path.join(course_path, f"{self.sanitize_filename(filename)}.mp4")
+        if manifest is not None and os.path.exists(output_file) and not manifest.matches(output_file):
+            print(f"文件与校验清单不一致，重新下载: {output_file}")
+            os.remove(output_file)
+        
+        if result is None:
+            result = {}
+        success = self.download_video_dash(playurl_data, course_path, filename, result,
+                                           self.stream_policy.for_course(season_id))
+        merge = result.get('merge')
+        if success and merge is not None:
+            if not use_ledger and manifest is None:
+                return merge
+            # 合并完成并记录到账本和校验清单后，返回的Future才完成
+            done = Future()
+            
+            def merged(future: Future) -> None:
+                # 回调中的异常会被concurrent.futures吞掉，必须在这里捕获并让done以失败结束
+                merge_success = False
+                try:
+                    merge_success = future.result()
+                    if merge_success and manifest is not None:
+                        self._record_manifest(manifest, result)
+                    if use_ledger:
+                        self._record_episode(season_id, ep_id, cid, merge_success, result)
+                except Exception as e:
+                    print(f"记录第 {index} 集的下载结果出错: {e}")
+                    merge_success = False
+                done.set_result(merge_success)
+            
+            merge.add_done_callback(merged)
+            return done
+        if success and manifest is not None:
+            self._record_manifest(manifest, result)
+        if use_ledger:
+            self._record_episode(season_id, ep_id, cid, success, result)
+        return success
+    
+    @staticmethod
+    def _record_manifest(manifest: Manifest, result: Dict) -> None:
+        """
+        把本次下载的输出文件记录到校验清单，已存在而跳过的文件没有内容哈希，不记录
+        :param manifest: 校验清单
+        :param result: download_video_dash返回的输出文件和内容哈希
+        """
+        if result.get('content_hash'):
+            manifest.record(result['output_file'], result['content_hash'])
+    
+    def _record_episode(self, season_id: int, ep_id: int, cid: int, success: bool, result: Dict) -> None:
+        """
+        在下载账本中记录剧集的下载结果
+        :param season_id: 课程ID
+        :param ep_id: 剧集ID
+        :param cid: 视频cid
+        :param success: 是否成功
+        :param result: download_video_dash返回的输出文件、画质和各流字节数
+        """
+        if success:
+            self.ledger.mark_episode(season_id, ep_id, cid, DownloadLedger.DONE,
+                                     result.get('output_file'), result.get('quality'),
+                                     result.get('video_bytes', 0), result.get('audio_bytes', 0))
+        else:
+            self.ledger.mark_episode(season_id, ep_id, cid, DownloadLedger.FAILED,
+                                     result.get('output_file'), result.get('quality'),
+                                     error="下载或合并失败")
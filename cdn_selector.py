@@ -0,0 +1,141 @@
+"""
+CDN镜像选择模块
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+
+def stream_urls(stream: Dict) -> List[str]:
+    """
+    获取DASH流的所有候选地址：主地址在前，备用地址（backupUrl）在后，去除重复
+    :param stream: DASH中的video/audio条目
+    :return: URL列表
+    """
+    urls = []
+    for key in ('baseUrl', 'base_url', 'url'):
+        if stream.get(key):
+            urls.append(stream[key])
+            break
+    for key in ('backupUrl', 'backup_url'):
+        urls.extend(stream.get(key) or [])
+    return list(dict.fromkeys(urls))
+
+
+def url_host(url: str) -> str:
+    """
+    获取URL的主机名
+    :param url: URL
+    :return: 主机名
+    """
+    return urlsplit(url).netloc
+
+
+class MirrorSelector:
+    """对候选CDN主机做小范围探测，按首字节时间和吞吐量排序，探测结果在本次运行内按主机记住"""
+
+    def __init__(self, session: requests.Session, probe_bytes: int = 256 * 1024, timeout: float = 5):
+        """
+        初始化镜像选择器
+        :param session: requests会话
+        :param probe_bytes: 探测请求下载的字节数
+        :param timeout: 探测超时秒数
+        """
+        self.session = session
+        self.probe_bytes = probe_bytes
+        self.timeout = timeout
+        self._stats: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def rank(self, urls: List[str], headers: Dict) -> List[str]:
+        """
+        对候选地址按主机速度从快到慢排序，尚未探测过的主机先并发探测
+        :param urls: 候选地址
+        :param headers: 请求头
+        :return: 排序后的地址
+        """
+        urls = list(dict.fromkeys(urls))
+        if len(urls) <= 1:
+            return urls
+
+        with self._lock:
+            unknown = [url for url in urls if url_host(url) not in self._stats]
+        # 每个主机只探测一次
+        unknown = list({url_host(url): url for url in unknown}.values())
+        if unknown:
+            with ThreadPoolExecutor(max_workers=len(unknown)) as executor:
+                list(executor.map(lambda url: self.probe(url, headers), unknown))
+
+        ranked = sorted(urls, key=self._score, reverse=True)
+        best = self.get_stats(url_host(ranked[0]))
+        if best and best['throughput'] > 0:
+            print(f"选择CDN节点: {url_host(ranked[0])} "
+                  f"(首字节 {best['ttfb'] * 1000:.0f}ms, {best['throughput'] / 1024 / 1024:.1f}MB/s)")
+        return ranked
+
+    def probe(self, url: str, headers: Dict) -> Dict:
+        """
+        用一个小的Range请求测量主机的首字节时间和吞吐量
+        :param url: 地址
+        :param headers: 请求头
+        :return: 探测结果
+        """
+        probe_headers = dict(headers)
+        probe_headers['Range'] = f'bytes=0-{self.probe_bytes - 1}'
+        result = {'ttfb': 0.0, 'throughput': 0.0, 'failures': 0}
+        start = time.time()
+        try:
+            response = self.session.get(url, headers=probe_headers, stream=True, timeout=self.timeout)
+            try:
+                response.raise_for_status()
+                ttfb = time.time() - start
+                received = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    received += len(chunk)
+                    if received >= self.probe_bytes:
+                        break
+                elapsed = max(time.time() - start - ttfb, 1e-6)
+                result['ttfb'] = ttfb
+                result['throughput'] = received / elapsed
+            finally:
+                response.close()
+        except Exception as e:
+            print(f"CDN节点探测失败: {url_host(url)} ({e})")
+            result['failures'] = 1
+
+        with self._lock:
+            self._stats[url_host(url)] = result
+        return result
+
+    def report_failure(self, url: str) -> None:
+        """
+        记录主机在传输中失败（卡顿或403/5xx），该主机在后续排序中靠后
+        :param url: 失败的地址
+        """
+        host = url_host(url)
+        with self._lock:
+            stats = self._stats.setdefault(host, {'ttfb': 0.0, 'throughput': 0.0, 'failures': 0})
+            stats['failures'] += 1
+
+    def get_stats(self, host: str) -> Optional[Dict]:
+        """
+        获取主机的探测结果
+        :param host: 主机名
+        :return: {'ttfb': 首字节秒数, 'throughput': 字节/秒, 'failures': 失败次数}
+        """
+        with self._lock:
+            stats = self._stats.get(host)
+            return dict(stats) if stats else None
+
+    def _score(self, url: str):
+        """
+        排序依据：失败次数少的优先，其次吞吐量高的优先
+        :param url: 地址
+        :return: 排序键
+        """
+        stats = self.get_stats(url_host(url)) or {'throughput': 0.0, 'failures': 0}
+        return (-stats['failures'], stats['throughput'])
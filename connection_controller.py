@@ -0,0 +1,248 @@
+"""
+连接数自适应模块：按AIMD（加性增、乘性减）调整每个CDN主机和全局的并发连接数
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import requests
+
+from retry_policy import is_retryable
+
+# CDN限流时返回的状态码，收到后连接数减半
+THROTTLE_STATUS = {403, 429, 503}
+# 吞吐至少提升这个比例才认为增加连接有效
+MIN_GAIN = 0.05
+# 保留的最近调整记录数
+MAX_DECISIONS = 100
+
+
+def is_throttled(error: Exception) -> bool:
+    """
+    判断错误是否表示被CDN限流
+    :param error: 异常
+    :return: 是否限流
+    """
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in THROTTLE_STATUS
+    return False
+
+
+class _Window:
+    """一个主机（或全局）的并发窗口和当前统计周期的吞吐"""
+
+    def __init__(self, limit: int):
+        """
+        初始化窗口
+        :param limit: 初始并发上限
+        """
+        self.limit = limit
+        self.initial = limit
+        self.highest = limit
+        self.active = 0
+        # 统计周期内的最大并发数和收到的字节数
+        self.peak = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.goodput = 0.0
+        # 上一次增加连接前的吞吐，下个周期据此判断增加是否有效；None表示上次调整不是增加
+        self.baseline: Optional[float] = None
+        # 在此时间之前不再增加连接（刚减少或增加无效之后）
+        self.hold_until = 0.0
+        self.last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.throttled = 0
+        self.errors = 0
+
+
+class ConnectionController:
+    """
+    自适应连接数控制器，所有CDN下载共享一个实例。每个分段请求先占用所在主机和全局窗口的名额；
+    每个统计周期结束时，名额用满且吞吐仍在上升就增加一个连接，增加后吞吐没有提升则退回并暂停增加；
+    收到403/429/503时连接数减半，超时、连接中断等错误时减为3/4
+    """
+
+    GLOBAL = '*'
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 32, interval: float = 2.0,
+                 hold: float = 20.0):
+        """
+        初始化控制器
+        :param initial: 每个主机和全局的初始并发连接数
+        :param minimum: 并发连接数下限
+        :param maximum: 并发连接数上限
+        :param interval: 统计周期秒数
+        :param hold: 减少连接或增加无效后，暂停增加的秒数
+        """
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.initial = min(max(int(initial), self.minimum), self.maximum)
+        self.interval = interval
+        self.hold = hold
+        self._windows: Dict[str, _Window] = {self.GLOBAL: _Window(self.initial)}
+        self._decisions: Deque[Dict] = deque(maxlen=MAX_DECISIONS)
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+    def acquire(self, host: str, cancel: Optional[threading.Event] = None) -> bool:
+        """
+        占用一个连接名额，主机或全局的名额已满时等待
+        :param host: CDN主机
+        :param cancel: 取消事件
+        :return: 是否占用成功，等待期间被取消时返回False
+        """
+        with self._available:
+            window = self._window(host)
+            total = self._windows[self.GLOBAL]
+            while window.active >= window.limit or total.active >= total.limit:
+                if cancel is not None and cancel.is_set():
+                    return False
+                self._available.wait(0.5)
+            for item in (window, total):
+                item.active += 1
+                item.peak = max(item.peak, item.active)
+            return True
+
+    def release(self, host: str) -> None:
+        """
+        释放连接名额
+        :param host: CDN主机
+        """
+        with self._available:
+            self._window(host).active -= 1
+            self._windows[self.GLOBAL].active -= 1
+            self._available.notify_all()
+
+    def add_bytes(self, host: str, amount: int) -> None:
+        """
+        记录收到的字节数，统计周期结束时调整连接数
+        :param host: CDN主机
+        :param amount: 字节数
+        """
+        now = time.monotonic()
+        with self._available:
+            for name in (host, self.GLOBAL):
+                window = self._window(name)
+                window.bytes += amount
+                if now - window.started >= self.interval and self._evaluate(name, window, now):
+                    self._available.notify_all()
+
+    def report_error(self, host: str, error: Exception) -> None:
+        """
+        记录请求错误，限流和网络错误时减少连接数；其他错误（如取消、404）不影响连接数
+        :param host: CDN主机
+        :param error: 异常
+        """
+        throttled = is_throttled(error)
+        if not throttled and not is_retryable(error):
+            return
+        now = time.monotonic()
+        factor = 0.5 if throttled else 0.75
+        reason = f"限流 ({error})" if throttled else f"请求错误 ({error})"
+        with self._available:
+            for name in (host, self.GLOBAL):
+                window = self._window(name)
+                if throttled:
+                    window.throttled += 1
+                else:
+                    window.errors += 1
+                # 同一时刻多个连接一起失败时只减少一次
+                if now - window.last_decrease < self.interval:
+                    continue
+                window.last_decrease = now
+                window.hold_until = now + self.hold
+                window.baseline = None
+                limit = max(self.minimum, int(window.limit * factor))
+                if limit < window.limit:
+                    window.decreases += 1
+                    self._decide(name, window, limit, reason)
+
+    def get_stats(self) -> Dict:
+        """
+        获取各主机的连接数和调整记录
+        :return: {'hosts': {主机: {'limit', 'initial', 'highest', 'active', 'goodput', 'increases',
+                 'decreases', 'throttled', 'errors'}}, 'decisions': [{'time', 'host', 'from', 'to',
+                 'goodput', 'reason'}]}，全局窗口的主机名为 '*'
+        """
+        with self._lock:
+            hosts = {
+                name: {
+                    'limit': window.limit,
+                    'initial': window.initial,
+                    'highest': window.highest,
+                    'active': window.active,
+                    'goodput': window.goodput,
+                    'increases': window.increases,
+                    'decreases': window.decreases,
+                    'throttled': window.throttled,
+                    'errors': window.errors,
+                }
+                for name, window in self._windows.items()
+            }
+            return {'hosts': hosts, 'decisions': list(self._decisions)}
+
+    def _window(self, host: str) -> _Window:
+        """
+        获取主机的窗口，调用方持有锁
+        :param host: CDN主机
+        :return: 窗口
+        """
+        window = self._windows.get(host)
+        if window is None:
+            window = self._windows[host] = _Window(self.initial)
+        return window
+
+    def _evaluate(self, name: str, window: _Window, now: float) -> bool:
+        """
+        统计周期结束，根据吞吐决定是否增加连接，调用方持有锁
+        :param name: 主机名
+        :param window: 窗口
+        :param now: 当前时间
+        :return: 上限是否增加
+        """
+        rate = window.bytes / (now - window.started)
+        busy = window.peak >= window.limit
+        window.goodput = rate
+        window.bytes = 0
+        window.peak = window.active
+        window.started = now
+
+        grew = False
+        if window.baseline is not None:
+            # 上个周期增加了连接：吞吐没有明显提升说明已到瓶颈，退回并暂停增加
+            if rate < window.baseline * (1 + MIN_GAIN):
+                window.hold_until = now + self.hold
+                self._decide(name, window, max(self.minimum, window.limit - 1), "增加连接后吞吐未提升")
+                window.baseline = None
+                return False
+            window.baseline = None
+        if busy and now >= window.hold_until and window.limit < self.maximum:
+            window.baseline = rate
+            window.increases += 1
+            self._decide(name, window, window.limit + 1, "连接已用满，尝试增加")
+            grew = True
+        return grew
+
+    def _decide(self, name: str, window: _Window, limit: int, reason: str) -> None:
+        """
+        修改并发上限并记录调整，调用方持有锁
+        :param name: 主机名
+        :param window: 窗口
+        :param limit: 新的上限
+        :param reason: 原因
+        """
+        if limit == window.limit:
+            return
+        self._decisions.append({
+            'time': time.time(),
+            'host': name,
+            'from': window.limit,
+            'to': limit,
+            'goodput': window.goodput,
+            'reason': reason,
+        })
+        window.limit = limit
+        window.highest = max(window.highest, limit)
@@ -4,20 +4,46 @@
 import os
 import re
 import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List, Dict, Optional
+from segment_downloader import SegmentDownloader
+from download_ledger import DownloadLedger
+from throttle import Throttle
+from retry_policy import RetryPolicy, RetryableError, RETRYABLE_API_CODES, RETRYABLE_STATUS
+from progress import ProgressRenderer
+from integrity import Manifest
+from connection_controller import ConnectionController
 
 
 class CoursewareDownloader:
     """课件下载器"""
     
-    def __init__(self, session, download_path: str = "./downloads"):
+    def __init__(self, session, download_path: str = "./downloads", ledger: Optional[DownloadLedger] = None,
+                 throttle: Optional[Throttle] = None, retry_policy: Optional[RetryPolicy] = None,
+                 progress: Optional[ProgressRenderer] = None, workers: int = 2,
+                 controller: Optional[ConnectionController] = None):
         """
         初始化下载器
         :param session: requests会话
         :param download_path: 下载路径
+        :param ledger: 下载账本，已完成的课件不再请求下载地址
+        :param throttle: 全局限速器，与视频下载共享带宽上限
+        :param retry_policy: 共享的重试策略
+        :param progress: 进度绘制器，与视频下载共享
+        :param workers: 同时解析和下载的课件数量
+        :param controller: 自适应连接数控制器，与视频下载共享
         """
         self.session = session
         self.download_path = download_path
+        self.ledger = ledger
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.segment_downloader = SegmentDownloader(session, throttle=throttle,
+                                                    retry_policy=self.retry_policy,
+                                                    progress=progress,
+                                                    controller=controller)
+        # 课件在独立的线程池中解析地址和下载，与剧集下载同时进行
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
         
         # 从session的cookies中提取bili_jct（CSRF token）
         self.csrf = None
@@ -68,7 +94,20 @@ class CoursewareDownloader:
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            response = self.session.post(api_url, data=data, headers=headers, timeout=10)
+            def request():
+                response = self.session.post(api_url, data=data, headers=headers, timeout=10)
+                # 5xx、412等状态码和-412业务码交给重试策略重试，其余情况按原逻辑处理
+                if response.status_code in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                try:
+                    code = response.json().get('code')
+                except ValueError:
+                    code = None
+                if code in RETRYABLE_API_CODES:
+                    raise RetryableError(f"API返回 {code}")
+                return response
+            
+            response = self.retry_policy.call(request, "获取课件地址", host='api.bilibili.com', wait_open=True)
             
             # 检查状态码
             if response.status_code != 200:
@@ -133,100 +172,188 @@ class CoursewareDownloader:
             print(f"  ⚠️ 获取课件URL失败: {e}")
             return None
     
-    def download_courseware(self, course_path: str, courseware_list: List[Dict], season_id: int = None) -> int:
+    def download_courseware(self, course_path: str, courseware_list: List[Dict], season_id: int = None,
+                            manifest: Optional[Manifest] = None) -> int:
         """
-        下载课程的所有课件
+        下载课程的所有课件，等待全部完成
         :param course_path: 课程目录
         :param courseware_list: 课件列表
         :param season_id: 课程ID
+        :param manifest: 课程的校验清单，记录直接下载的课件的大小和内容哈希
         :return: 成功下载数量
         """
+        return self.submit_courseware(course_path, courseware_list, season_id, manifest).result()
+    
+    def submit_courseware(self, course_path: str, courseware_list: List[Dict], season_id: int = None,
+                          manifest: Optional[Manifest] = None) -> Future:
+        """
+        把课程的所有课件交给线程池解析地址和下载，立即返回，调用方可以同时下载剧集
+        :param course_path: 课程目录
+        :param courseware_list: 课件列表
+        :param season_id: 课程ID
+        :param manifest: 课程的校验清单，记录直接下载的课件的大小和内容哈希
+        :return: Future，所有课件处理完成后结果为成功下载数量
+        """
+        done = Future()
         if not courseware_list:
-            return 0
+            done.set_result(0)
+            return done
         
         # 创建课件目录
         courseware_dir = os.path.join(course_path, "课件")
         os.makedirs(courseware_dir, exist_ok=True)
         
-        success_count = 0
+        lock = threading.Lock()
+        state = {'remaining': len(courseware_list), 'success': 0}
+        
+        def finished(job: Future) -> None:
+            try:
+                success = job.result()
+            except Exception as e:
+                print(f"  ✗ 处理课件时出错: {e}")
+                success = False
+            with lock:
+                state['success'] += 1 if success else 0
+                state['remaining'] -= 1
+                if state['remaining']:
+                    return
+            done.set_result(state['success'])
         
         for idx, courseware in enumerate(courseware_list, 1):
-            file_id = courseware.get('file_id')
-            file_name = courseware.get('file_name', f'课件{idx}')
-            
-            print(f"\n[{idx}/{len(courseware_list)}] 正在处理课件: {file_name}")
-            
-            if not file_id:
-                print("  ⚠️ 缺少课件ID，跳过")
-                continue
-            
-            # 获取课件详情，必须传递season_id
-            file_info = self.get_courseware_url(file_id, season_id)
-            
-            if not file_info:
-                # API失败，保存课件信息供手动下载
-                self._save_manual_download_info(courseware_dir, file_name, file_id, season_id)
-                print("  ℹ️ 已保存课件信息，请稍后在浏览器中手动下载")
-                continue
-            
-            # 判断课件类型
-            file_type = file_info.get('type', 0)
-            
-            if file_type == 1:  # 直接下载链接
-                download_url = file_info.get('url')
-                if download_url:
-                    success = self._download_direct_file(
-                        download_url, 
-                        courseware_dir, 
-                        file_name
-                    )
-                    if success:
-                        success_count += 1
-                else:
-                    print("  ⚠️ 未找到下载链接")
-                    
-            elif file_type == 2:  # 网盘链接
-                netdisk_info = file_info.get('netdisk', {})
-                self._save_netdisk_link(
-                    netdisk_info, 
+            job = self.executor.submit(self._process_courseware, courseware, idx, len(courseware_list),
+                                       courseware_dir, season_id, manifest)
+            job.add_done_callback(finished)
+        return done
+    
+    def _process_courseware(self, courseware: Dict, idx: int, total: int, courseware_dir: str,
+                            season_id: int = None, manifest: Optional[Manifest] = None) -> bool:
+        """
+        解析并下载单个课件，在线程池中执行
+        :param courseware: 课件信息
+        :param idx: 课件序号
+        :param total: 课件总数
+        :param courseware_dir: 课件目录
+        :param season_id: 课程ID
+        :param manifest: 课程的校验清单
+        :return: 是否成功（直接下载成功、已保存网盘链接或其他课件信息）
+        """
+        file_id = courseware.get('file_id')
+        file_name = courseware.get('file_name', f'课件{idx}')
+        
+        print(f"\n[{idx}/{total}] 正在处理课件: {file_name}")
+        
+        if not file_id:
+            print("  ⚠️ 缺少课件ID，跳过")
+            return False
+        
+        use_ledger = self.ledger is not None and season_id is not None
+        if use_ledger and self.ledger.is_courseware_done(season_id, file_id):
+            print("  ✓ 已下载，跳过")
+            return True
+        
+        # 获取课件详情，必须传递season_id
+        file_info = self.get_courseware_url(file_id, season_id)
+        
+        if not file_info:
+            # API失败，保存课件信息供手动下载
+            self._save_manual_download_info(courseware_dir, file_name, file_id, season_id)
+            print("  ℹ️ 已保存课件信息，请稍后在浏览器中手动下载")
+            if use_ledger:
+                self.ledger.mark_courseware(season_id, file_id, DownloadLedger.FAILED,
+                                            error="获取课件下载地址失败")
+            return False
+        
+        # 判断课件类型
+        file_type = file_info.get('type', 0)
+        
+        if file_type == 1:  # 直接下载链接
+            download_url = file_info.get('url')
+            if download_url:
+                success = self._download_direct_file(
+                    download_url, 
                     courseware_dir, 
-                    file_name
+                    file_name,
+                    manifest
                 )
-                success_count += 1
-                
+                if use_ledger:
+                    filepath = self._courseware_filepath(download_url, courseware_dir, file_name)
+                    if success:
+                        self.ledger.mark_courseware(season_id, file_id, DownloadLedger.DONE, filepath)
+                    else:
+                        self.ledger.mark_courseware(season_id, file_id, DownloadLedger.FAILED,
+                                                    error="课件下载失败")
+                return success
             else:
-                # 尝试提取任何可能的URL
-                self._extract_and_save_info(file_info, courseware_dir, file_name)
-                success_count += 1
+                print("  ⚠️ 未找到下载链接")
+                if use_ledger:
+                    self.ledger.mark_courseware(season_id, file_id, DownloadLedger.FAILED,
+                                                error="未找到下载链接")
+                return False
+                
+        elif file_type == 2:  # 网盘链接
+            netdisk_info = file_info.get('netdisk', {})
+            self._save_netdisk_link(
+                netdisk_info, 
+                courseware_dir, 
+                file_name
+            )
+            if use_ledger:
+                txt_file = os.path.join(courseware_dir, f"{self.sanitize_filename(file_name)}_网盘链接.txt")
+                self.ledger.mark_courseware(season_id, file_id, DownloadLedger.DONE, txt_file)
+            return True
+            
+        else:
+            # 尝试提取任何可能的URL
+            self._extract_and_save_info(file_info, courseware_dir, file_name)
+            if use_ledger:
+                self.ledger.mark_courseware(season_id, file_id, DownloadLedger.DONE)
+            return True
+    
+    def shutdown(self) -> None:
+        """等待进行中的课件完成并关闭线程池"""
+        self.executor.shutdown(wait=True)
+    
+    def _courseware_filepath(self, url: str, save_dir: str, filename: str) -> str:
+        """
+        确定直接下载课件的保存路径，文件名缺少扩展名时从URL推断
+        :param url: 文件URL
+        :param save_dir: 保存目录
+        :param filename: 文件名
+        :return: 保存路径
+        """
+        # 确定文件扩展名
+        if not any(filename.lower().endswith(ext) for ext in ['.pdf', '.doc', '.docx', '.zip', '.rar', '.ppt', '.pptx']):
+            # 尝试从URL获取扩展名
+            if '.pdf' in url.lower():
+                filename += '.pdf'
+            elif '.zip' in url.lower():
+                filename += '.zip'
+            elif '.doc' in url.lower():
+                filename += '.doc'
         
-        return success_count
+        return os.path.join(save_dir, self.sanitize_filename(filename))
     
-    def _download_direct_file(self, url: str, save_dir: str, filename: str) -> bool:
+    def _download_direct_file(self, url: str, save_dir: str, filename: str,
+                              manifest: Optional[Manifest] = None) -> bool:
         """
         下载直接链接的文件
         :param url: 文件URL
         :param save_dir: 保存目录
         :param filename: 文件名
+        :param manifest: 校验清单
         :return: 是否成功
         """
         try:
-            # 确定文件扩展名
-            if not any(filename.lower().endswith(ext) for ext in ['.pdf', '.doc', '.docx', '.zip', '.rar', '.ppt', '.pptx']):
-                # 尝试从URL获取扩展名
-                if '.pdf' in url.lower():
-                    filename += '.pdf'
-                elif '.zip' in url.lower():
-                    filename += '.zip'
-                elif '.doc' in url.lower():
-                    filename += '.doc'
-            
-            safe_filename = self.sanitize_filename(filename)
-            filepath = os.path.join(save_dir, safe_filename)
+            filepath = self._courseware_filepath(url, save_dir, filename)
+            safe_filename = os.path.basename(filepath)
             
-            # 检查是否已存在
+            # 检查是否已存在，与校验清单大小不一致的文件重新下载
             if os.path.exists(filepath):
-                print(f"  ✓ 文件已存在: {safe_filename}")
-                return True
+                if manifest is None or manifest.matches(filepath):
+                    print(f"  ✓ 文件已存在: {safe_filename}")
+                    return True
+                print(f"  ⚠️ 文件与校验清单不一致，重新下载: {safe_filename}")
+                os.remove(filepath)
             
             print(f"  📥 下载中: {safe_filename}")
             
@@ -235,29 +362,19 @@ class CoursewareDownloader:
                 'Referer': 'https://www.bilibili.com'
             }
             
-            response = self.session.get(url, headers=headers, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            
-            with open(filepath, 'wb') as f:
-                downloaded = 0
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        if total_size > 0:
-                            percent = (downloaded / total_size) * 100
-                            print(f"\r  进度: {percent:.1f}% ({downloaded}/{total_size})", end='')
+            # 数据先写入.part文件，中断后下次运行从断点继续
+            result = {}
+            if not self.segment_downloader.download(url, filepath, headers, result=result):
+                print(f"\n  ✗ 下载失败: {safe_filename}")
+                return False
+            if manifest is not None:
+                manifest.record(filepath, result['content_hash'])
             
-            print(f"\n  ✓ 下载成功: {safe_filename}")
+            print(f"  ✓ 下载成功: {safe_filename}")
             return True
             
         except Exception as e:
             print(f"\n  ✗ 下载失败: {e}")
-            if os.path.exists(filepath):
-                os.remove(filepath)
             return False
     
     def _save_netdisk_link(self, netdisk_info: Dict, save_dir: str, filename: str):
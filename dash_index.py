@@ -0,0 +1,75 @@
+"""
+DASH分段索引模块：解析播放地址中的SegmentBase和m4s文件中的sidx盒子，得到各分片的字节区间
+"""
+import re
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from mp4_remuxer import Mp4FormatError, iter_child_boxes
+
+
+def parse_byte_range(text: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    解析SegmentBase中的字节区间
+    :param text: 如 "0-907"
+    :return: (start, end)闭区间，格式不正确时返回None
+    """
+    match = re.fullmatch(r'\s*(\d+)-(\d+)\s*', text or '')
+    if not match:
+        return None
+    start, end = int(match.group(1)), int(match.group(2))
+    return (start, end) if start <= end else None
+
+
+def index_range(stream: Dict) -> Optional[Tuple[int, int]]:
+    """
+    读取DASH流中索引(sidx)的位置，兼容SegmentBase和segment_base两种写法
+    :param stream: DASH中的video或audio条目
+    :return: 索引的(start, end)闭区间，没有或格式不正确时返回None
+    """
+    base = stream.get('SegmentBase') or stream.get('segment_base') or {}
+    initialization = parse_byte_range(base.get('Initialization') or base.get('initialization'))
+    index = parse_byte_range(base.get('indexRange') or base.get('index_range'))
+    if initialization is None or index is None or index[0] <= initialization[1]:
+        return None
+    return index
+
+
+def parse_sidx(data: bytes, index_start: int) -> List[Tuple[int, int]]:
+    """
+    解析sidx盒子，计算各分片在文件中的字节区间
+    :param data: 从index_start开始的索引数据，包含完整的sidx盒子
+    :param index_start: 索引在文件中的偏移
+    :return: [(start, end)]，end为闭区间，按文件顺序排列
+    """
+    for box_type, position, header_size, size in iter_child_boxes(data):
+        if box_type != 'sidx':
+            continue
+        offset = position + header_size
+        version = data[offset]
+        offset += 4 + 4 + 4  # version/flags, reference_ID, timescale
+        if version == 0:
+            _, first_offset = struct.unpack_from('>II', data, offset)
+            offset += 8
+        else:
+            _, first_offset = struct.unpack_from('>QQ', data, offset)
+            offset += 16
+        reference_count = struct.unpack_from('>H', data, offset + 2)[0]
+        offset += 4
+        if offset + reference_count * 12 > position + size:
+            raise Mp4FormatError("sidx中的分片数量与盒子长度不一致")
+
+        # 分片偏移从sidx盒子之后的第一个字节起算
+        start = index_start + position + size + first_offset
+        fragments = []
+        for _ in range(reference_count):
+            reference, _, _ = struct.unpack_from('>III', data, offset)
+            offset += 12
+            if reference >> 31:
+                # 引用的是下一级sidx，这种多级索引B站不使用，不支持
+                raise Mp4FormatError("不支持多级sidx")
+            referenced_size = reference & 0x7fffffff
+            fragments.append((start, start + referenced_size - 1))
+            start += referenced_size
+        return fragments
+    raise Mp4FormatError("索引中没有sidx盒子")
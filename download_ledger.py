@@ -0,0 +1,239 @@
+"""
+下载账本模块（SQLite），记录每个剧集和课件的下载状态，用于增量同步
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class DownloadLedger:
+    """下载账本：按 season_id/ep_id/cid 和 season_id/file_id 记录下载状态、大小、画质和时间"""
+
+    # 状态
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, db_path: str):
+        """
+        初始化账本，数据库不存在时自动创建
+        :param db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # 多个下载线程共用一个连接，由锁保证串行访问
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        """创建数据表"""
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS episodes (
+                    season_id INTEGER NOT NULL,
+                    ep_id INTEGER NOT NULL,
+                    cid INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    file_path TEXT,
+                    file_size INTEGER DEFAULT 0,
+                    quality INTEGER,
+                    video_bytes INTEGER DEFAULT 0,
+                    audio_bytes INTEGER DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (season_id, ep_id, cid)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS courseware (
+                    season_id INTEGER NOT NULL,
+                    file_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    file_path TEXT,
+                    file_size INTEGER DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (season_id, file_id)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bytes INTEGER NOT NULL,
+                    seconds REAL NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def get_episode(self, season_id: int, ep_id: int, cid: int) -> Optional[Dict]:
+        """
+        获取剧集记录
+        :param season_id: 课程ID
+        :param ep_id: 剧集ID
+        :param cid: 视频CID
+        :return: 记录，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM episodes WHERE season_id = ? AND ep_id = ? AND cid = ?",
+                (season_id, ep_id, cid)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def is_episode_done(self, season_id: int, ep_id: int, cid: int) -> bool:
+        """
+        剧集是否已完整下载：记录为完成，且文件仍在、大小与记录一致
+        :param season_id: 课程ID
+        :param ep_id: 剧集ID
+        :param cid: 视频CID
+        :return: 是否已完成
+        """
+        return self.is_record_done(self.get_episode(season_id, ep_id, cid))
+
+    def mark_episode(self, season_id: int, ep_id: int, cid: int, status: str,
+                     file_path: Optional[str] = None, quality: Optional[int] = None,
+                     video_bytes: int = 0, audio_bytes: int = 0, error: Optional[str] = None) -> None:
+        """
+        记录剧集下载结果
+        :param season_id: 课程ID
+        :param ep_id: 剧集ID
+        :param cid: 视频CID
+        :param status: 状态（DONE/FAILED）
+        :param file_path: 输出文件路径
+        :param quality: 画质ID
+        :param video_bytes: 视频流字节数
+        :param audio_bytes: 音频流字节数
+        :param error: 失败原因
+        """
+        file_path, file_size = self._file_info(file_path)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO episodes (season_id, ep_id, cid, status, file_path, file_size, quality,
+                                      video_bytes, audio_bytes, error, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (season_id, ep_id, cid) DO UPDATE SET
+                    status = excluded.status,
+                    file_path = COALESCE(excluded.file_path, file_path),
+                    file_size = excluded.file_size,
+                    quality = COALESCE(excluded.quality, quality),
+                    video_bytes = excluded.video_bytes,
+                    audio_bytes = excluded.audio_bytes,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+            """, (season_id, ep_id, cid, status, file_path, file_size, quality,
+                  video_bytes, audio_bytes, error, now, now))
+
+    def get_courseware(self, season_id: int, file_id: int) -> Optional[Dict]:
+        """
+        获取课件记录
+        :param season_id: 课程ID
+        :param file_id: 课件ID
+        :return: 记录，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM courseware WHERE season_id = ? AND file_id = ?",
+                (season_id, file_id)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def is_courseware_done(self, season_id: int, file_id: int) -> bool:
+        """
+        课件是否已处理完成
+        :param season_id: 课程ID
+        :param file_id: 课件ID
+        :return: 是否已完成
+        """
+        return self.is_record_done(self.get_courseware(season_id, file_id))
+
+    def mark_courseware(self, season_id: int, file_id: int, status: str,
+                        file_path: Optional[str] = None, error: Optional[str] = None) -> None:
+        """
+        记录课件下载结果
+        :param season_id: 课程ID
+        :param file_id: 课件ID
+        :param status: 状态（DONE/FAILED）
+        :param file_path: 保存的文件路径（网盘链接等无实体文件时为None）
+        :param error: 失败原因
+        """
+        file_path, file_size = self._file_info(file_path)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO courseware (season_id, file_id, status, file_path, file_size, error,
+                                        created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (season_id, file_id) DO UPDATE SET
+                    status = excluded.status,
+                    file_path = excluded.file_path,
+                    file_size = excluded.file_size,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+            """, (season_id, file_id, status, file_path, file_size, error, now, now))
+
+    def record_run(self, downloaded_bytes: int, seconds: float) -> None:
+        """
+        记录一次下载的总字节数和耗时，用于估算之后的下载时间
+        :param downloaded_bytes: 下载的字节数
+        :param seconds: 下载耗时（秒）
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO runs (bytes, seconds, created_at) VALUES (?, ?, ?)",
+                               (downloaded_bytes, seconds, time.time()))
+
+    def recent_throughput(self, limit: int = 5) -> Optional[float]:
+        """
+        最近几次下载的平均吞吐
+        :param limit: 统计的下载次数
+        :return: 字节/秒，没有记录时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT SUM(bytes), SUM(seconds) FROM "
+                "(SELECT bytes, seconds FROM runs ORDER BY id DESC LIMIT ?)",
+                (limit,)
+            ).fetchone()
+        total_bytes, total_seconds = row[0], row[1]
+        if not total_bytes or not total_seconds:
+            return None
+        return total_bytes / total_seconds
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _file_info(file_path: Optional[str]):
+        """
+        获取文件的绝对路径和大小
+        :param file_path: 文件路径
+        :return: (绝对路径, 大小)，文件不存在时大小为0
+        """
+        if not file_path:
+            return None, 0
+        file_path = os.path.abspath(file_path)
+        file_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        return file_path, file_size
+
+    @staticmethod
+    def is_record_done(record: Optional[Dict]) -> bool:
+        """
+        检查记录是否为完成状态，有文件的记录还要求文件大小与记录一致，避免把被截断的文件当作已完成
+        :param record: 账本记录
+        :return: 是否已完成
+        """
+        if not record or record['status'] != DownloadLedger.DONE:
+            return False
+        if not record['file_path']:
+            return True
+        return (os.path.exists(record['file_path'])
+                and os.path.getsize(record['file_path']) == record['file_size'])
@@ -0,0 +1,156 @@
+"""
+下载计划模块：开始下载前按播放地址估算各课程待下载的字节数，检查磁盘空间并按最近的下载吞吐估算耗时
+"""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from integrity import Manifest
+from job_scheduler import DEFAULT_BYTE_RATE
+
+
+class DownloadPlanner:
+    """
+    下载计划：跳过账本中已完成和输出文件已存在的剧集，其余剧集请求播放地址（经预取器请求，
+    随后的下载直接使用缓存），按所选画质的流大小累计字节数。
+    抽样模式下每个课程只请求一个剧集的播放地址，其余剧集按时长乘以抽样得到的码率估算
+    """
+
+    def __init__(self, downloader, workers: int = 4, sample: bool = False):
+        """
+        初始化下载计划
+        :param downloader: 下载器（BilibiliDownloader），使用其账本、预取器和流选择策略
+        :param workers: 同时请求播放地址的线程数
+        :param sample: 是否抽样估算（下载前的检查使用，避免在开始下载前请求所有剧集的播放地址）
+        """
+        self.downloader = downloader
+        self.workers = max(1, int(workers))
+        self.sample = sample
+
+    def plan_course(self, course_info: Dict, detail: Optional[Dict], base_path: str) -> Dict:
+        """
+        估算一个课程待下载的字节数
+        :param course_info: 课程信息
+        :param detail: 课程详情，获取失败时为None
+        :param base_path: 下载目录
+        :return: {'title', 'season_id', 'episodes': 剧集数, 'done': 已完成数, 'sizes': 待下载剧集的字节数列表,
+                 'unknown': 无法估计大小的剧集数, 'bytes': 待下载字节数（无法估计的剧集按课程平均值计）,
+                 'failed': 获取详情失败}
+        """
+        season_id = course_info.get('season_id')
+        title = course_info.get('title', f'课程_{season_id}')
+        plan = {'title': title, 'season_id': season_id, 'episodes': 0, 'done': 0, 'sizes': [],
+                'unknown': 0, 'bytes': 0, 'failed': not detail}
+        if not detail:
+            return plan
+
+        episodes = detail.get('episodes', [])
+        plan['episodes'] = len(episodes)
+        course_path = os.path.join(base_path, self.downloader.sanitize_filename(title))
+        manifest = Manifest(course_path)
+        pending = [(idx, episode) for idx, episode in enumerate(episodes, 1)
+                   if not self._is_done(season_id, idx, episode, course_path, manifest)]
+        plan['done'] = len(episodes) - len(pending)
+
+        if self.sample:
+            sizes = self._sampled_sizes([episode for _, episode in pending], season_id)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                sizes = list(executor.map(lambda item: self._episode_size(item[1], season_id), pending))
+        known = [size for size in sizes if size]
+        plan['sizes'] = known
+        plan['unknown'] = len(sizes) - len(known)
+        plan['bytes'] = sum(known)
+        if known and plan['unknown']:
+            plan['bytes'] += plan['unknown'] * plan['bytes'] // len(known)
+        return plan
+
+    def build(self, selected_courses: List[Dict], details: Dict, base_path: str) -> List[Dict]:
+        """
+        估算所有选中课程待下载的字节数
+        :param selected_courses: 选中的课程
+        :param details: {课程ID: 课程详情}
+        :param base_path: 下载目录
+        :return: 各课程的估算结果，见plan_course
+        """
+        return [self.plan_course(course_info, details.get(course_info.get('season_id')), base_path)
+                for course_info in selected_courses]
+
+    @staticmethod
+    def required_space(plans: List[Dict], temp_slots: int) -> Dict:
+        """
+        计算所需的磁盘空间：下载后合并时，视频、音频临时文件在合并完成前与输出文件同时存在，
+        同时占用的临时文件最多为temp_slots个剧集（取最大的几集）
+        :param plans: 各课程的估算结果
+        :param temp_slots: 同时存在临时文件的剧集数，边下载边合并时为0
+        :return: {'bytes': 输出文件总字节数, 'overhead': 临时文件峰值字节数, 'total': 合计}
+        """
+        total = sum(plan['bytes'] for plan in plans)
+        sizes = sorted((size for plan in plans for size in plan['sizes']), reverse=True)
+        overhead = sum(sizes[:max(0, temp_slots)])
+        return {'bytes': total, 'overhead': overhead, 'total': total + overhead}
+
+    @staticmethod
+    def free_space(path: str) -> int:
+        """
+        获取下载目录所在磁盘的可用空间，目录不存在时检查最近的已存在的上级目录
+        :param path: 下载目录
+        :return: 可用字节数
+        """
+        path = os.path.abspath(path)
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def _is_done(self, season_id: int, idx: int, episode: Dict, course_path: str, manifest: Manifest) -> bool:
+        """
+        剧集是否不需要下载：账本中已完成，或输出文件已存在且与校验清单一致
+        :param season_id: 课程ID
+        :param idx: 剧集序号
+        :param episode: 剧集信息
+        :param course_path: 课程目录
+        :param manifest: 课程的校验清单
+        :return: 是否已完成
+        """
+        ledger = self.downloader.ledger
+        if ledger is not None and ledger.is_episode_done(season_id, episode.get('id'), episode.get('cid')):
+            return True
+        filename = f"{idx:02d}. {episode.get('title', f'第{idx}集')}"
+        output_file = os.path.join(course_path, f"{self.downloader.sanitize_filename(filename)}.mp4")
+        return os.path.exists(output_file) and manifest.matches(output_file)
+
+    def _sampled_sizes(self, episodes: List[Dict], season_id: int) -> List[Optional[int]]:
+        """
+        抽样估算剧集大小：请求第一个有时长的剧集的播放地址得到课程码率，其余剧集按时长乘以码率估算
+        :param episodes: 待下载的剧集
+        :param season_id: 课程ID
+        :return: 各剧集的字节数，没有时长的剧集为None
+        """
+        sample = next((episode for episode in episodes if episode.get('duration')), None)
+        if sample is None:
+            return [None] * len(episodes)
+        size = self._episode_size(sample, season_id)
+        # 抽样失败时按默认码率估算
+        rate = size / sample['duration'] if size else DEFAULT_BYTE_RATE
+        return [int(episode['duration'] * rate) if episode.get('duration') else None for episode in episodes]
+
+    def _episode_size(self, episode: Dict, season_id: int) -> Optional[int]:
+        """
+        请求剧集的播放地址并估算大小
+        :param episode: 剧集信息
+        :param season_id: 课程ID
+        :return: 字节数，获取播放地址失败或无法估计时返回None
+        """
+        ep_id, cid = episode.get('id'), episode.get('cid')
+        try:
+            if self.downloader.prefetcher is not None:
+                playurl_data = self.downloader.prefetcher.get(ep_id, cid)
+            else:
+                playurl_data = self.downloader._get_course().get_episode_playurl(ep_id, cid)
+        except Exception as e:
+            print(f"获取播放地址失败 (ep_id={ep_id}): {e}")
+            return None
+        if not playurl_data:
+            return None
+        return self.downloader.estimate_size(playurl_data, season_id)
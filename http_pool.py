@@ -0,0 +1,77 @@
+"""
+HTTP连接池模块
+"""
+import socket
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from throttle import API_HOSTS, Throttle
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """按下载并发数调整连接池大小并统计连接复用情况的HTTP适配器"""
+
+    def __init__(self, pool_size: int = 10, max_hosts: int = 32, throttle: Optional[Throttle] = None):
+        """
+        初始化适配器
+        :param pool_size: 每个主机保持的最大连接数，应不小于同时进行的请求数
+        :param max_hosts: 缓存连接池的主机数量（API、各CDN节点）
+        :param throttle: 限速器，发往API主机的请求受其请求频率限制
+        """
+        self.throttle = throttle
+        self._pools = []
+        self._pools_lock = threading.Lock()
+        super().__init__(pool_connections=max_hosts, pool_maxsize=max(1, pool_size))
+
+    def init_poolmanager(self, *args, **kwargs):
+        """开启TCP keep-alive，避免空闲连接在复用前被中间设备断开"""
+        socket_options = list(HTTPConnection.default_socket_options)
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        kwargs['socket_options'] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        """发送请求，API请求先经过频率限制"""
+        if self.throttle is not None and urlsplit(request.url).hostname in API_HOSTS:
+            self.throttle.acquire_api()
+        return super().send(request, *args, **kwargs)
+
+    def get_connection_with_tls_context(self, *args, **kwargs):
+        """获取连接池（requests>=2.32）"""
+        pool = super().get_connection_with_tls_context(*args, **kwargs)
+        self._track_pool(pool)
+        return pool
+
+    def get_connection(self, *args, **kwargs):
+        """获取连接池（requests<2.32）"""
+        pool = super().get_connection(*args, **kwargs)
+        self._track_pool(pool)
+        return pool
+
+    def _track_pool(self, pool) -> None:
+        """
+        记录用过的连接池，连接池被淘汰后统计数据依然保留
+        :param pool: urllib3连接池
+        """
+        with self._pools_lock:
+            if not any(known is pool for known in self._pools):
+                self._pools.append(pool)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取连接统计
+        :return: {'requests': 请求数, 'new_connections': 新建连接数, 'reused': 复用连接的请求数}
+        """
+        with self._pools_lock:
+            pools = list(self._pools)
+        requests_count = sum(pool.num_requests for pool in pools)
+        new_connections = sum(pool.num_connections for pool in pools)
+        return {
+            'requests': requests_count,
+            'new_connections': new_connections,
+            'reused': max(0, requests_count - new_connections),
+        }
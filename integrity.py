@@ -0,0 +1,316 @@
+"""
+完整性校验模块：下载过程中计算内容哈希，按课程记录到清单文件（manifest.json），并可重新校验整个下载目录
+"""
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
+
+# 内容哈希的分块大小
+BLOCK_SIZE = 4 * 1024 * 1024
+# 清单中记录的哈希算法
+HASH_ALGORITHM = 'sha256-4MiB-blocks'
+MANIFEST_NAME = 'manifest.json'
+
+
+class _Block:
+    """一个分块的哈希状态"""
+
+    __slots__ = ('hasher', 'length', 'lock')
+
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.length = 0
+        self.lock = threading.Lock()
+
+
+class ContentHasher:
+    """
+    内容哈希：文件按4MiB分块分别计算SHA-256，再对各块摘要依次拼接后计算SHA-256（与Dropbox的content_hash相同）。
+    各块互不依赖，多连接按偏移乱序写入时也能在下载过程中计算，无需下载完成后再读一遍文件
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        """
+        初始化
+        :param size: 文件大小，未知时为None（只能顺序写入）
+        """
+        self.size = size
+        self._position = 0
+        self._end = 0
+        self._blocks: Dict[int, _Block] = {}
+        # 数据没有从块的开头按顺序到达的块（如续传前已下载的部分），完成时从文件读取计算
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def update(self, data: Union[memoryview, bytes]) -> None:
+        """
+        顺序写入数据
+        :param data: 数据
+        """
+        self.update_at(self._position, data)
+        self._position += len(data)
+
+    def update_at(self, offset: int, data: Union[memoryview, bytes]) -> None:
+        """
+        记录写入到指定偏移的数据，可在多个线程中调用
+        :param offset: 文件偏移
+        :param data: 数据
+        """
+        data = memoryview(data)
+        while data:
+            index, block_offset = divmod(offset, BLOCK_SIZE)
+            piece = data[:BLOCK_SIZE - block_offset]
+            with self._lock:
+                self._end = max(self._end, offset + len(piece))
+                block = self._blocks.get(index)
+                if block is None and block_offset == 0 and index not in self._dirty:
+                    block = self._blocks[index] = _Block()
+            if block is not None:
+                with block.lock:
+                    in_order = block.length == block_offset
+                    if in_order:
+                        block.hasher.update(piece)
+                        block.length += len(piece)
+            if block is None or not in_order:
+                with self._lock:
+                    self._dirty.add(index)
+                    self._blocks.pop(index, None)
+            offset += len(piece)
+            data = data[len(piece):]
+
+    def hexdigest(self, path: Optional[str] = None) -> str:
+        """
+        计算内容哈希
+        :param path: 文件路径，未能在写入时计算的块从文件中读取
+        :return: 十六进制哈希
+        """
+        size = self.size if self.size is not None else self._end
+        missing = []
+        digests = []
+        for index in range(block_count(size)):
+            block = self._blocks.get(index)
+            if block is not None and block.length == min(BLOCK_SIZE, size - index * BLOCK_SIZE):
+                digests.append(block.hasher.digest())
+            else:
+                missing.append(index)
+                digests.append(b'')
+        if missing:
+            if path is None:
+                raise ValueError("部分数据未按顺序写入，需要从文件计算哈希")
+            with open(path, 'rb') as f, _map_file(f, size) as view:
+                for index in missing:
+                    digests[index] = _block_digest(view, index)
+        return hashlib.sha256(b''.join(digests)).hexdigest()
+
+
+class HashingWriter:
+    """顺序写入文件的同时计算内容哈希"""
+
+    def __init__(self, f: BinaryIO):
+        """
+        初始化
+        :param f: 以写模式打开的文件
+        """
+        self.f = f
+        self.hasher = ContentHasher()
+
+    def write(self, data: Union[memoryview, bytes]) -> int:
+        """
+        写入数据
+        :param data: 数据
+        :return: 写入的字节数
+        """
+        self.hasher.update(data)
+        return self.f.write(data)
+
+    def tell(self) -> int:
+        """
+        当前写入位置
+        :return: 文件偏移
+        """
+        return self.f.tell()
+
+    def hexdigest(self) -> str:
+        """
+        已写入数据的内容哈希
+        :return: 十六进制哈希
+        """
+        return self.hasher.hexdigest()
+
+
+def block_count(size: int) -> int:
+    """
+    文件的分块数
+    :param size: 文件大小
+    :return: 块数
+    """
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+
+
+@contextmanager
+def _map_file(f: BinaryIO, size: int) -> Iterator[memoryview]:
+    """
+    只读映射文件，退出时先释放memoryview再关闭映射；空文件不映射
+    :param f: 以读模式打开的文件
+    :param size: 文件大小
+    :return: 文件内容
+    """
+    if size == 0:
+        yield memoryview(b'')
+        return
+    with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            yield view
+        finally:
+            view.release()
+
+
+def _block_digest(view: memoryview, index: int) -> bytes:
+    """
+    计算一个分块的SHA-256，直接对映射的内存计算，不复制数据
+    :param view: 映射的文件内容
+    :param index: 块序号
+    :return: 摘要
+    """
+    return hashlib.sha256(view[index * BLOCK_SIZE:(index + 1) * BLOCK_SIZE]).digest()
+
+
+def hash_file(path: str) -> str:
+    """
+    用内存映射读取文件并计算内容哈希
+    :param path: 文件路径
+    :return: 十六进制哈希
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        with _map_file(f, size) as view:
+            digests = [_block_digest(view, index) for index in range(block_count(size))]
+    return hashlib.sha256(b''.join(digests)).hexdigest()
+
+
+class Manifest:
+    """课程的校验清单，与course_info.json放在同一目录，记录每个文件的大小和内容哈希"""
+
+    def __init__(self, course_path: str):
+        """
+        读取课程目录中的清单，不存在时创建空清单
+        :param course_path: 课程目录
+        """
+        self.course_path = course_path
+        self.path = os.path.join(course_path, MANIFEST_NAME)
+        self.files: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.files = json.load(f).get('files', {})
+            except (OSError, ValueError) as e:
+                print(f"校验清单损坏，重新记录: {e}")
+
+    def _key(self, filepath: str) -> str:
+        """
+        清单中的文件名：相对课程目录的路径，统一使用/分隔
+        :param filepath: 文件路径
+        :return: 相对路径
+        """
+        return os.path.relpath(filepath, self.course_path).replace(os.sep, '/')
+
+    def get(self, filepath: str) -> Optional[Dict]:
+        """
+        获取文件的记录
+        :param filepath: 文件路径
+        :return: {'size', 'content_hash', 'updated_at'}，未记录时返回None
+        """
+        with self._lock:
+            return self.files.get(self._key(filepath))
+
+    def matches(self, filepath: str) -> bool:
+        """
+        已存在的文件是否与清单一致（只比较大小，不读取文件）；清单中没有记录时视为一致
+        :param filepath: 文件路径
+        :return: 是否一致
+        """
+        record = self.get(filepath)
+        return record is None or os.path.getsize(filepath) == record['size']
+
+    def record(self, filepath: str, content_hash: Optional[str] = None) -> None:
+        """
+        记录文件并保存清单
+        :param filepath: 文件路径
+        :param content_hash: 下载时计算的内容哈希，未传入时读取文件计算
+        """
+        if content_hash is None:
+            content_hash = hash_file(filepath)
+        entry = {'size': os.path.getsize(filepath), 'content_hash': content_hash, 'updated_at': time.time()}
+        with self._lock:
+            self.files[self._key(filepath)] = entry
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        """写入临时文件后替换，避免中断时留下损坏的清单"""
+        data = {'algorithm': HASH_ALGORITHM, 'files': self.files}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def verify_file(filepath: str, record: Dict) -> Optional[str]:
+    """
+    校验单个文件
+    :param filepath: 文件路径
+    :param record: 清单中的记录
+    :return: 问题描述，校验通过时返回None
+    """
+    if not os.path.exists(filepath):
+        return "文件不存在"
+    size = os.path.getsize(filepath)
+    if size != record['size']:
+        return f"大小不一致 ({size}/{record['size']})"
+    try:
+        if hash_file(filepath) != record['content_hash']:
+            return "内容哈希不一致"
+    except OSError as e:
+        return f"读取失败: {e}"
+    return None
+
+
+def verify_library(root: str, workers: Optional[int] = None) -> List[str]:
+    """
+    按各课程的校验清单并行重新校验下载目录中的所有文件
+    :param root: 下载目录
+    :param workers: 并行校验的文件数，默认为CPU核数
+    :return: 校验失败的文件路径
+    """
+    jobs = []
+    for dirpath, _, filenames in os.walk(root):
+        if MANIFEST_NAME not in filenames:
+            continue
+        manifest = Manifest(dirpath)
+        for key, record in manifest.files.items():
+            jobs.append((os.path.join(dirpath, *key.split('/')), record))
+
+    if not jobs:
+        print(f"{root} 中没有校验清单")
+        return []
+
+    total_bytes = sum(record['size'] for _, record in jobs)
+    print(f"校验 {len(jobs)} 个文件, 共 {total_bytes / 1024 / 1024 / 1024:.2f} GB")
+    start = time.time()
+    failed = []
+    # hashlib计算大块数据时释放GIL，多个线程可以同时计算
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for (filepath, _), problem in zip(jobs, executor.map(lambda job: verify_file(*job), jobs)):
+            if problem is not None:
+                print(f"  ✗ {filepath}: {problem}")
+                failed.append(filepath)
+    elapsed = time.time() - start
+    print(f"校验完成: {len(jobs) - len(failed)}/{len(jobs)} 通过 ({elapsed:.1f} 秒)")
+    return failed
@@ -0,0 +1,198 @@
+"""
+全局任务调度模块：把所有选中课程的剧集放入同一个队列，按优先级、课程间公平和大任务优先分配给下载线程
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+# 还不知道课程码率时使用的估计值（字节/秒），约为1080P课程视频加音频的平均码率
+DEFAULT_BYTE_RATE = 2_000_000 // 8
+# 剧集没有时长时使用的估计值（秒）
+DEFAULT_DURATION = 600
+
+
+class Job:
+    """一个剧集下载任务"""
+
+    def __init__(self, course: '_Course', index: int, episode: Dict, size: Optional[int] = None):
+        """
+        初始化任务
+        :param course: 所属课程
+        :param index: 剧集序号（从1开始）
+        :param episode: 剧集信息
+        :param size: 已知的字节数（如已下载的剧集为0），未知时按时长和码率估算
+        """
+        self.course = course
+        self.index = index
+        self.episode = episode
+        self.size = size
+        self.duration = episode.get('duration') or 0
+        # 开始时的估计字节数，完成后用实际值替换
+        self.started_bytes = 0
+
+    @property
+    def context(self) -> Any:
+        """添加课程时传入的上下文（课程目录、校验清单等）"""
+        return self.course.context
+
+
+class _Course:
+    """一个课程的待下载任务和已下载字节数"""
+
+    def __init__(self, key: Any, order: int, urgent: bool, context: Any):
+        """
+        初始化课程
+        :param key: 课程标识
+        :param order: 添加顺序，公平分配相同时先添加的课程优先
+        :param urgent: 是否优先下载
+        :param context: 任务的上下文
+        """
+        self.key = key
+        self.order = order
+        self.urgent = urgent
+        self.context = context
+        self.pending: List[Job] = []
+        # 已开始的任务的估计字节数，用于课程间公平分配
+        self.started_bytes = 0
+        # 已完成的剧集的实际字节数和时长，用于估算码率
+        self.measured_bytes = 0
+        self.measured_seconds = 0.0
+        self.playurl_rate: Optional[float] = None
+
+    def byte_rate(self) -> float:
+        """
+        课程的码率（字节/秒）：优先用已完成的剧集实测，其次用播放地址中的码率
+        :return: 字节/秒
+        """
+        if self.measured_seconds > 0:
+            return self.measured_bytes / self.measured_seconds
+        return self.playurl_rate or DEFAULT_BYTE_RATE
+
+
+class JobScheduler:
+    """
+    全局剧集调度器，下载线程反复调用next_job获取任务：
+    1. 标记为优先的课程先下载；
+    2. 同一优先级的课程中，已开始下载的字节数最少的课程先分配，避免一个很大的课程挡住后面的课程；
+    3. 同一课程中估计字节数最大的剧集先下载，最后剩下的都是小任务，不会只剩一个长任务拖慢结束时间。
+    剧集大小按时长乘以课程码率估算，码率从已完成的剧集和播放地址中学习
+    """
+
+    def __init__(self):
+        self._courses: List[_Course] = []
+        self._lock = threading.Lock()
+
+    def add_course(self, key: Any, episodes: List[Dict], urgent: bool = False, context: Any = None,
+                   done: Iterable[int] = ()) -> None:
+        """
+        添加课程的所有剧集
+        :param key: 课程标识（课程ID）
+        :param episodes: 剧集列表，按序号排列
+        :param urgent: 是否优先下载
+        :param context: 任务的上下文，通过Job.context取回
+        :param done: 已下载完成的剧集序号，这些剧集不加入队列，也不会被预取播放地址
+        """
+        done = set(done)
+        with self._lock:
+            course = _Course(key, len(self._courses), urgent, context)
+            course.pending = [Job(course, index, episode)
+                              for index, episode in enumerate(episodes, 1) if index not in done]
+            self._courses.append(course)
+
+    def contexts(self) -> List[Any]:
+        """
+        各课程的上下文，按添加顺序排列
+        :return: 上下文列表
+        """
+        with self._lock:
+            return [course.context for course in self._courses]
+
+    def estimate(self, job: Job) -> int:
+        """
+        估计任务的字节数
+        :param job: 任务
+        :return: 字节数
+        """
+        if job.size is not None:
+            return job.size
+        return int((job.duration or DEFAULT_DURATION) * job.course.byte_rate())
+
+    def next_job(self) -> Optional[Job]:
+        """
+        取出下一个任务
+        :return: 任务，全部分配完时返回None
+        """
+        with self._lock:
+            job = self._pick()
+            if job is None:
+                return None
+            job.course.pending.remove(job)
+            job.started_bytes = self.estimate(job)
+            job.course.started_bytes += job.started_bytes
+            return job
+
+    def upcoming(self, count: int) -> List[Job]:
+        """
+        预测接下来会分配的任务（用于预取播放地址），不改变队列
+        :param count: 数量
+        :return: 任务列表
+        """
+        with self._lock:
+            started = {course.key: course.started_bytes for course in self._courses}
+            taken = set()
+            jobs = []
+            while len(jobs) < count:
+                job = self._pick(started, taken)
+                if job is None:
+                    break
+                taken.add(job)
+                started[job.course.key] += self.estimate(job)
+                jobs.append(job)
+            return jobs
+
+    def learn_size(self, job: Job, size: int) -> None:
+        """
+        记录从播放地址得到的剧集大小（所选流的size或bandwidth×时长），课程还没有完成的剧集时也用来估算课程码率
+        :param job: 尚未开始的任务
+        :param size: 字节数
+        """
+        if size <= 0:
+            return
+        with self._lock:
+            job.size = size
+            if job.duration:
+                job.course.playurl_rate = size / job.duration
+
+    def finish(self, job: Job, size: Optional[int] = None) -> None:
+        """
+        任务完成
+        :param job: 任务
+        :param size: 实际下载的字节数，用于学习课程码率；跳过或失败时为None
+        """
+        with self._lock:
+            course = job.course
+            if size and job.duration:
+                course.measured_bytes += size
+                course.measured_seconds += job.duration
+            # 已开始字节数改为实际值，后续的公平分配以实际下载量为准
+            if size is not None:
+                course.started_bytes += size - job.started_bytes
+                job.size = size
+
+    def _pick(self, started: Optional[Dict[Any, int]] = None, taken: Optional[set] = None) -> Optional[Job]:
+        """
+        按优先级、公平和大任务优先选择任务，调用方持有锁
+        :param started: 各课程已开始的字节数，默认为当前值
+        :param taken: 已选中的任务（预测时使用）
+        :return: 任务
+        """
+        taken = taken or set()
+        candidates = [(course, [job for job in course.pending if job not in taken]) for course in self._courses]
+        candidates = [(course, pending) for course, pending in candidates if pending]
+        if not candidates:
+            return None
+        if any(course.urgent for course, _ in candidates):
+            candidates = [(course, pending) for course, pending in candidates if course.urgent]
+        course, pending = min(
+            candidates,
+            key=lambda item: ((started or {}).get(item[0].key, item[0].started_bytes), item[0].order))
+        return max(pending, key=lambda job: (self.estimate(job), -job.index))
@@ -3,14 +3,56 @@ B站课程批量下载工具
 """
 import os
 import json
+import time
+import argparse
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Union
 from bilibili_auth import BilibiliAuth
 from bilibili_course import BilibiliCourse
 from bilibili_downloader import BilibiliDownloader
 from courseware_downloader import CoursewareDownloader
+from download_ledger import DownloadLedger
+from playurl_prefetcher import PlayurlPrefetcher
+from retry_policy import RetryPolicy
+from merge_queue import MergeQueue
+from progress import ProgressRenderer, format_eta, format_size
+from integrity import Manifest, verify_library
+from stream_selector import StreamPolicy
+from connection_controller import ConnectionController
+from job_scheduler import JobScheduler
+from download_planner import DownloadPlanner
+from api_cache import ApiCache
+
+# 下载的字节数达到此值才记录吞吐，太小的下载主要是请求开销，不能代表下载速度
+MIN_RUN_BYTES = 16 * 1024 * 1024
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    解析命令行参数
+    :return: 命令行参数
+    """
+    parser = argparse.ArgumentParser(description="B站课程批量下载工具")
+    parser.add_argument('command', nargs='?', choices=['download', 'plan', 'verify'], default='download',
+                        help="download: 下载课程（默认）；plan: 只估算下载大小、磁盘空间和耗时，不下载；"
+                             "verify: 按校验清单重新校验下载目录中的所有文件")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="同时下载的剧集数量（默认读取config.json中的jobs，未配置时为1）")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="不显示实时进度，每个文件下载完成时输出一行（输出不是终端时自动开启）")
+    parser.add_argument('--refresh', action='store_true',
+                        help="忽略API响应缓存，重新获取登录状态、课程列表和课程详情")
+    parser.add_argument('--force', action='store_true',
+                        help="磁盘空间估算不足时仍然开始下载")
+    parser.add_argument('--debug', action='store_true',
+                        help="输出API原始响应（也可在config.json中设置debug为true）")
+    return parser.parse_args()
 
 
 def main():
     """主函数"""
+    args = parse_args()
+    
     print("="*60)
     print("B站课程批量下载工具")
     print("="*60)
@@ -18,8 +60,39 @@ def main():
     # 初始化认证
     auth = BilibiliAuth()
     
+    if args.command == 'verify':
+        failed = verify_library(auth.config.get('download_path', './downloads'), auth.config.get('verify_workers'))
+        if failed:
+            print("校验失败的文件可删除后重新运行下载")
+        return
+    
+    jobs = args.jobs or auth.config.get('jobs', 1)
+    max_connections = auth.config.get('max_connections', 4)
+    courseware_workers = auth.config.get('courseware_workers', 2)
+    
+    # 自适应连接数：各CDN主机和全局的并发连接数从固定模式下的连接数起，按吞吐和错误自动调整
+    controller = None
+    if auth.config.get('adaptive_connections', True):
+        initial = jobs * 2 * max_connections
+        controller = ConnectionController(initial, auth.config.get('min_connections', 2),
+                                          max(initial, auth.config.get('max_total_connections', 32)))
+    
+    # 连接池大小与下载并发数匹配：每集视频、音频两条流，加上同时下载的课件，每条流max_connections个连接
+    pool_size = (jobs * 2 + courseware_workers) * max_connections
+    if controller is not None:
+        pool_size = max(pool_size, controller.maximum)
+    auth.set_pool_size(pool_size + 4)
+    
+    # 登录状态、已购课程列表和课程详情很少变化，有效期内从本地缓存读取；--refresh 时重新获取
+    api_cache = None
+    if auth.config.get('api_cache', True):
+        api_cache = ApiCache(auth.config.get('api_cache_path') or os.path.join(auth.download_path, 'api_cache.db'),
+                             auth.get_session().cookies.get('SESSDATA') or '',
+                             auth.config.get('api_cache_ttl'),
+                             int(auth.config.get('api_cache_max_mb', 50) * 1024 * 1024), args.refresh)
+    
     # 检查登录状态
-    if not auth.check_login():
+    if not auth.check_login(api_cache):
         print("\n请先配置config.json文件中的cookie信息")
         print("获取cookie的方法:")
         print("1. 在浏览器中登录B站")
@@ -30,8 +103,11 @@ def main():
         print("6. 将Cookie值粘贴到config.json的cookie字段中")
         return
     
-    # 初始化课程对象
-    course = BilibiliCourse(auth)
+    # 初始化课程对象，所有网络请求共用一个重试策略
+    retry_policy = RetryPolicy(auth.config.get('max_attempts', 4))
+    stream_policy = StreamPolicy.from_config(auth.config)
+    course = BilibiliCourse(auth, retry_policy, args.debug or auth.config.get('debug', False), api_cache,
+                            stream_policy.fnval())
     
     # 获取已购买的课程列表
     print("\n正在获取课程列表...")
@@ -49,6 +125,7 @@ def main():
     print("  输入课程序号下载单个课程 (如: 1)")
     print("  输入 'all' 下载所有课程")
     print("  输入 '1,3,5' 下载多个课程")
+    print("  序号后加 '!' 优先下载该课程 (如: 1,3!,5)")
     print("  输入 'q' 退出")
     
     choice = input("\n请输入: ").strip()
@@ -56,16 +133,21 @@ def main():
     if choice.lower() == 'q':
         return
     
-    # 解析用户选择
+    # 解析用户选择，序号后带!的课程优先下载
     selected_courses = []
+    urgent_ids = set()
     if choice.lower() == 'all':
         selected_courses = courses
     else:
         try:
-            indices = [int(x.strip()) for x in choice.split(',')]
-            for idx in indices:
+            for item in choice.split(','):
+                item = item.strip()
+                urgent = item.endswith('!')
+                idx = int(item.rstrip('!'))
                 if 1 <= idx <= len(courses):
                     selected_courses.append(courses[idx - 1])
+                    if urgent:
+                        urgent_ids.add(courses[idx - 1].get('season_id'))
                 else:
                     print(f"警告: 序号 {idx} 超出范围")
         except ValueError:
@@ -76,31 +158,212 @@ def main():
         print("未选择任何课程")
         return
     
-    # 初始化下载器
-    downloader = BilibiliDownloader(auth.get_session(), auth.download_path)
-    courseware_dl = CoursewareDownloader(auth.get_session(), auth.download_path)
+    # 同时获取所有选中课程的详情，下载开始前即可汇总剧集和课件总数
+    print(f"\n正在获取 {len(selected_courses)} 个课程的详情...")
+    details = course.get_course_details([course_info.get('season_id') for course_info in selected_courses])
+    print_work_plan(selected_courses, details, urgent_ids)
+    
+    # 初始化下载账本和下载器
+    ledger = DownloadLedger(auth.config.get('ledger_path') or
+                            os.path.join(auth.download_path, 'download_ledger.db'))
+    prefetcher = PlayurlPrefetcher(course, auth.config.get('playurl_prefetch', 2))
+    # 合并在独立的进程池中进行，merge_workers为0时在下载线程中合并；边下载边合并时不需要合并队列
+    merge_queue = None
+    stream_merge = auth.config.get('stream_merge', False)
+    if auth.config.get('merge_workers') != 0 and not stream_merge:
+        merge_queue = MergeQueue(auth.config.get('merge_workers'), auth.config.get('merge_queue_size'))
+    # 视频和课件共用一个进度绘制器，所有下载汇总为一行进度
+    progress = ProgressRenderer(quiet=True if args.quiet else None)
+    downloader = BilibiliDownloader(auth.get_session(), auth.download_path,
+                                    max_connections, course, ledger, prefetcher, auth.throttle,
+                                    retry_policy, stream_merge, auth.config.get('merge_engine', 'auto'),
+                                    merge_queue, progress, stream_policy, controller)
+    courseware_dl = CoursewareDownloader(auth.get_session(), auth.download_path, ledger, auth.throttle,
+                                         retry_policy, progress, courseware_workers, controller)
     
-    # 下载选中的课程
+    # plan命令请求所有待下载剧集的播放地址，估算字节数、所需磁盘空间和耗时后退出；
+    # 下载前默认做同样的检查（preflight为false时跳过），每个课程只抽样一集，空间不足时不开始下载
+    if args.command == 'plan' or auth.config.get('preflight', True):
+        # 下载后合并时，正在下载和在合并队列中的剧集的临时文件与输出文件同时存在
+        temp_slots = 0
+        if not stream_merge:
+            temp_slots = jobs + (merge_queue.max_pending if merge_queue is not None else 0)
+        fits = print_download_estimate(downloader, selected_courses, details, auth.download_path,
+                                       temp_slots, auth.throttle.current_speed_limit(), args.command != 'plan')
+        if args.command == 'plan' or not (fits or args.force):
+            if args.command != 'plan':
+                print("磁盘空间不足，未开始下载（使用 --force 忽略检查）")
+            prefetcher.shutdown()
+            courseware_dl.shutdown()
+            if merge_queue is not None:
+                merge_queue.shutdown()
+            ledger.close()
+            if api_cache is not None:
+                api_cache.close()
+            return
+    
+    # 准备选中的课程（创建目录、开始下载课件），所有课程的剧集交给同一个调度器
+    scheduler = JobScheduler()
+    plans = []
     for idx, course_info in enumerate(selected_courses, 1):
         print(f"\n\n{'#'*60}")
-        print(f"开始下载课程 {idx}/{len(selected_courses)}")
+        print(f"准备课程 {idx}/{len(selected_courses)}")
         print(f"{'#'*60}")
         
-        download_course(course, downloader, courseware_dl, course_info, auth.download_path)
+        plan = prepare_course(course, downloader, courseware_dl, course_info, auth.download_path,
+                              details.get(course_info.get('season_id')))
+        if plan is not None:
+            scheduler.add_course(plan['season_id'], plan['episodes'], plan['season_id'] in urgent_ids,
+                                 plan, plan['done'])
+            plans.append(plan)
+    
+    run_jobs(downloader, scheduler, jobs)
+    for plan in plans:
+        finish_course(plan)
+    
+    prefetcher.shutdown()
+    courseware_dl.shutdown()
+    if merge_queue is not None:
+        merge_queue.shutdown()
+    ledger.close()
+    if api_cache is not None:
+        api_cache.close()
     
     print("\n" + "="*60)
     print("所有课程下载完成!")
+    stats = auth.get_connection_stats()
+    print(f"HTTP请求 {stats['requests']} 次: 新建连接 {stats['new_connections']} 个, "
+          f"复用连接 {stats['reused']} 次")
+    if api_cache is not None:
+        cache_stats = api_cache.get_stats()
+        print(f"API缓存: 命中 {cache_stats['hits']} 次, 未命中 {cache_stats['misses']} 次, "
+              f"淘汰 {cache_stats['evicted']} 条")
+    for name, retry_stats in retry_policy.get_stats().items():
+        if retry_stats['retries'] or retry_stats['failures']:
+            print(f"{name}: 调用 {retry_stats['calls']} 次, 重试 {retry_stats['retries']} 次, "
+                  f"最终失败 {retry_stats['failures']} 次")
+    if controller is not None:
+        print_connection_stats(controller, args.debug or auth.config.get('debug', False))
     print("="*60)
 
 
-def download_course(course: BilibiliCourse, downloader: BilibiliDownloader, 
-                    courseware_dl: CoursewareDownloader, course_info: dict, base_path: str):
+def print_connection_stats(controller: ConnectionController, show_decisions: bool = False) -> None:
+    """
+    打印自适应连接数的调整结果
+    :param controller: 连接数控制器
+    :param show_decisions: 是否列出每次调整
+    """
+    stats = controller.get_stats()
+    for host, host_stats in stats['hosts'].items():
+        name = "全部主机" if host == ConnectionController.GLOBAL else host
+        print(f"{name}: 并发连接 {host_stats['initial']} → {host_stats['limit']} (最高 {host_stats['highest']}), "
+              f"增加 {host_stats['increases']} 次, 减少 {host_stats['decreases']} 次 "
+              f"(限流 {host_stats['throttled']} 次, 错误 {host_stats['errors']} 次), "
+              f"最近吞吐 {host_stats['goodput'] / 1024 / 1024:.1f}MB/s")
+    if show_decisions:
+        for decision in stats['decisions']:
+            moment = time.strftime('%H:%M:%S', time.localtime(decision['time']))
+            print(f"  {moment} {decision['host']}: {decision['from']} → {decision['to']} "
+                  f"({decision['reason']}, 吞吐 {decision['goodput'] / 1024 / 1024:.1f}MB/s)")
+
+
+def print_download_estimate(downloader: BilibiliDownloader, selected_courses: list, details: dict,
+                            base_path: str, temp_slots: int, speed_limit_mb: float = 0,
+                            sample: bool = False) -> bool:
+    """
+    估算并打印各课程待下载的字节数、所需磁盘空间和预计耗时
+    :param downloader: 下载器对象
+    :param selected_courses: 选中的课程
+    :param details: {课程ID: 课程详情}
+    :param base_path: 下载目录
+    :param temp_slots: 同时存在合并临时文件的剧集数
+    :param speed_limit_mb: 当前的带宽上限（MB/s），0表示不限
+    :param sample: 每个课程只抽样一集的播放地址，其余剧集按时长估算
+    :return: 磁盘空间是否足够
+    """
+    print("\n正在获取播放地址，估算下载大小...")
+    planner = DownloadPlanner(downloader, sample=sample)
+    plans = planner.build(selected_courses, details, base_path)
+    
+    print(f"\n{'='*60}")
+    print("下载估算:")
+    for idx, plan in enumerate(plans, 1):
+        if plan['failed']:
+            print(f"  {idx}. {plan['title']}: 获取详情失败，无法估算")
+            continue
+        pending = plan['episodes'] - plan['done']
+        line = f"  {idx}. {plan['title']}: 待下载 {pending} 集 {format_size(plan['bytes'])}, 已完成 {plan['done']} 集"
+        if plan['unknown']:
+            line += f", {plan['unknown']} 集无法获取大小（按平均值估算）"
+        print(line)
+    
+    space = planner.required_space(plans, temp_slots)
+    free = planner.free_space(base_path)
+    print(f"总计: {format_size(space['bytes'])}, 合并临时文件峰值 {format_size(space['overhead'])}, "
+          f"需要磁盘空间 {format_size(space['total'])}, 可用 {format_size(free)}")
+    
+    # 按最近几次下载的实测吞吐估算耗时，设置了带宽上限时不超过上限
+    throughput = downloader.ledger.recent_throughput() if downloader.ledger is not None else None
+    source = "最近下载的平均速度"
+    limit = speed_limit_mb * 1024 * 1024
+    if limit and (throughput is None or throughput > limit):
+        throughput, source = limit, "带宽上限"
+    if not space['bytes']:
+        print("没有需要下载的剧集")
+    elif throughput:
+        print(f"预计下载耗时: {format_eta(space['bytes'] / throughput)} "
+              f"(按{source} {format_size(throughput)}/s)")
+    else:
+        print("预计下载耗时: 未知（还没有下载记录）")
+    
+    fits = space['total'] <= free
+    if not fits:
+        print(f"磁盘空间不足: 还需要 {format_size(space['total'] - free)}")
+    print(f"{'='*60}")
+    return fits
+
+
+def print_work_plan(selected_courses: list, details: dict, urgent_ids: set = frozenset()) -> None:
+    """
+    打印下载计划：各课程的剧集数和课件数及总计
+    :param selected_courses: 选中的课程
+    :param details: {课程ID: 课程详情}
+    :param urgent_ids: 优先下载的课程ID
+    """
+    total_episodes = 0
+    total_courseware = 0
+    failed = 0
+    print(f"\n{'='*60}")
+    print("下载计划:")
+    for idx, course_info in enumerate(selected_courses, 1):
+        detail = details.get(course_info.get('season_id'))
+        title = course_info.get('title', f"课程_{course_info.get('season_id')}")
+        if not detail:
+            failed += 1
+            print(f"  {idx}. {title}: 获取详情失败，下载时重试")
+            continue
+        episodes = len(detail.get('episodes', []))
+        courseware = len(detail.get('courses', []))
+        total_episodes += episodes
+        total_courseware += courseware
+        mark = " (优先)" if course_info.get('season_id') in urgent_ids else ""
+        print(f"  {idx}. {title}{mark}: {episodes} 集, {courseware} 个课件")
+    print(f"总计: {len(selected_courses) - failed} 个课程, {total_episodes} 集, {total_courseware} 个课件")
+    print(f"{'='*60}")
+
+
+def prepare_course(course: BilibiliCourse, downloader: BilibiliDownloader,
+                   courseware_dl: CoursewareDownloader, course_info: dict, base_path: str,
+                   detail: dict = None) -> Optional[dict]:
     """
-    下载单个课程
+    准备课程：创建课程目录、保存课程信息，并开始在后台下载课件
     :param course: 课程对象
     :param downloader: 下载器对象
+    :param courseware_dl: 课件下载器
     :param course_info: 课程信息
     :param base_path: 基础路径
+    :param detail: 预先获取的课程详情，未传入或预先获取失败时在此获取
+    :return: 课程的下载计划（课程目录、校验清单、剧集、已完成的剧集序号、课件Future和各集结果），失败时返回None
     """
     season_id = course_info.get('season_id')
     course_title = course_info.get('title', f'课程_{season_id}')
@@ -109,10 +372,11 @@ def download_course(course: BilibiliCourse, downloader: BilibiliDownloader,
     print(f"课程ID: {season_id}")
     
     # 获取课程详情
-    detail = course.get_course_detail(season_id)
+    if not detail:
+        detail = course.get_course_detail(season_id)
     if not detail:
         print("获取课程详情失败，跳过")
-        return
+        return None
     
     # 创建课程目录
     safe_title = downloader.sanitize_filename(course_title)
@@ -124,34 +388,167 @@ def download_course(course: BilibiliCourse, downloader: BilibiliDownloader,
     with open(info_file, 'w', encoding='utf-8') as f:
         json.dump(detail, f, ensure_ascii=False, indent=2)
     
+    # 校验清单与course_info.json放在一起，记录下载的每个文件的大小和内容哈希
+    manifest = Manifest(course_path)
+    
     # 获取所有剧集
     episodes = detail.get('episodes', [])
     print(f"共 {len(episodes)} 个视频")
     
-    # 下载课件
+    # 课件在课件下载器的线程池中解析和下载，与剧集下载同时进行
     courseware_list = detail.get('courses', [])
     season_id = course_info.get('season_id') or course_info.get('id')
+    courseware_future = None
     if courseware_list:
         print(f"\n{'='*60}")
-        print(f"发现 {len(courseware_list)} 个课件，开始下载...")
+        print(f"发现 {len(courseware_list)} 个课件，与视频同时下载...")
         print(f"{'='*60}")
-        courseware_count = courseware_dl.download_courseware(course_path, courseware_list, season_id)
-        print(f"\n课件下载完成: {courseware_count}/{len(courseware_list)} 成功")
+        courseware_future = courseware_dl.submit_courseware(course_path, courseware_list, season_id, manifest)
     else:
         print("\n本课程暂无附赠课件")
     
-    # 下载每个剧集
-    success_count = 0
-    for idx, episode in enumerate(episodes, 1):
-        try:
-            if downloader.download_episode(episode, course_path, idx):
-                success_count += 1
-            else:
-                print(f"第 {idx} 集下载失败")
-        except Exception as e:
-            print(f"下载第 {idx} 集时出错: {e}")
-    
-    print(f"\n课程 '{course_title}' 下载完成: {success_count}/{len(episodes)} 成功")
+    # 账本中已完成的剧集不加入调度器，直接记为成功，不再请求播放地址
+    done = set()
+    if downloader.ledger is not None:
+        done = {idx for idx, episode in enumerate(episodes, 1)
+                if downloader.ledger.is_episode_done(season_id, episode.get('id'), episode.get('cid'))}
+    if done:
+        print(f"已下载 {len(done)} 集，跳过")
+    
+    return {
+        'title': course_title,
+        'season_id': season_id,
+        'course_path': course_path,
+        'manifest': manifest,
+        'episodes': episodes,
+        'done': done,
+        'courseware_list': courseware_list,
+        'courseware_future': courseware_future,
+        'results': {idx: True for idx in done},
+    }
+
+
+def run_jobs(downloader: BilibiliDownloader, scheduler: JobScheduler, jobs: int = 1) -> None:
+    """
+    用jobs个下载线程执行调度器中的所有剧集，结果写入各课程计划的results，并等待合并队列
+    :param downloader: 下载器对象
+    :param scheduler: 剧集调度器
+    :param jobs: 同时下载的剧集数量
+    """
+    prefetcher = downloader.prefetcher
+    merge_queue = downloader.merge_queue
+    merge_before = merge_queue.get_stats() if merge_queue is not None else None
+    download_start = time.time()
+    downloaded = []
+    
+    def worker() -> None:
+        while True:
+            if prefetcher is not None:
+                learn_sizes(downloader, scheduler, prefetcher.lookahead)
+            job = scheduler.next_job()
+            if job is None:
+                return
+            plan = job.context
+            # 按调度顺序预取接下来几集的播放地址
+            if prefetcher is not None:
+                queue = [job] + scheduler.upcoming(prefetcher.lookahead)
+                prefetcher.set_queue([(item.episode.get('id'), item.episode.get('cid')) for item in queue])
+            result = {}
+            plan['results'][job.index] = download_one_episode(downloader, job.episode, plan['course_path'],
+                                                              job.index, plan['season_id'], plan['manifest'],
+                                                              result)
+            size = result.get('video_bytes', 0) + result.get('audio_bytes', 0)
+            scheduler.finish(job, size or None)
+            downloaded.append(size)
+    
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(worker) for _ in range(max(1, jobs))]
+        for future in futures:
+            future.result()
+    download_seconds = time.time() - download_start
+    # 记录本次下载的吞吐，下次估算下载耗时使用
+    if downloader.ledger is not None and sum(downloaded) >= MIN_RUN_BYTES:
+        downloader.ledger.record_run(sum(downloaded), download_seconds)
+    
+    # 等待仍在合并队列中的剧集
+    for plan in scheduler.contexts():
+        for idx, result in list(plan['results'].items()):
+            if isinstance(result, Future):
+                plan['results'][idx] = result.result()
+    
+    # 下载和合并分开计时：合并耗时为各集合并时间之和，排队等待为下载线程因合并队列已满而等待的时间
+    if merge_before is not None:
+        merge_after = merge_queue.get_stats()
+        merged = merge_after['merged'] - merge_before['merged']
+        merge_seconds = merge_after['merge_seconds'] - merge_before['merge_seconds']
+        wait_seconds = merge_after['wait_seconds'] - merge_before['wait_seconds']
+        tail_seconds = time.time() - download_start - download_seconds
+        print(f"\n下载耗时 {download_seconds:.1f} 秒 (其中等待合并队列 {wait_seconds:.1f} 秒)")
+        print(f"合并 {merged} 集, 合并耗时 {merge_seconds:.1f} 秒, 下载结束后等待合并 {tail_seconds:.1f} 秒")
+
+
+def learn_sizes(downloader: BilibiliDownloader, scheduler: JobScheduler, count: int) -> None:
+    """
+    用已预取的播放地址更新即将下载的剧集的大小估计
+    :param downloader: 下载器对象
+    :param scheduler: 剧集调度器
+    :param count: 检查的剧集数量
+    """
+    for job in scheduler.upcoming(count):
+        if job.size is not None:
+            continue
+        playurl_data = downloader.prefetcher.cached(job.episode.get('id'), job.episode.get('cid'))
+        if playurl_data:
+            size = downloader.estimate_size(playurl_data, job.context['season_id'])
+            if size:
+                scheduler.learn_size(job, size)
+
+
+def finish_course(plan: dict) -> None:
+    """
+    等待课程的课件下载完成，输出课程的下载结果
+    :param plan: prepare_course返回的下载计划
+    """
+    if plan['courseware_future'] is not None:
+        courseware_count = plan['courseware_future'].result()
+        print(f"\n课件下载完成: {courseware_count}/{len(plan['courseware_list'])} 成功")
+    
+    results = plan['results']
+    episodes = plan['episodes']
+    success_count = sum(1 for success in results.values() if success)
+    print(f"\n课程 '{plan['title']}' 下载完成: {success_count}/{len(episodes)} 成功")
+    
+    # 剧集完成顺序不固定，按序号列出失败的剧集
+    failed = sorted(idx for idx, success in results.items() if not success)
+    for idx in failed:
+        title = episodes[idx - 1].get('title', f'第{idx}集')
+        print(f"  失败: {idx:02d}. {title}")
+
+
+def download_one_episode(downloader: BilibiliDownloader, episode: dict, course_path: str, idx: int,
+                         season_id: int = None, manifest: Manifest = None,
+                         result: dict = None) -> Union[bool, Future]:
+    """
+    下载单个剧集，捕获异常以免影响其他剧集
+    :param downloader: 下载器对象
+    :param episode: 剧集信息
+    :param course_path: 课程目录
+    :param idx: 剧集序号
+    :param season_id: 课程ID
+    :param manifest: 课程的校验清单
+    :param result: 可选，用于返回各流字节数等下载信息
+    :return: 是否成功；在合并队列中合并时返回Future，结果为是否成功
+    """
+    try:
+        outcome = downloader.download_episode(episode, course_path, idx, season_id, manifest, result)
+        if isinstance(outcome, Future):
+            return outcome
+        if outcome:
+            return True
+        print(f"第 {idx} 集下载失败")
+    except Exception as e:
+        print(f"下载第 {idx} 集时出错: {e}")
+    return False
 
 
 if __name__ == "__main__":
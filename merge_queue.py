@@ -0,0 +1,168 @@
+"""
+合并队列模块：下载完成的视频流和音频流交给独立的进程池合并，下载线程不等待合并
+"""
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional
+
+from integrity import hash_file
+from mp4_remuxer import Mp4FormatError, remux_dash
+
+
+def merge_tracks(video_path: str, audio_path: str, output_path: str, engine: str = 'auto',
+                 result: Optional[Dict] = None) -> bool:
+    """
+    合并视频和音频。B站的分片MP4直接用内置合并改写盒子，无需启动ffmpeg；
+    文件结构不支持时使用ffmpeg合并。输出先写入output_path.part，成功后改名，中断时不会留下不完整的MP4
+    :param video_path: 视频文件路径
+    :param audio_path: 音频文件路径
+    :param output_path: 输出文件路径
+    :param engine: 合并方式，auto先用内置合并，ffmpeg始终使用ffmpeg
+    :param result: 可选，用于返回输出文件的内容哈希(content_hash)
+    :return: 是否成功，ffmpeg合并失败时抛出异常
+    """
+    if result is None:
+        result = {}
+    if engine != 'ffmpeg':
+        try:
+            result['content_hash'] = remux_dash([video_path, audio_path], output_path)
+            print("合并成功!")
+            return True
+        except Mp4FormatError as e:
+            print(f"内置合并不支持该文件 ({e})，改用ffmpeg合并")
+
+    part_path = output_path + '.part'
+    try:
+        cmd = [
+            'ffmpeg',
+            '-i', video_path,
+            '-i', audio_path,
+            '-c', 'copy',
+            '-f', 'mp4',  # 输出文件扩展名为.part，需指定格式
+            '-y',  # 覆盖输出文件
+            part_path
+        ]
+
+        process = subprocess.run(cmd, capture_output=True, text=True)
+
+        if process.returncode == 0:
+            # 输出由ffmpeg写入，只能在合并后读取一遍计算哈希
+            result['content_hash'] = hash_file(part_path)
+            os.replace(part_path, output_path)
+            print("合并成功!")
+            return True
+        else:
+            print(f"合并失败: {process.stderr}")
+            raise Exception(f"ffmpeg合并失败，返回码: {process.returncode}")
+
+    except FileNotFoundError:
+        print("错误: 未找到ffmpeg，请确保ffmpeg已安装并添加到系统PATH")
+        raise Exception("ffmpeg未安装或未添加到PATH")
+    except Exception as e:
+        print(f"合并出错: {e}")
+        raise
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def merge_job(video_path: str, audio_path: str, output_path: str, engine: str) -> Dict:
+    """
+    在进程池中执行的合并任务，无论成功与否都删除临时文件
+    :param video_path: 视频文件路径
+    :param audio_path: 音频文件路径
+    :param output_path: 输出文件路径
+    :param engine: 合并方式
+    :return: {'seconds': 合并耗时, 'content_hash': 输出文件的内容哈希}
+    """
+    start = time.monotonic()
+    result = {}
+    try:
+        merge_tracks(video_path, audio_path, output_path, engine, result)
+    finally:
+        for path in (video_path, audio_path):
+            if os.path.exists(path):
+                os.remove(path)
+    result['seconds'] = time.monotonic() - start
+    return result
+
+
+class MergeQueue:
+    """合并队列：由独立的进程池合并，排队的任务达到上限时提交方等待，避免未合并的临时文件占满磁盘"""
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        """
+        初始化合并队列
+        :param workers: 合并进程数，默认为CPU核数，最多2个（合并主要受磁盘速度限制）
+        :param max_pending: 最多排队和正在合并的任务数，默认为进程数的2倍
+        """
+        self.workers = max(1, int(workers or min(os.cpu_count() or 1, 2)))
+        self.max_pending = max(1, int(max_pending or self.workers * 2))
+        # 用spawn启动合并进程：队列创建时下载、预取和进度线程已在运行，fork出的子进程可能继承
+        # 被其他线程持有的stdout、日志或连接池的锁，在合并时打印输出就会死锁
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._stats = {'merged': 0, 'failed': 0, 'merge_seconds': 0.0, 'wait_seconds': 0.0}
+        self._lock = threading.Lock()
+
+    def submit(self, video_path: str, audio_path: str, output_path: str, engine: str = 'auto',
+               result: Optional[Dict] = None) -> Future:
+        """
+        提交合并任务，队列已满时等待
+        :param video_path: 视频文件路径
+        :param audio_path: 音频文件路径
+        :param output_path: 输出文件路径
+        :param engine: 合并方式
+        :param result: 可选，合并成功后在返回的Future完成前写入输出文件的内容哈希(content_hash)
+        :return: Future，结果为是否成功
+        """
+        wait_start = time.monotonic()
+        self._slots.acquire()
+        with self._lock:
+            self._stats['wait_seconds'] += time.monotonic() - wait_start
+
+        done = Future()
+        name = os.path.basename(output_path)
+
+        def job_done(job: Future) -> None:
+            self._slots.release()
+            error = job.exception()
+            with self._lock:
+                if error is None:
+                    self._stats['merged'] += 1
+                    self._stats['merge_seconds'] += job.result()['seconds']
+                else:
+                    self._stats['failed'] += 1
+            if error is None:
+                if result is not None:
+                    result['content_hash'] = job.result()['content_hash']
+                print(f"\n合并完成: {name} ({job.result()['seconds']:.1f} 秒)")
+            else:
+                print(f"\n合并失败: {name} ({error})")
+            done.set_result(error is None)
+
+        try:
+            job = self._executor.submit(merge_job, video_path, audio_path, output_path, engine)
+        except Exception:
+            self._slots.release()
+            raise
+        job.add_done_callback(job_done)
+        return done
+
+    def get_stats(self) -> Dict:
+        """
+        获取合并统计
+        :return: {'merged': 成功数, 'failed': 失败数, 'merge_seconds': 合并总耗时,
+                  'wait_seconds': 提交方等待队列空位的总时间}
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def shutdown(self) -> None:
+        """等待排队的任务完成并关闭进程池"""
+        self._executor.shutdown(wait=True)
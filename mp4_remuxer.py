@@ -0,0 +1,614 @@
+"""
+内置DASH合并模块：不依赖ffmpeg，通过改写MP4盒子把B站的视频流和音频流（分片MP4）合并为一个MP4文件
+"""
+import argparse
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from integrity import HashingWriter
+
+# 合并时丢弃的顶层盒子：索引类盒子中的字节偏移只对原文件有效
+SKIP_BOXES = {'sidx', 'ssix', 'styp', 'mfra'}
+
+# 复制mdat时每次读取的字节数，内存占用与文件大小无关
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class Mp4FormatError(Exception):
+    """文件不是内置合并支持的分片MP4结构"""
+
+
+def read_box_header(f: BinaryIO, file_size: int) -> Optional[Tuple[str, int, int]]:
+    """
+    读取当前位置的盒子头
+    :param f: 输入文件
+    :param file_size: 文件大小
+    :return: (盒子类型, 盒子头长度, 盒子总长度)，到达文件末尾时返回None
+    """
+    start = f.tell()
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    size, box_type = struct.unpack('>I4s', header)
+    header_size = 8
+    if size == 1:
+        size = struct.unpack('>Q', f.read(8))[0]
+        header_size = 16
+    elif size == 0:
+        # 长度为0表示盒子一直延伸到文件末尾
+        size = file_size - start
+    if size < header_size or start + size > file_size:
+        raise Mp4FormatError(f"盒子长度无效: {box_type!r} @ {start}")
+    return box_type.decode('latin-1'), header_size, size
+
+
+def iter_child_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[str, int, int, int]]:
+    """
+    遍历内存中一段数据里的盒子
+    :param data: 盒子数据
+    :param start: 起始偏移
+    :param end: 结束偏移
+    :return: 迭代 (盒子类型, 起始偏移, 盒子头长度, 盒子总长度)
+    """
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, position)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, position + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size or position + size > end:
+            raise Mp4FormatError(f"盒子长度无效: {box_type!r} @ {position}")
+        yield box_type.decode('latin-1'), position, header_size, size
+        position += size
+
+
+def find_box(data: bytes, path: List[str], start: int = 0, end: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """
+    按路径查找盒子，如 ['mdia', 'mdhd']
+    :param data: 盒子数据
+    :param path: 盒子类型路径
+    :param start: 起始偏移
+    :param end: 结束偏移
+    :return: (盒子内容起始偏移, 盒子结束偏移)，找不到时返回None
+    """
+    for box_type, position, header_size, size in iter_child_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return position + header_size, position + size
+            return find_box(data, path[1:], position + header_size, position + size)
+    return None
+
+
+def box(box_type: str, payload: bytes) -> bytes:
+    """
+    构造盒子
+    :param box_type: 盒子类型
+    :param payload: 盒子内容
+    :return: 盒子数据
+    """
+    return struct.pack('>I4s', 8 + len(payload), box_type.encode('latin-1')) + payload
+
+
+class TrackInput:
+    """一个分片MP4输入文件（只含一条轨道）"""
+
+    def __init__(self, path: str):
+        """
+        读取文件头（ftyp、moov、sidx），定位第一个分片
+        :param path: 文件路径
+        """
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        self.ftyp = b''
+        self.moov = b''
+        self.sidx = b''
+        self.first_fragment = None
+
+        with open(path, 'rb') as f:
+            while True:
+                start = f.tell()
+                header = read_box_header(f, self.file_size)
+                if header is None:
+                    break
+                box_type, _, size = header
+                if box_type == 'moof':
+                    self.first_fragment = start
+                    break
+                if box_type in ('ftyp', 'moov', 'sidx'):
+                    f.seek(start)
+                    setattr(self, box_type, f.read(size))
+                else:
+                    f.seek(start + size)
+
+        if not self.moov or self.first_fragment is None:
+            raise Mp4FormatError(f"{os.path.basename(path)} 不是分片MP4（缺少moov或moof）")
+        traks = [position for box_type, position, _, _ in iter_child_boxes(self.moov, 8) if box_type == 'trak']
+        if len(traks) != 1:
+            raise Mp4FormatError(f"{os.path.basename(path)} 包含 {len(traks)} 条轨道，只支持单轨道文件")
+        self.movie_timescale = self._read_timescale(['mvhd'])
+        self.media_timescale = self._read_timescale(['trak', 'mdia', 'mdhd'])
+
+    def _read_timescale(self, path: List[str]) -> int:
+        """
+        读取mvhd/mdhd中的时间刻度
+        :param path: 盒子路径
+        :return: 每秒的时间单位数
+        """
+        found = find_box(self.moov, path, 8)
+        if found is None:
+            raise Mp4FormatError(f"缺少 {'/'.join(path)}")
+        start = found[0]
+        offset = 20 if self.moov[start] == 1 else 12
+        return struct.unpack_from('>I', self.moov, start + offset)[0]
+
+    def duration(self) -> Optional[float]:
+        """
+        根据sidx中各分段的时长计算轨道时长
+        :return: 秒数，没有sidx时返回None
+        """
+        if not self.sidx:
+            return None
+        data = self.sidx
+        version = data[8]
+        timescale = struct.unpack_from('>I', data, 16)[0]
+        position = 20 + (8 if version == 0 else 16)
+        count = struct.unpack_from('>H', data, position + 2)[0]
+        position += 4
+        total = 0
+        for index in range(count):
+            total += struct.unpack_from('>I', data, position + index * 12 + 4)[0]
+        return total / timescale if timescale else None
+
+    def presentation_offset(self) -> int:
+        """
+        第一个分片中最早的显示时间（媒体时间刻度）。有B帧的视频第一帧的显示时间晚于解码时间，
+        ffmpeg合并时把每个输入的起始时间对齐到0，这里用编辑列表（elst）得到同样的音画对齐
+        :return: 显示时间，没有composition偏移时为0
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(self.first_fragment)
+            size = read_box_header(f, self.file_size)[2]
+            f.seek(self.first_fragment)
+            moof = f.read(size)
+        return self._first_composition_time(moof) or 0
+
+    def _first_composition_time(self, moof: bytes) -> Optional[int]:
+        """
+        计算分片中最早的显示时间（解码时间加composition偏移）
+        :param moof: moof盒子数据
+        :return: 媒体时间刻度下的时间，分片中没有trun时返回None
+        """
+        traf = find_box(moof, ['traf'], 8)
+        if traf is None:
+            return None
+        tfhd = find_box(moof, ['tfhd'], *traf)
+        trun = find_box(moof, ['trun'], *traf)
+        tfdt = find_box(moof, ['tfdt'], *traf)
+        if tfhd is None or trun is None:
+            return None
+
+        # 样本默认时长：tfhd中的default_sample_duration，否则取trex中的值
+        tfhd_flags = struct.unpack_from('>I', moof, tfhd[0])[0] & 0xFFFFFF
+        default_duration = None
+        if tfhd_flags & 0x000008:
+            position = tfhd[0] + 8 + (8 if tfhd_flags & 0x000001 else 0) + (4 if tfhd_flags & 0x000002 else 0)
+            default_duration = struct.unpack_from('>I', moof, position)[0]
+        if default_duration is None:
+            trex = find_box(self.moov, ['mvex', 'trex'], 8)
+            default_duration = struct.unpack_from('>I', self.moov, trex[0] + 12)[0] if trex else 0
+
+        decode_time = 0
+        if tfdt is not None:
+            if moof[tfdt[0]] == 1:
+                decode_time = struct.unpack_from('>Q', moof, tfdt[0] + 4)[0]
+            else:
+                decode_time = struct.unpack_from('>I', moof, tfdt[0] + 4)[0]
+
+        version = moof[trun[0]]
+        flags = struct.unpack_from('>I', moof, trun[0])[0] & 0xFFFFFF
+        if not flags & 0x000800:
+            return decode_time
+        count = struct.unpack_from('>I', moof, trun[0] + 4)[0]
+        position = trun[0] + 8 + (4 if flags & 0x000001 else 0) + (4 if flags & 0x000004 else 0)
+        earliest = None
+        for _ in range(count):
+            duration = default_duration
+            if flags & 0x000100:
+                duration = struct.unpack_from('>I', moof, position)[0]
+                position += 4
+            if flags & 0x000200:
+                position += 4
+            if flags & 0x000400:
+                position += 4
+            offset = struct.unpack_from('>i' if version == 1 else '>I', moof, position)[0]
+            position += 4
+            composition = decode_time + offset
+            earliest = composition if earliest is None else min(earliest, composition)
+            decode_time += duration
+        return earliest
+
+    def fragments(self) -> Iterator[Tuple[float, int, int]]:
+        """
+        依次遍历分片，只读取盒子头，不读取媒体数据
+        :return: 迭代 (分片起始解码时间（秒）, 分片起始偏移, 分片长度)。分片为一个moof及其后到下一个moof之前的盒子
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(self.first_fragment)
+            fragment_start = None
+            fragment_time = 0.0
+            position = self.first_fragment
+            while True:
+                header = read_box_header(f, self.file_size)
+                box_type = header[0] if header else None
+                if box_type is None or box_type == 'moof' or box_type in SKIP_BOXES:
+                    if fragment_start is not None:
+                        yield fragment_time, fragment_start, position - fragment_start
+                        fragment_start = None
+                    if box_type is None:
+                        return
+                if box_type == 'moof':
+                    f.seek(position)
+                    moof = f.read(header[2])
+                    fragment_start = position
+                    fragment_time = self._fragment_time(moof)
+                position += header[2]
+                f.seek(position)
+
+    def _fragment_time(self, moof: bytes) -> float:
+        """
+        读取moof中tfdt记录的起始解码时间
+        :param moof: moof盒子数据
+        :return: 秒数
+        """
+        found = find_box(moof, ['traf', 'tfdt'], 8)
+        if found is None:
+            return 0.0
+        start = found[0]
+        if moof[start] == 1:
+            decode_time = struct.unpack_from('>Q', moof, start + 4)[0]
+        else:
+            decode_time = struct.unpack_from('>I', moof, start + 4)[0]
+        return decode_time / self.media_timescale
+
+
+def _set_track_id(data: bytearray, start: int, offset: int, track_id: int) -> None:
+    """
+    改写盒子内容中的track_ID
+    :param data: 盒子数据
+    :param start: 盒子内容起始偏移
+    :param offset: track_ID在内容中的偏移
+    :param track_id: 新的track_ID
+    """
+    struct.pack_into('>I', data, start + offset, track_id)
+
+
+def _rescale_movie_durations(trak: bytearray, source_timescale: int, target_timescale: int,
+                             duration: Optional[float]) -> None:
+    """
+    tkhd和elst中的时长以影片时间刻度为单位，两个输入的mvhd时间刻度不同时需要换算
+    :param trak: trak盒子数据
+    :param source_timescale: 原文件的影片时间刻度
+    :param target_timescale: 输出文件的影片时间刻度
+    :param duration: 轨道时长（秒），tkhd中时长为0时填入
+    """
+    tkhd = find_box(trak, ['tkhd'], 8)
+    if tkhd is not None:
+        start = tkhd[0]
+        if trak[start] == 1:
+            value = struct.unpack_from('>Q', trak, start + 28)[0]
+            value = value * target_timescale // source_timescale
+            if not value and duration:
+                value = round(duration * target_timescale)
+            struct.pack_into('>Q', trak, start + 28, value)
+        else:
+            value = struct.unpack_from('>I', trak, start + 20)[0]
+            value = value * target_timescale // source_timescale
+            if not value and duration:
+                value = round(duration * target_timescale)
+            struct.pack_into('>I', trak, start + 20, min(value, 0xFFFFFFFF))
+
+    elst = find_box(trak, ['edts', 'elst'], 8)
+    if elst is not None and source_timescale != target_timescale:
+        start = elst[0]
+        version = trak[start]
+        count = struct.unpack_from('>I', trak, start + 4)[0]
+        entry_size = 20 if version == 1 else 12
+        for index in range(count):
+            position = start + 8 + index * entry_size
+            fmt = '>Q' if version == 1 else '>I'
+            value = struct.unpack_from(fmt, trak, position)[0]
+            struct.pack_into(fmt, trak, position, value * target_timescale // source_timescale)
+
+
+def _add_edit_list(trak: bytes, media_time: int, duration: Optional[float], movie_timescale: int) -> bytes:
+    """
+    轨道没有编辑列表且需要偏移显示时间时，在tkhd之后插入edts/elst
+    :param trak: trak盒子数据
+    :param media_time: 从媒体时间轴的哪一点开始显示
+    :param duration: 轨道时长（秒），未知时为None
+    :param movie_timescale: 影片时间刻度
+    :return: trak盒子数据
+    """
+    if media_time <= 0 or find_box(trak, ['edts'], 8) is not None:
+        return trak
+    # 分片MP4中时长为0的编辑表示覆盖全部媒体
+    segment_duration = min(round(duration * movie_timescale), 0xFFFFFFFF) if duration else 0
+    elst = box('elst', struct.pack('>IIIiHH', 0, 1, segment_duration, media_time, 1, 0))
+    children = b''
+    for box_type, position, _, size in iter_child_boxes(trak, 8):
+        children += trak[position:position + size]
+        if box_type == 'tkhd':
+            children += box('edts', elst)
+    return box('trak', children)
+
+
+def build_moov(inputs: List[TrackInput]) -> bytes:
+    """
+    合并各输入的moov：第一个输入的mvhd，各输入的trak依次编号为1、2……，mvex中放入各轨道的trex
+    :param inputs: 输入文件，第一个通常为视频
+    :return: 新的moov盒子
+    """
+    first = inputs[0]
+    movie_timescale = first.movie_timescale
+    durations = [track.duration() for track in inputs]
+
+    mvhd_range = find_box(first.moov, ['mvhd'], 8)
+    mvhd = bytearray(first.moov[mvhd_range[0] - 8:mvhd_range[1]])
+    # next_track_ID在mvhd最后4个字节
+    struct.pack_into('>I', mvhd, len(mvhd) - 4, len(inputs) + 1)
+    known = [d for d in durations if d]
+    if known:
+        if mvhd[8] == 1:
+            if not struct.unpack_from('>Q', mvhd, 32)[0]:
+                struct.pack_into('>Q', mvhd, 32, round(max(known) * movie_timescale))
+        elif not struct.unpack_from('>I', mvhd, 24)[0]:
+            struct.pack_into('>I', mvhd, 24, min(round(max(known) * movie_timescale), 0xFFFFFFFF))
+
+    traks = []
+    trexs = []
+    mehd = b''
+    for track_id, (track, duration) in enumerate(zip(inputs, durations), 1):
+        for box_type, position, header_size, size in iter_child_boxes(track.moov, 8):
+            if box_type == 'trak':
+                trak = bytearray(track.moov[position:position + size])
+                tkhd = find_box(trak, ['tkhd'], 8)
+                _set_track_id(trak, tkhd[0], 20 if trak[tkhd[0]] == 1 else 12, track_id)
+                _rescale_movie_durations(trak, track.movie_timescale, movie_timescale, duration)
+                traks.append(_add_edit_list(bytes(trak), track.presentation_offset(), duration, movie_timescale))
+            elif box_type == 'mvex':
+                for child_type, child_pos, child_header, child_size in iter_child_boxes(
+                        track.moov, position + header_size, position + size):
+                    if child_type == 'trex':
+                        trex = bytearray(track.moov[child_pos:child_pos + child_size])
+                        _set_track_id(trex, child_header, 4, track_id)
+                        trexs.append(bytes(trex))
+                    elif child_type == 'mehd' and track is first:
+                        mehd = track.moov[child_pos:child_pos + child_size]
+        if len(trexs) != track_id:
+            raise Mp4FormatError(f"{os.path.basename(track.path)} 缺少trex，不是分片MP4")
+
+    # 第一个输入moov中的其他盒子（如udta）原样保留
+    others = [first.moov[position:position + size]
+              for box_type, position, _, size in iter_child_boxes(first.moov, 8)
+              if box_type not in ('mvhd', 'trak', 'mvex')]
+    return box('moov', bytes(mvhd) + b''.join(traks) + box('mvex', mehd + b''.join(trexs)) + b''.join(others))
+
+
+def rewrite_moof(moof: bytearray, track_id: int, sequence: int, moved: int) -> None:
+    """
+    改写moof：分片序号、track_ID，以及tfhd中显式的base_data_offset
+    :param moof: moof盒子数据
+    :param track_id: 输出中的track_ID
+    :param sequence: 输出中的分片序号
+    :param moved: 分片在输出中的位置减去在输入中的位置
+    """
+    for box_type, position, header_size, size in iter_child_boxes(moof, 8):
+        start = position + header_size
+        if box_type == 'mfhd':
+            struct.pack_into('>I', moof, start + 4, sequence)
+        elif box_type == 'traf':
+            tfhd = find_box(moof, ['tfhd'], start, position + size)
+            if tfhd is None:
+                raise Mp4FormatError("traf中缺少tfhd")
+            flags = struct.unpack_from('>I', moof, tfhd[0])[0] & 0xFFFFFF
+            _set_track_id(moof, tfhd[0], 4, track_id)
+            if flags & 0x000001:
+                # base_data_offset是文件中的绝对位置，随分片一起平移
+                offset = struct.unpack_from('>Q', moof, tfhd[0] + 8)[0]
+                struct.pack_into('>Q', moof, tfhd[0] + 8, offset + moved)
+
+
+def remux_dash(input_paths: List[str], output_path: str) -> str:
+    """
+    把多个单轨道分片MP4（如B站的视频流和音频流）合并为一个分片MP4。
+    按解码时间交错写出各轨道的分片，媒体数据分块复制，内存占用与文件大小无关
+    :param input_paths: 输入文件，第一个通常为视频
+    :param output_path: 输出文件路径，先写入output_path.part，完成后改名
+    :return: 输出文件的内容哈希（写入时计算）
+    """
+    part_path = output_path + '.part'
+    try:
+        content_hash = _remux(input_paths, part_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    os.replace(part_path, output_path)
+    return content_hash
+
+
+def _remux(input_paths: List[str], part_path: str) -> str:
+    """
+    合并输入文件并写入part_path
+    :param input_paths: 输入文件
+    :param part_path: 输出文件路径
+    :return: 输出文件的内容哈希
+    """
+    try:
+        inputs = [TrackInput(path) for path in input_paths]
+        moov = build_moov(inputs)
+    except struct.error as e:
+        raise Mp4FormatError(f"文件结构损坏: {e}")
+
+    sources = [open(track.path, 'rb') for track in inputs]
+    try:
+        with open(part_path, 'wb') as f:
+            out = HashingWriter(f)
+            out.write(inputs[0].ftyp)
+            out.write(moov)
+
+            # 每条轨道取出下一个分片，总是先写解码时间最早的分片
+            iterators = [track.fragments() for track in inputs]
+            pending: Dict[int, Tuple[float, int, int]] = {}
+            for index, iterator in enumerate(iterators):
+                fragment = next(iterator, None)
+                if fragment is not None:
+                    pending[index] = fragment
+
+            sequence = 0
+            while pending:
+                index = min(pending, key=lambda i: (pending[i][0], i))
+                _, start, size = pending[index]
+                sequence += 1
+                _copy_fragment(sources[index], out, start, size, index + 1, sequence)
+                fragment = next(iterators[index], None)
+                if fragment is None:
+                    del pending[index]
+                else:
+                    pending[index] = fragment
+            return out.hexdigest()
+    except struct.error as e:
+        raise Mp4FormatError(f"文件结构损坏: {e}")
+    finally:
+        for source in sources:
+            source.close()
+
+
+def _copy_fragment(source: BinaryIO, out: HashingWriter, start: int, size: int, track_id: int, sequence: int) -> None:
+    """
+    复制一个分片：改写moof后写出，其后的mdat等盒子分块原样复制
+    :param source: 输入文件
+    :param out: 输出文件
+    :param start: 分片在输入中的起始偏移
+    :param size: 分片长度
+    :param track_id: 输出中的track_ID
+    :param sequence: 输出中的分片序号
+    """
+    source.seek(start)
+    moof_size = read_box_header(source, start + size)[2]
+    source.seek(start)
+    moof = bytearray(source.read(moof_size))
+    rewrite_moof(moof, track_id, sequence, out.tell() - start)
+    out.write(moof)
+
+    remaining = size - moof_size
+    while remaining > 0:
+        chunk = source.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise Mp4FormatError("文件被截断")
+        out.write(chunk)
+        remaining -= len(chunk)
+
+
+def _packet_hashes(ffmpeg: str, path: str) -> Dict[int, List[Tuple[float, int, str]]]:
+    """
+    用ffmpeg的framemd5输出读取文件中每个数据包的时间、大小和MD5
+    :param ffmpeg: ffmpeg路径
+    :param path: 文件路径
+    :return: {流序号: [(pts秒数, 字节数, MD5)]}
+    """
+    result = subprocess.run([ffmpeg, '-v', 'error', '-i', path, '-map', '0', '-c', 'copy', '-f', 'framemd5', '-'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg读取失败: {result.stderr}")
+    timebases = {}
+    packets: Dict[int, List[Tuple[float, int, str]]] = {}
+    for line in result.stdout.splitlines():
+        match = re.match(r'#tb (\d+): (\d+)/(\d+)', line)
+        if match:
+            timebases[int(match.group(1))] = int(match.group(2)) / int(match.group(3))
+            continue
+        if line.startswith('#') or not line.strip():
+            continue
+        stream, _, pts, _, size, md5 = [field.strip() for field in line.split(',')]
+        stream = int(stream)
+        packets.setdefault(stream, []).append((round(int(pts) * timebases[stream], 3), int(size), md5))
+    return packets
+
+
+def compare_with_ffmpeg(input_paths: List[str], ffmpeg: str = 'ffmpeg') -> bool:
+    """
+    分别用内置合并和 ffmpeg -c copy 合并同一组输入，逐个比较两个输出中数据包的时间、大小和内容
+    :param input_paths: 输入文件
+    :param ffmpeg: ffmpeg路径
+    :return: 是否一致
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        builtin_output = os.path.join(tmp_dir, 'builtin.mp4')
+        ffmpeg_output = os.path.join(tmp_dir, 'ffmpeg.mp4')
+        remux_dash(input_paths, builtin_output)
+
+        cmd = [ffmpeg, '-v', 'error']
+        for path in input_paths:
+            cmd += ['-i', path]
+        for index in range(len(input_paths)):
+            cmd += ['-map', str(index)]
+        cmd += ['-c', 'copy', '-y', ffmpeg_output]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"ffmpeg合并失败: {result.stderr}")
+
+        builtin_packets = _packet_hashes(ffmpeg, builtin_output)
+        ffmpeg_packets = _packet_hashes(ffmpeg, ffmpeg_output)
+
+    if sorted(builtin_packets) != sorted(ffmpeg_packets):
+        print(f"流数量不一致: 内置 {len(builtin_packets)}, ffmpeg {len(ffmpeg_packets)}")
+        return False
+    same = True
+    for stream in sorted(ffmpeg_packets):
+        expected, actual = ffmpeg_packets[stream], builtin_packets[stream]
+        if len(expected) != len(actual):
+            print(f"流 {stream}: 数据包数量不一致 (内置 {len(actual)}, ffmpeg {len(expected)})")
+            same = False
+            continue
+        for number, (a, b) in enumerate(zip(actual, expected)):
+            if a != b:
+                print(f"流 {stream} 第 {number} 个数据包不一致: 内置 {a}, ffmpeg {b}")
+                same = False
+                break
+        else:
+            print(f"流 {stream}: {len(expected)} 个数据包一致")
+    return same
+
+
+def main():
+    """命令行入口：合并文件，或与ffmpeg的合并结果对比"""
+    parser = argparse.ArgumentParser(description="不依赖ffmpeg合并B站DASH视频流和音频流")
+    parser.add_argument('video', help="视频流文件（.m4s）")
+    parser.add_argument('audio', help="音频流文件（.m4s）")
+    parser.add_argument('output', nargs='?', help="输出MP4文件")
+    parser.add_argument('--compare', action='store_true', help="与 ffmpeg -c copy 的合并结果逐包对比")
+    parser.add_argument('--ffmpeg', default=shutil.which('ffmpeg') or 'ffmpeg', help="对比时使用的ffmpeg路径")
+    args = parser.parse_args()
+
+    if args.compare:
+        same = compare_with_ffmpeg([args.video, args.audio], args.ffmpeg)
+        print("输出一致" if same else "输出不一致")
+        raise SystemExit(0 if same else 1)
+    if not args.output:
+        parser.error("需要指定输出文件")
+    remux_dash([args.video, args.audio], args.output)
+    print(f"合并完成: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+播放地址预取模块
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from cdn_selector import stream_urls
+
+
+def iter_stream_urls(playurl_data: Dict):
+    """
+    遍历播放地址数据中的所有CDN地址（含备用地址）
+    :param playurl_data: 播放地址数据
+    :return: URL生成器
+    """
+    dash = playurl_data.get('dash') or {}
+    for stream in (dash.get('video') or []) + (dash.get('audio') or []):
+        yield from stream_urls(stream)
+
+
+def parse_deadline(playurl_data: Dict) -> Optional[float]:
+    """
+    从签名CDN地址的deadline查询参数中取得过期时间
+    :param playurl_data: 播放地址数据
+    :return: 最早的过期时间（Unix时间戳），没有deadline参数时返回None
+    """
+    deadlines = []
+    for url in iter_stream_urls(playurl_data):
+        values = parse_qs(urlsplit(url).query).get('deadline')
+        if values and values[0].isdigit():
+            deadlines.append(float(values[0]))
+    return min(deadlines) if deadlines else None
+
+
+class PlayurlPrefetcher:
+    """在当前剧集下载时提前解析后续K集的播放地址，并按地址的过期时间缓存"""
+
+    def __init__(self, course, lookahead: int = 2, refresh_margin: float = 600,
+                 default_ttl: float = 600):
+        """
+        初始化预取器
+        :param course: 课程API对象（BilibiliCourse）
+        :param lookahead: 预取后续剧集的数量
+        :param refresh_margin: 距离过期不足该秒数的地址视为即将过期，需要重新获取
+        :param default_ttl: 地址中没有deadline参数时的缓存秒数
+        """
+        self.course = course
+        self.lookahead = max(0, int(lookahead))
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self._cache: Dict[Tuple[int, int], Tuple[Dict, float]] = {}
+        self._pending: Dict[Tuple[int, int], Future] = {}
+        self._queue: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.lookahead))
+
+    def set_queue(self, keys: List[Tuple[int, int]]) -> None:
+        """
+        设置即将下载的剧集顺序，并开始预取前K集
+        :param keys: [(ep_id, cid)]
+        """
+        with self._lock:
+            self._queue = list(keys)
+        self._prefetch_after(-1)
+
+    def get(self, ep_id: int, cid: int) -> Optional[Dict]:
+        """
+        获取播放地址：优先使用未过期的缓存或正在进行的预取，同时预取后续剧集
+        :param ep_id: 剧集ID
+        :param cid: 视频CID
+        :return: 播放地址数据，获取失败时返回None
+        """
+        key = (ep_id, cid)
+        with self._lock:
+            position = self._queue.index(key) if key in self._queue else None
+        if position is not None:
+            self._prefetch_after(position)
+
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        # 预取尚未完成时等待它，而不是重复请求
+        with self._lock:
+            future = self._pending.pop(key, None)
+        if future is not None:
+            try:
+                future.result()
+            except Exception:
+                pass
+            cached = self._get_cached(key)
+            if cached is not None:
+                return cached
+
+        return self._resolve(key)
+
+    def cached(self, ep_id: int, cid: int) -> Optional[Dict]:
+        """
+        只查询缓存，不发出请求
+        :param ep_id: 剧集ID
+        :param cid: 视频CID
+        :return: 未临近过期的播放地址数据，没有时返回None
+        """
+        return self._get_cached((ep_id, cid))
+
+    def shutdown(self) -> None:
+        """停止预取线程"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _prefetch_after(self, position: int) -> None:
+        """
+        预取队列中指定位置之后的K集
+        :param position: 当前剧集在队列中的位置
+        """
+        with self._lock:
+            keys = self._queue[position + 1:position + 1 + self.lookahead]
+        for key in keys:
+            if self._get_cached(key) is not None:
+                continue
+            with self._lock:
+                if key in self._pending and not self._pending[key].done():
+                    continue
+                self._pending[key] = self._executor.submit(self._resolve, key)
+
+    def _resolve(self, key: Tuple[int, int]) -> Optional[Dict]:
+        """
+        请求播放地址并写入缓存
+        :param key: (ep_id, cid)
+        :return: 播放地址数据
+        """
+        data = self.course.get_episode_playurl(*key)
+        if data is not None:
+            expires_at = parse_deadline(data) or time.time() + self.default_ttl
+            with self._lock:
+                self._cache[key] = (data, expires_at)
+        return data
+
+    def _get_cached(self, key: Tuple[int, int]) -> Optional[Dict]:
+        """
+        获取未临近过期的缓存
+        :param key: (ep_id, cid)
+        :return: 播放地址数据，无缓存或即将过期时返回None
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is None:
+            return None
+        data, expires_at = entry
+        if expires_at - time.time() <= self.refresh_margin:
+            return None
+        return data
@@ -0,0 +1,239 @@
+"""
+下载进度模块：下载线程只累加计数，由后台线程按固定频率汇总绘制一行进度
+"""
+import shutil
+import sys
+import threading
+import time
+import unicodedata
+from typing import List, Optional, TextIO
+
+
+def format_size(size: float) -> str:
+    """
+    格式化字节数
+    :param size: 字节数
+    :return: 如 12.3MB
+    """
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != 'B' else f"{int(size)}B"
+        size /= 1024
+    return f"{size:.2f}GB"
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """
+    格式化剩余时间
+    :param seconds: 秒数，未知时为None
+    :return: 如 1:02:03 或 02:03
+    """
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+def display_width(text: str) -> int:
+    """
+    计算文本在终端中的显示宽度，中文等全角字符占两列
+    :param text: 文本
+    :return: 列数
+    """
+    return sum(2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1 for ch in text)
+
+
+def truncate(text: str, width: int) -> str:
+    """
+    按显示宽度截断文本
+    :param text: 文本
+    :param width: 最大列数
+    :return: 截断后的文本
+    """
+    result = ''
+    used = 0
+    for ch in text:
+        used += display_width(ch)
+        if used > width:
+            break
+        result += ch
+    return result
+
+
+class ProgressTask:
+    """一个下载任务的进度，add/connection_* 在下载线程中调用，只做计数"""
+
+    def __init__(self, renderer: 'ProgressRenderer', name: str, total: int, initial: int = 0):
+        """
+        初始化任务
+        :param renderer: 所属的进度绘制器
+        :param name: 任务名称
+        :param total: 总字节数，未知时为0
+        :param initial: 已完成的字节数（断点续传）
+        """
+        self.renderer = renderer
+        self.name = name
+        self.total = total
+        self.initial = initial
+        self.downloaded = initial
+        self.connections = 0
+        self.started = time.time()
+        self.speed = 0.0
+        self._last_bytes = initial
+        self._last_time = self.started
+        self._lock = threading.Lock()
+
+    def add(self, amount: int) -> None:
+        """
+        记录收到的字节数
+        :param amount: 字节数
+        """
+        with self._lock:
+            self.downloaded += amount
+
+    def reset(self) -> None:
+        """重新开始下载（不支持Range的文件重试时从头下载）"""
+        with self._lock:
+            self.downloaded = self.initial
+
+    def connection_opened(self) -> None:
+        """记录一个连接开始传输"""
+        with self._lock:
+            self.connections += 1
+
+    def connection_closed(self) -> None:
+        """记录一个连接结束传输"""
+        with self._lock:
+            self.connections -= 1
+
+    def finish(self, success: bool = True) -> None:
+        """
+        任务结束
+        :param success: 是否成功
+        """
+        self.renderer.finish_task(self, success)
+
+    def sample(self, now: float) -> float:
+        """
+        更新速度（指数平滑，避免数字跳动）
+        :param now: 当前时间
+        :return: 字节/秒
+        """
+        with self._lock:
+            downloaded = self.downloaded
+        elapsed = now - self._last_time
+        if elapsed > 0:
+            current = (downloaded - self._last_bytes) / elapsed
+            self.speed = current if self.speed == 0 else self.speed * 0.7 + current * 0.3
+            self._last_bytes = downloaded
+            self._last_time = now
+        return self.speed
+
+
+class ProgressRenderer:
+    """
+    进度绘制器，所有下载共享一个实例。终端中每秒重绘interval次，显示各任务进度、总速度、剩余时间和连接数；
+    安静模式（输出不是终端时默认开启，如cron）不绘制进度，只在每个任务完成时输出一行
+    """
+
+    def __init__(self, interval: float = 0.1, quiet: Optional[bool] = None, stream: Optional[TextIO] = None):
+        """
+        初始化进度绘制器
+        :param interval: 重绘间隔秒数
+        :param quiet: 安静模式，默认在输出不是终端时开启
+        :param stream: 输出流，默认为标准输出
+        """
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        if quiet is None:
+            quiet = not (hasattr(self.stream, 'isatty') and self.stream.isatty())
+        self.quiet = quiet
+        self._tasks: List[ProgressTask] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_width = 0
+
+    def start_task(self, name: str, total: int, initial: int = 0) -> ProgressTask:
+        """
+        开始一个下载任务
+        :param name: 任务名称
+        :param total: 总字节数，未知时为0
+        :param initial: 已完成的字节数
+        :return: 任务进度
+        """
+        task = ProgressTask(self, name, total, initial)
+        with self._lock:
+            self._tasks.append(task)
+            if not self.quiet and self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return task
+
+    def finish_task(self, task: ProgressTask, success: bool = True) -> None:
+        """
+        结束下载任务
+        :param task: 任务进度
+        :param success: 是否成功
+        """
+        with self._lock:
+            if task not in self._tasks:
+                return
+            self._tasks.remove(task)
+        if self.quiet and success:
+            elapsed = max(time.time() - task.started, 1e-6)
+            received = task.downloaded - task.initial
+            print(f"下载完成: {task.name} {format_size(task.downloaded)} "
+                  f"({elapsed:.1f} 秒, {format_size(received / elapsed)}/s)", file=self.stream)
+
+    def _run(self) -> None:
+        """后台绘制线程，没有任务时清除进度行并退出"""
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                tasks = list(self._tasks)
+                if not tasks:
+                    self._thread = None
+                    self._draw('')
+                    return
+            self._draw(self.render_line(tasks))
+
+    def render_line(self, tasks: List[ProgressTask]) -> str:
+        """
+        汇总各任务生成一行进度
+        :param tasks: 进行中的任务
+        :return: 如 [01. 标题_video.m4s 45% 8.2MB/s] ... 总计 12.5MB/s 剩余 00:12 连接 6
+        """
+        now = time.time()
+        parts = []
+        total_speed = 0.0
+        remaining = 0
+        connections = 0
+        for task in tasks:
+            speed = task.sample(now)
+            total_speed += speed
+            connections += task.connections
+            if task.total > 0:
+                percent = task.downloaded / task.total * 100
+                remaining += max(task.total - task.downloaded, 0)
+                parts.append(f"[{task.name} {percent:.0f}% {format_size(speed)}/s]")
+            else:
+                parts.append(f"[{task.name} {format_size(task.downloaded)} {format_size(speed)}/s]")
+        eta = remaining / total_speed if total_speed > 0 and remaining else None
+        summary = f"总计 {format_size(total_speed)}/s 剩余 {format_eta(eta)} 连接 {connections}"
+        # 任务名称过长时优先保证汇总信息可见
+        width = shutil.get_terminal_size().columns - 1
+        tasks_text = truncate(' '.join(parts), max(width - display_width(summary) - 1, 0))
+        return f"{tasks_text} {summary}".strip()
+
+    def _draw(self, line: str) -> None:
+        """
+        回到行首覆盖上一次的进度行
+        :param line: 进度行，空字符串表示清除
+        """
+        width = display_width(line)
+        padding = ' ' * max(self._last_width - width, 0)
+        self.stream.write(f"\r{line}{padding}\r{line}" if padding else f"\r{line}")
+        self.stream.flush()
+        self._last_width = width
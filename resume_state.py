@@ -0,0 +1,196 @@
+"""
+断点续传状态模块（.part文件的旁路记录）
+"""
+import errno
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+def preallocate(f, size: int) -> None:
+    """
+    为文件预先分配磁盘空间（fallocate），避免多个分段同时写入时产生大量碎片，
+    磁盘空间不足时在下载开始前就报错。文件系统不支持时保留为稀疏文件
+    :param f: 以写模式打开的文件
+    :param size: 文件大小
+    """
+    f.truncate(size)
+    if not hasattr(os, 'posix_fallocate') or size <= 0:
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError as e:
+        if e.errno not in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+            raise
+
+
+def url_identity(url: str) -> str:
+    """
+    计算URL标识。B站CDN地址的查询参数（签名、过期时间）每次获取都会变化，
+    且同一文件可能由不同镜像节点提供，因此只取路径部分
+    :param url: 文件URL
+    :return: URL标识
+    """
+    return urlsplit(url).path
+
+
+class ResumeState:
+    """记录.part文件中已完成的字节区间，保存在同名的.part.json旁路文件中"""
+
+    def __init__(self, part_path: str, identity: str, total_size: int, etag: str = ''):
+        """
+        初始化续传状态
+        :param part_path: .part文件路径
+        :param identity: URL标识
+        :param total_size: 文件总大小
+        :param etag: 服务器返回的ETag，用于识别文件是否变化
+        """
+        self.part_path = part_path
+        self.sidecar_path = part_path + '.json'
+        self.identity = identity
+        self.total_size = total_size
+        self.etag = etag
+        self.completed: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, part_path: str, identity: str, total_size: int, etag: str = '') -> 'ResumeState':
+        """
+        读取已有的续传状态，旁路记录与当前文件不一致时丢弃旧数据重新开始
+        :param part_path: .part文件路径
+        :param identity: URL标识
+        :param total_size: 文件总大小
+        :param etag: 服务器返回的ETag
+        :return: 续传状态
+        """
+        state = cls(part_path, identity, total_size, etag)
+        saved = state._load()
+        if saved is not None and state._matches(saved):
+            state.completed = [tuple(r) for r in saved.get('completed', [])]
+        else:
+            if saved is not None:
+                print("旁路记录与服务器文件不一致，重新下载")
+            state.discard()
+            # 预先创建目标大小的文件，各分段直接写入自己的偏移位置
+            try:
+                with open(part_path, 'wb') as f:
+                    preallocate(f, total_size)
+            except OSError:
+                state.discard()
+                raise
+            state.save()
+        return state
+
+    def _load(self) -> Optional[Dict]:
+        """
+        读取旁路记录
+        :return: 记录内容，不存在或损坏时返回None
+        """
+        if not os.path.exists(self.sidecar_path) or not os.path.exists(self.part_path):
+            return None
+        try:
+            with open(self.sidecar_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _matches(self, saved: Dict) -> bool:
+        """
+        检查旁路记录是否属于同一个文件
+        :param saved: 旁路记录
+        :return: 是否一致
+        """
+        if saved.get('identity') != self.identity or saved.get('total_size') != self.total_size:
+            return False
+        # 两边都有ETag时必须相同
+        if saved.get('etag') and self.etag and saved['etag'] != self.etag:
+            return False
+        return os.path.getsize(self.part_path) == self.total_size
+
+    @property
+    def completed_bytes(self) -> int:
+        """已完成的字节数"""
+        with self._lock:
+            return sum(end - start + 1 for start, end in self.completed)
+
+    def missing_ranges(self) -> List[Tuple[int, int]]:
+        """
+        计算尚未下载的字节区间
+        :return: [(start, end)]，end为闭区间
+        """
+        with self._lock:
+            missing = []
+            position = 0
+            for start, end in sorted(self.completed):
+                if start > position:
+                    missing.append((position, start - 1))
+                position = max(position, end + 1)
+            if position < self.total_size:
+                missing.append((position, self.total_size - 1))
+            return missing
+
+    def first_missing(self, start: int, end: int) -> Optional[int]:
+        """
+        查找区间内第一个尚未下载的字节
+        :param start: 起始字节
+        :param end: 结束字节（闭区间）
+        :return: 字节位置，区间已全部完成时返回None
+        """
+        with self._lock:
+            for r_start, r_end in sorted(self.completed):
+                if r_start <= start <= r_end:
+                    start = r_end + 1
+        return start if start <= end else None
+
+    def add_range(self, start: int, end: int) -> None:
+        """
+        记录已完成的字节区间并保存旁路记录
+        :param start: 起始字节
+        :param end: 结束字节（闭区间）
+        """
+        if end < start:
+            return
+        with self._lock:
+            merged = []
+            for r_start, r_end in sorted(self.completed + [(start, end)]):
+                if merged and r_start <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], r_end))
+                else:
+                    merged.append((r_start, r_end))
+            self.completed = merged
+            self._save_locked()
+
+    def save(self) -> None:
+        """保存旁路记录"""
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        """写入临时文件后替换，避免中断时留下损坏的记录"""
+        data = {
+            'identity': self.identity,
+            'total_size': self.total_size,
+            'etag': self.etag,
+            'completed': self.completed,
+        }
+        tmp_path = self.sidecar_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.sidecar_path)
+
+    def finish(self, filepath: str) -> None:
+        """
+        下载完成：.part文件改名为目标文件并删除旁路记录
+        :param filepath: 目标文件路径
+        """
+        os.replace(self.part_path, filepath)
+        if os.path.exists(self.sidecar_path):
+            os.remove(self.sidecar_path)
+
+    def discard(self) -> None:
+        """删除.part文件和旁路记录"""
+        for path in (self.part_path, self.sidecar_path):
+            if os.path.exists(path):
+                os.remove(path)
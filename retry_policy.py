@@ -0,0 +1,235 @@
+"""
+重试模块：指数退避+随机抖动、失败分类和按主机熔断
+"""
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import requests
+
+# 可重试的HTTP状态码：超时、412风控、限流和服务端错误
+RETRYABLE_STATUS = {408, 412, 429, 500, 502, 503, 504}
+
+# 可重试的B站API业务码：-412 请求被拦截，-500/-503/-509 服务端繁忙
+RETRYABLE_API_CODES = {-412, -500, -503, -509}
+
+# 熔断器半开、其他请求正在试探时，等待的请求每隔多少秒检查一次
+TRIAL_POLL_INTERVAL = 0.5
+
+
+class RetryableError(Exception):
+    """可重试的错误（如API返回-412）"""
+
+
+class FatalError(Exception):
+    """不可重试的错误（如-101未登录、404），重试也不会成功"""
+
+    def __init__(self, message: str, code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+
+
+class CircuitOpenError(FatalError):
+    """主机连续失败，熔断期间直接拒绝请求"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    判断错误是否值得重试
+    :param error: 异常
+    :return: 是否可重试
+    """
+    if isinstance(error, FatalError):
+        return False
+    if isinstance(error, RetryableError):
+        return True
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRYABLE_STATUS
+    # 超时、连接被重置、响应体读取中断
+    return isinstance(error, (requests.Timeout, requests.ConnectionError,
+                              requests.exceptions.ChunkedEncodingError,
+                              ConnectionError, TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器：连续失败达到阈值后熔断一段时间，到期后只放行一个试探请求，
+    试探成功则恢复，失败则重新熔断；试探结束前其他请求仍被拒绝
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        初始化熔断器
+        :param failure_threshold: 连续失败多少次后熔断
+        :param reset_timeout: 熔断持续秒数
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # 半开状态下是否已有试探请求在进行
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        是否允许发出请求
+        :return: 熔断中返回False
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial_in_flight and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # 半开状态：只放行一个试探请求，结果由record_success/record_failure处理
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def remaining(self) -> float:
+        """
+        距离熔断结束（进入半开状态）的秒数
+        :return: 秒数，未熔断时为0
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self) -> None:
+        """记录成功，清零连续失败次数"""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """记录失败，达到阈值时熔断；试探请求失败时重新开始熔断计时"""
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight:
+                self.trial_in_flight = False
+                self.opened_at = time.monotonic()
+            elif self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """试探请求以不可重试的错误（如404、取消）结束，无法判断主机是否恢复，允许下一个请求试探"""
+        with self._lock:
+            self.trial_in_flight = False
+
+
+class RetryPolicy:
+    """共享的重试策略，bilibili_course、bilibili_downloader和courseware_downloader中的网络请求都经过它"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1, max_delay: float = 30,
+                 failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        初始化重试策略
+        :param max_attempts: 最多尝试次数（含第一次）
+        :param base_delay: 退避基础秒数，第n次重试最多等待 base_delay * 2^(n-1) 秒
+        :param max_delay: 单次等待的上限秒数
+        :param failure_threshold: 主机连续失败多少次后熔断
+        :param reset_timeout: 熔断持续秒数
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def call(self, func: Callable, name: str, host: Optional[str] = None, wait_open: bool = False):
+        """
+        执行请求，可重试的错误按指数退避+抖动重试，不可重试的错误立即抛出
+        :param func: 无参数的请求函数
+        :param name: 请求名称，用于日志和统计
+        :param host: 主机名，用于熔断
+        :param wait_open: 主机熔断时等待熔断结束后再请求，而不是立即抛出CircuitOpenError。
+                          没有备用主机的API请求应等待，避免短暂的限流使后续所有请求都失败；有镜像的CDN请求立即失败以便切换
+        :return: func的返回值
+        """
+        breaker = self._get_breaker(host) if host else None
+        retries = 0
+        while True:
+            waiting = False
+            while breaker is not None and not breaker.allow():
+                if not wait_open:
+                    self._record(name, retries, failed=True)
+                    raise CircuitOpenError(f"主机 {host} 连续失败，已暂停请求")
+                if not waiting:
+                    print(f"主机 {host} 连续失败，{name} 等待 {breaker.remaining():.1f} 秒后再请求")
+                    waiting = True
+                # 熔断结束后如果其他请求正在试探，每隔一段时间检查试探结果
+                time.sleep(max(breaker.remaining(), TRIAL_POLL_INTERVAL))
+            try:
+                result = func()
+            except Exception as e:
+                retryable = is_retryable(e)
+                if breaker is not None:
+                    if retryable:
+                        breaker.record_failure()
+                    else:
+                        breaker.release_trial()
+                if not retryable or retries + 1 >= self.max_attempts:
+                    self._record(name, retries, failed=True)
+                    if retries:
+                        print(f"{name} 重试 {retries} 次后仍失败")
+                    raise
+                retries += 1
+                delay = self.backoff(retries)
+                print(f"{name} 失败 ({e})，{delay:.1f} 秒后第 {retries} 次重试")
+                time.sleep(delay)
+                continue
+
+            if breaker is not None:
+                breaker.record_success()
+            self._record(name, retries, failed=False)
+            if retries:
+                print(f"{name} 重试 {retries} 次后成功")
+            return result
+
+    def backoff(self, retry: int) -> float:
+        """
+        计算第retry次重试前的等待时间（full jitter：在0到指数上限之间随机取值）
+        :param retry: 第几次重试，从1开始
+        :return: 等待秒数
+        """
+        cap = min(self.max_delay, self.base_delay * (2 ** (retry - 1)))
+        return random.uniform(0, cap)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        获取重试统计
+        :return: {请求名称: {'calls': 调用次数, 'retries': 重试总次数, 'failures': 最终失败次数}}
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def _get_breaker(self, host: str) -> CircuitBreaker:
+        """
+        获取主机的熔断器
+        :param host: 主机名
+        :return: 熔断器
+        """
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def _record(self, name: str, retries: int, failed: bool) -> None:
+        """
+        记录一次调用的重试次数
+        :param name: 请求名称
+        :param retries: 本次调用的重试次数
+        :param failed: 是否最终失败
+        """
+        with self._lock:
+            stats = self._stats.setdefault(name, {'calls': 0, 'retries': 0, 'failures': 0})
+            stats['calls'] += 1
+            stats['retries'] += retries
+            if failed:
+                stats['failures'] += 1
@@ -0,0 +1,751 @@
+"""
+分段并发下载模块（HTTP Range）
+"""
+import http.client
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+
+from resume_state import ResumeState, url_identity
+from cdn_selector import MirrorSelector, url_host
+from throttle import Throttle
+from retry_policy import RetryPolicy, RetryableError
+from progress import ProgressRenderer, ProgressTask
+from integrity import ContentHasher
+from dash_index import parse_sidx
+from connection_controller import ConnectionController
+
+
+class DownloadCancelled(Exception):
+    """下载被取消（其他轨道或分段失败）"""
+
+    def __init__(self):
+        super().__init__("下载已取消")
+
+
+# 每次从连接读取的字节数随速度在此范围内调整
+MIN_READ_SIZE = 64 * 1024
+MAX_READ_SIZE = 1024 * 1024
+
+# 自适应连接数时，单个文件的下载线程数最多为max_connections的几倍，
+# 多个文件同时下载时不会每个文件都创建controller.maximum个线程空等名额
+FILE_CONNECTION_FACTOR = 2
+
+
+def read_chunks(response: requests.Response) -> Iterator[Union[memoryview, bytes]]:
+    """
+    读取响应体。用同一块缓冲区循环readinto，不为每个数据块分配新对象；返回的memoryview
+    在下一次迭代时被覆盖，调用方需立即写出。每次读取的大小随速度调整：读满缓冲区很快时加倍，
+    单次读取超过0.2秒时减半，慢速连接上也能及时响应取消、限速和进度刷新。
+    读完后把连接放回连接池
+    :param response: stream=True的响应
+    :return: 数据块迭代器
+    """
+    if response.headers.get('content-encoding', 'identity') != 'identity':
+        # 压缩的响应需要解码，交给requests处理
+        yield from response.iter_content(chunk_size=MIN_READ_SIZE)
+        return
+
+    # urllib3的readinto内部仍会先读出bytes再复制，直接从底层的http.client响应读取才能避免复制
+    fp = getattr(response.raw, '_fp', None)
+    readinto = fp.readinto if isinstance(fp, http.client.HTTPResponse) else response.raw.readinto
+    expected = int(response.headers.get('content-length', -1))
+    view = memoryview(bytearray(MAX_READ_SIZE))
+    size = MIN_READ_SIZE
+    received = 0
+    while True:
+        started = time.monotonic()
+        try:
+            count = readinto(view[:size])
+        except (OSError, http.client.HTTPException) as e:
+            raise requests.ConnectionError(e) from e
+        if not count:
+            break
+        received += count
+        yield view[:count]
+        elapsed = time.monotonic() - started
+        if count == size and elapsed < 0.02:
+            size = min(size * 2, MAX_READ_SIZE)
+        elif elapsed > 0.2:
+            size = max(size // 2, MIN_READ_SIZE)
+
+    if 0 <= expected != received:
+        raise RetryableError(f"响应不完整: 收到 {received}/{expected} 字节")
+    response.raw.release_conn()
+
+
+class PartFile:
+    """.part文件的共享句柄，各分段线程通过同一个文件描述符按偏移写入"""
+
+    def __init__(self, path: str):
+        """
+        打开文件
+        :param path: 文件路径
+        """
+        self.fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        self._lock = threading.Lock()
+
+    def write_at(self, data: Union[memoryview, bytes], offset: int) -> None:
+        """
+        在指定偏移写入数据。支持pwrite的系统上不需要加锁和seek，Windows上加锁后seek再写
+        :param data: 数据
+        :param offset: 文件偏移
+        """
+        data = memoryview(data)
+        if hasattr(os, 'pwrite'):
+            while data:
+                written = os.pwrite(self.fd, data, offset)
+                data = data[written:]
+                offset += written
+            return
+        with self._lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            while data:
+                written = os.write(self.fd, data)
+                data = data[written:]
+
+    def close(self) -> None:
+        """关闭文件"""
+        os.close(self.fd)
+
+    def __enter__(self) -> 'PartFile':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class SegmentDownloader:
+    """分段并发下载器：探测文件大小，按字节区间并发下载并写入同一个文件"""
+
+    def __init__(self, session: requests.Session, max_connections: int = 4,
+                 segment_size: int = 8 * 1024 * 1024, mirror_selector: Optional[MirrorSelector] = None,
+                 throttle: Optional[Throttle] = None, retry_policy: Optional[RetryPolicy] = None,
+                 progress: Optional[ProgressRenderer] = None,
+                 controller: Optional[ConnectionController] = None):
+        """
+        初始化分段下载器
+        :param session: requests会话
+        :param max_connections: 单个文件的最大并发连接数
+        :param segment_size: 每个分段的字节数
+        :param mirror_selector: CDN镜像选择器，传输中切换镜像时记录失败的主机
+        :param throttle: 全局限速器，所有下载共享带宽上限
+        :param retry_policy: 重试策略，同一镜像上的可重试错误先退避重试，用尽后再切换镜像
+        :param progress: 进度绘制器，所有下载共享
+        :param controller: 自适应连接数控制器，所有下载共享。传入且max_connections大于1时每个文件最多开启
+                           控制器上限个连接，实际同时传输的连接数由控制器按吞吐和错误调整
+        """
+        self.session = session
+        self.mirror_selector = mirror_selector
+        self.throttle = throttle
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.progress = progress or ProgressRenderer()
+        self.controller = controller
+        self.max_connections = max(1, int(max_connections))
+        self.segment_size = max(1024 * 1024, int(segment_size))
+
+    def probe(self, url: str, headers: Dict) -> Dict:
+        """
+        探测文件大小以及服务器是否支持Range请求
+        :param url: 文件URL
+        :param headers: 请求头
+        :return: {'size': 文件大小（未知时为0）, 'accept_ranges': 是否支持Range, 'etag': ETag}
+        """
+        probe_headers = dict(headers)
+        probe_headers['Range'] = 'bytes=0-0'
+        response = self.session.get(url, headers=probe_headers, stream=True, timeout=30)
+        try:
+            response.raise_for_status()
+            info = {
+                'size': int(response.headers.get('content-length', 0)),
+                'accept_ranges': False,
+                'etag': response.headers.get('etag', ''),
+            }
+            if response.status_code == 206:
+                # 读完1字节的响应体，连接才能放回连接池复用；与分段下载一样计入带宽上限
+                body = response.content
+                if self.throttle is not None:
+                    self.throttle.consume_bytes(len(body))
+                # Content-Range: bytes 0-0/12345
+                match = re.match(r'bytes\s+\d+-\d+/(\d+)', response.headers.get('content-range', ''))
+                if match:
+                    info['size'] = int(match.group(1))
+                    info['accept_ranges'] = True
+            return info
+        finally:
+            response.close()
+
+    def split_ranges(self, start: int, end: int, boundaries: Optional[List[int]] = None) -> List[Tuple[int, int]]:
+        """
+        将字节区间切分为多个分段。传入分片边界时分段与分片对齐：文件开头的初始化段和索引单独成段，
+        之后把相邻的完整分片合并为不超过segment_size的分段，超过segment_size的分片再按固定大小切分
+        :param start: 起始字节
+        :param end: 结束字节（闭区间）
+        :param boundaries: 各分片的起始偏移，按文件顺序排列
+        :return: [(start, end)]，end为闭区间
+        """
+        cuts = [boundary for boundary in boundaries or [] if start < boundary <= end] + [end + 1]
+        ranges = []
+        index = 0
+        while start <= end:
+            while cuts[index] <= start:
+                index += 1
+            limit = start + self.segment_size
+            if not boundaries or cuts[index] > limit:
+                segment_end = min(limit, cuts[index]) - 1
+            elif start == 0:
+                segment_end = cuts[index] - 1
+            else:
+                while index + 1 < len(cuts) and cuts[index + 1] <= limit:
+                    index += 1
+                segment_end = cuts[index] - 1
+            ranges.append((start, segment_end))
+            start = segment_end + 1
+        return ranges
+
+    def fragment_boundaries(self, url: str, headers: Dict, index_range: Tuple[int, int],
+                            total_size: int) -> Optional[List[int]]:
+        """
+        读取DASH流的sidx索引，得到各分片的起始偏移
+        :param url: 文件URL
+        :param headers: 请求头
+        :param index_range: 索引的(start, end)闭区间，来自播放地址中的SegmentBase
+        :param total_size: 文件总大小
+        :return: 各分片的起始偏移（最后一个分片之后还有数据时包含其结束位置），读取或解析失败时返回None
+        """
+        start, end = index_range
+        range_headers = dict(headers)
+        range_headers['Range'] = f'bytes={start}-{end}'
+
+        def fetch_index() -> bytes:
+            response = self.session.get(url, headers=range_headers, timeout=30)
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise Exception(f"服务器未按Range返回索引 (HTTP {response.status_code})")
+            return response.content
+
+        try:
+            data = self.retry_policy.call(fetch_index, "CDN索引", host=url_host(url))
+            if self.throttle is not None:
+                self.throttle.consume_bytes(len(data))
+            fragments = parse_sidx(data, start)
+        except Exception as e:
+            print(f"读取分片索引失败 ({e})，按固定大小分段")
+            return None
+        if not fragments or fragments[0][0] <= end or fragments[-1][1] >= total_size:
+            print("分片索引与文件大小不一致，按固定大小分段")
+            return None
+        boundaries = [fragment_start for fragment_start, _ in fragments]
+        if fragments[-1][1] + 1 < total_size:
+            boundaries.append(fragments[-1][1] + 1)
+        return boundaries
+
+    def download(self, url: str, filepath: str, headers: Dict,
+                 cancel: Optional[threading.Event] = None, mirrors: Optional[List[str]] = None,
+                 name: Optional[str] = None, result: Optional[Dict] = None,
+                 index_range: Optional[Tuple[int, int]] = None) -> bool:
+        """
+        下载文件。数据先写入filepath.part，字节数与服务器返回的大小一致后才改名为filepath。
+        服务器支持Range时分段并发下载，中断后保留.part文件，下次运行从断点继续；
+        否则回退为单连接下载。写入的同时计算内容哈希。
+        DASH流传入sidx的位置时，分段与分片边界对齐，按文件顺序分配给各连接，已完成的部分从头起逐个分片增长
+        :param url: 文件URL
+        :param filepath: 保存路径
+        :param headers: 请求头
+        :param cancel: 取消事件，置位后下载尽快中止
+        :param mirrors: 备用镜像地址，当前地址卡顿或返回403/5xx时依次切换
+        :param name: 进度中显示的名称，默认为文件名
+        :param result: 可选，用于返回文件大小(size)和内容哈希(content_hash)
+        :param index_range: DASH流中sidx索引的(start, end)闭区间
+        :return: 是否成功
+        """
+        if cancel is None:
+            cancel = threading.Event()
+        if result is None:
+            result = {}
+
+        info, candidates = self._probe_candidates([url] + list(mirrors or []), headers)
+        if not candidates:
+            print(f"没有可用的下载地址: {name or os.path.basename(filepath)}")
+            return False
+        part_path = filepath + '.part'
+        name = name or os.path.basename(filepath)
+        if info['accept_ranges'] and info['size'] > 0:
+            resume = ResumeState.open(part_path, url_identity(candidates[0]), info['size'], info['etag'])
+            if resume.completed_bytes > 0:
+                print(f"从断点继续下载: 已完成 {resume.completed_bytes}/{info['size']}")
+            boundaries = None
+            if index_range is not None and resume.missing_ranges():
+                boundaries = self.fragment_boundaries(candidates[0], headers, index_range, info['size'])
+            task = self.progress.start_task(name, info['size'], resume.completed_bytes)
+            hasher = ContentHasher(info['size'])
+            success = False
+            try:
+                self._download_segmented(candidates, headers, resume, cancel, task, hasher, boundaries)
+                success = True
+            finally:
+                task.finish(success)
+            if resume.completed_bytes != info['size']:
+                raise Exception(f"下载不完整: {resume.completed_bytes}/{info['size']} 字节")
+            # 续传前已下载的部分没有经过本次的哈希计算，从.part文件中补算
+            result['content_hash'] = hasher.hexdigest(part_path)
+            result['size'] = info['size']
+            resume.finish(filepath)
+            return True
+
+        # 不支持Range的文件无法续传，丢弃旧的部分数据，失败时从下一个镜像重新下载
+        ResumeState(part_path, '', 0).discard()
+        task = self.progress.start_task(name, info['size'])
+        success = False
+        try:
+            for index, candidate in enumerate(candidates):
+                def download_single() -> None:
+                    task.reset()
+                    hasher = ContentHasher()
+
+                    def write(data: Union[memoryview, bytes]) -> None:
+                        f.write(data)
+                        hasher.update(data)
+
+                    with open(part_path, 'wb') as f:
+                        result['size'] = self._download_single(candidate, write, headers, cancel, task)
+                    result['content_hash'] = hasher.hexdigest()
+
+                try:
+                    self.retry_policy.call(download_single, "CDN下载", host=url_host(candidate))
+                    break
+                except Exception as e:
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    if isinstance(e, DownloadCancelled) or index == len(candidates) - 1:
+                        raise
+                    self._report_failure(candidate, e)
+            success = True
+        finally:
+            task.finish(success)
+        os.replace(part_path, filepath)
+        return True
+
+    def download_stream(self, url: str, write: Callable[[bytes], object], headers: Dict,
+                        cancel: Optional[threading.Event] = None, mirrors: Optional[List[str]] = None,
+                        name: Optional[str] = None, index_range: Optional[Tuple[int, int]] = None) -> int:
+        """
+        按文件顺序下载并把数据交给write（如ffmpeg的输入管道），不写入磁盘。
+        服务器支持Range时仍多连接分段下载，先完成的后续分段在内存中等待前面的分段写出，
+        因此最多占用 max_connections 个分段的内存。数据不落地，中断后无法续传。
+        传入sidx的位置时分段与分片边界对齐
+        :param url: 文件URL
+        :param write: 按顺序接收数据的函数
+        :param headers: 请求头
+        :param cancel: 取消事件，置位后下载尽快中止
+        :param mirrors: 备用镜像地址
+        :param name: 进度中显示的名称，默认为URL中的文件名
+        :param index_range: DASH流中sidx索引的(start, end)闭区间
+        :return: 文件字节数
+        """
+        if cancel is None:
+            cancel = threading.Event()
+
+        info, candidates = self._probe_candidates([url] + list(mirrors or []), headers)
+        if not candidates:
+            raise Exception("没有可用的下载地址")
+        task = self.progress.start_task(name or os.path.basename(urlsplit(url).path), info['size'])
+        success = False
+        try:
+            if info['accept_ranges'] and info['size'] > 0:
+                boundaries = None
+                if index_range is not None:
+                    boundaries = self.fragment_boundaries(candidates[0], headers, index_range, info['size'])
+                self._download_ordered(candidates, write, headers, info['size'], cancel, task, boundaries)
+                size = info['size']
+            else:
+                # 不支持Range时单连接下载，数据已交给write后无法重新开始，因此不重试
+                size = self._download_single(candidates[0], write, headers, cancel, task)
+            success = True
+            return size
+        finally:
+            task.finish(success)
+
+    def _probe_candidates(self, urls: List[str], headers: Dict) -> Tuple[Dict, List[str]]:
+        """
+        依次探测候选镜像，直到有一个可用
+        :param urls: 候选镜像地址，按优先级排列
+        :param headers: 请求头
+        :return: (探测结果, 以可用镜像开头的候选地址)；没有候选地址时返回大小为0的探测结果和空列表
+        """
+        candidates = list(dict.fromkeys(url for url in urls if url))
+        if not candidates:
+            return {'size': 0, 'accept_ranges': False, 'etag': ''}, []
+        for index, candidate in enumerate(candidates):
+            try:
+                info = self.retry_policy.call(lambda: self.probe(candidate, headers), "CDN探测",
+                                              host=url_host(candidate))
+            except Exception as e:
+                if index == len(candidates) - 1:
+                    raise
+                self._report_failure(candidate, e)
+                continue
+            return info, candidates[index:] + candidates[:index]
+
+    def _report_failure(self, url: str, error: Exception) -> None:
+        """
+        记录镜像失败并提示切换
+        :param url: 失败的地址
+        :param error: 错误
+        """
+        print(f"\nCDN节点 {url_host(url)} 失败 ({error})，切换到下一个镜像")
+        if self.mirror_selector is not None:
+            self.mirror_selector.report_failure(url)
+
+    def _download_single(self, url: str, write: Callable[[bytes], object], headers: Dict,
+                         cancel: threading.Event, task: ProgressTask) -> int:
+        """
+        单连接流式下载
+        :param url: 文件URL
+        :param write: 接收数据的函数
+        :param headers: 请求头
+        :param cancel: 取消事件
+        :param task: 下载进度
+        :return: 下载的字节数
+        """
+        with self._connection_slot(url, cancel) as host:
+            response = self.session.get(url, headers=headers, stream=True, timeout=30)
+            task.connection_opened()
+            try:
+                response.raise_for_status()
+                downloaded = 0
+                for chunk in read_chunks(response):
+                    if cancel.is_set():
+                        raise DownloadCancelled()
+                    write(chunk)
+                    downloaded += len(chunk)
+                    task.add(len(chunk))
+                    if self.throttle is not None:
+                        self.throttle.consume_bytes(len(chunk))
+                    if host is not None:
+                        self.controller.add_bytes(host, len(chunk))
+                return downloaded
+            finally:
+                task.connection_closed()
+                response.close()
+
+    @contextmanager
+    def _connection_slot(self, url: str, cancel: threading.Event) -> Iterator[Optional[str]]:
+        """
+        在控制器中占用一个连接名额，请求出错时把错误报告给控制器
+        :param url: 请求的URL
+        :param cancel: 取消事件，等待名额期间置位时抛出DownloadCancelled
+        :return: 主机名，未使用控制器时为None
+        """
+        if self.controller is None:
+            yield None
+            return
+        host = url_host(url)
+        if not self.controller.acquire(host, cancel):
+            raise DownloadCancelled()
+        try:
+            yield host
+        except Exception as e:
+            self.controller.report_error(host, e)
+            raise
+        finally:
+            self.controller.release(host)
+
+    def _download_segmented(self, urls: List[str], headers: Dict, resume: ResumeState,
+                            cancel: threading.Event, task: ProgressTask, hasher: ContentHasher,
+                            boundaries: Optional[List[int]] = None) -> bool:
+        """
+        多连接分段下载缺失的字节区间，每个分段写入.part文件中对应的偏移位置
+        :param urls: 候选镜像地址，按优先级排列
+        :param headers: 请求头
+        :param resume: 续传状态
+        :param cancel: 取消事件，任一分段失败时置位
+        :param task: 下载进度
+        :param hasher: 内容哈希，各分段写入时按偏移计算
+        :param boundaries: 分片的起始偏移，分段与分片对齐
+        :return: 是否成功
+        """
+        ranges = []
+        for start, end in resume.missing_ranges():
+            ranges.extend(self.split_ranges(start, end, boundaries))
+        if not ranges:
+            return True
+
+        limit = self.max_connections
+        if self.controller is not None and self.max_connections > 1:
+            limit = min(self.controller.maximum, self.max_connections * FILE_CONNECTION_FACTOR)
+        connections = min(limit, len(ranges))
+        if connections > 1:
+            aligned = f"(按 {len(boundaries)} 个分片对齐)" if boundaries else ""
+            adaptive = "最多 " if self.controller is not None else ""
+            print(f"分段下载: {len(ranges)} 个分段{aligned}, {adaptive}{connections} 个连接")
+
+        # mirror: 当前使用的镜像序号，所有分段共享，某个镜像失败后整体切换到下一个
+        state = {'progress': task, 'hasher': hasher, 'next': 0, 'error': None, 'mirror': 0}
+        lock = threading.Lock()
+
+        def next_range() -> Optional[Tuple[int, int]]:
+            with lock:
+                if cancel.is_set() or state['next'] >= len(ranges):
+                    return None
+                byte_range = ranges[state['next']]
+                state['next'] += 1
+                return byte_range
+
+        def worker(part_file: PartFile) -> None:
+            while True:
+                byte_range = next_range()
+                if byte_range is None:
+                    return
+                try:
+                    self._download_range_with_mirrors(urls, part_file, headers, byte_range, resume,
+                                                      state, lock, cancel)
+                except Exception as e:
+                    # 只记录第一个真正的错误，其余分段因取消而退出
+                    with lock:
+                        if state['error'] is None:
+                            state['error'] = e
+                    cancel.set()
+                    return
+
+        with PartFile(resume.part_path) as part_file:
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                for _ in range(connections):
+                    executor.submit(worker, part_file)
+
+        if state['error'] is not None or cancel.is_set():
+            print(f"已保留未完成的下载 ({resume.completed_bytes}/{resume.total_size})，下次运行将从断点继续")
+            if state['error'] is not None:
+                raise state['error']
+            raise DownloadCancelled()
+        return True
+
+    def _download_ordered(self, urls: List[str], write: Callable[[bytes], object], headers: Dict,
+                          total_size: int, cancel: threading.Event, task: ProgressTask,
+                          boundaries: Optional[List[int]] = None) -> None:
+        """
+        多连接分段下载，各分段在内存中下载完成后按文件顺序交给write
+        :param urls: 候选镜像地址，按优先级排列
+        :param write: 按顺序接收数据的函数
+        :param headers: 请求头
+        :param total_size: 文件总大小
+        :param cancel: 取消事件，任一分段失败时置位
+        :param task: 下载进度
+        :param boundaries: 分片的起始偏移，分段与分片对齐
+        """
+        ranges = self.split_ranges(0, total_size - 1, boundaries)
+        # 每个连接在内存中占用一个分段，连接数不随控制器增加，控制器只能让部分连接等待
+        connections = min(self.max_connections, len(ranges))
+        if connections > 1:
+            aligned = f"(按 {len(boundaries)} 个分片对齐)" if boundaries else ""
+            print(f"分段下载: {len(ranges)} 个分段{aligned}, {connections} 个连接")
+
+        # written: 已按顺序写出的分段数
+        state = {'progress': task, 'next': 0, 'written': 0, 'error': None, 'mirror': 0}
+        lock = threading.Lock()
+        turn = threading.Condition(lock)
+
+        def worker() -> None:
+            while True:
+                with lock:
+                    if cancel.is_set() or state['next'] >= len(ranges):
+                        return
+                    index = state['next']
+                    state['next'] += 1
+                try:
+                    buffer = self._fetch_range_with_mirrors(urls, headers, ranges[index], total_size,
+                                                            state, lock, cancel)
+                    # 等前面的分段写出后再写，保证输出顺序
+                    with turn:
+                        while state['written'] != index and not cancel.is_set():
+                            turn.wait(0.5)
+                    if cancel.is_set():
+                        raise DownloadCancelled()
+                    write(buffer)
+                    with turn:
+                        state['written'] += 1
+                        turn.notify_all()
+                except Exception as e:
+                    with turn:
+                        if state['error'] is None:
+                            state['error'] = e
+                        cancel.set()
+                        turn.notify_all()
+                    return
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            for _ in range(connections):
+                executor.submit(worker)
+
+        if state['error'] is not None:
+            raise state['error']
+        if cancel.is_set():
+            raise DownloadCancelled()
+
+    def _fetch_range_with_mirrors(self, urls: List[str], headers: Dict, byte_range: Tuple[int, int],
+                                  total_size: int, state: Dict, lock: threading.Lock,
+                                  cancel: threading.Event) -> bytearray:
+        """
+        把单个字节区间下载到内存，重试和切换镜像时从已收到的位置继续
+        :param urls: 候选镜像地址
+        :param headers: 请求头
+        :param byte_range: (start, end)闭区间
+        :param total_size: 文件总大小
+        :param state: 共享的下载进度
+        :param lock: 进度锁
+        :param cancel: 取消事件
+        :return: 区间数据
+        """
+        start, end = byte_range
+        buffer = bytearray(end - start + 1)
+        received = 0
+
+        def write(data: Union[memoryview, bytes]) -> None:
+            nonlocal received
+            buffer[received:received + len(data)] = data
+            received += len(data)
+
+        def download_remaining(url: str) -> None:
+            remaining = start + received
+            if remaining <= end:
+                self._read_range(url, headers, (remaining, end), total_size, write,
+                                 state, lock, cancel)
+
+        self._call_with_mirrors(urls, download_remaining, state, lock)
+        return buffer
+
+    def _download_range_with_mirrors(self, urls: List[str], part_file: PartFile, headers: Dict,
+                                     byte_range: Tuple[int, int],
+                                     resume: ResumeState, state: Dict, lock: threading.Lock,
+                                     cancel: threading.Event) -> None:
+        """
+        下载单个字节区间，当前镜像卡顿或返回403/5xx时从已写入的位置起切换到下一个镜像继续
+        :param urls: 候选镜像地址
+        :param part_file: .part文件
+        :param headers: 请求头
+        :param byte_range: (start, end)闭区间
+        :param resume: 续传状态
+        :param state: 共享的下载进度
+        :param lock: 进度锁
+        :param cancel: 取消事件
+        """
+        start, end = byte_range
+
+        def download_remaining(url: str) -> None:
+            # 每次重试只下载区间内尚未写入的部分
+            remaining = resume.first_missing(start, end)
+            if remaining is not None:
+                self._download_range(url, part_file, headers, (remaining, end), resume, state, lock, cancel)
+
+        self._call_with_mirrors(urls, download_remaining, state, lock)
+
+    def _call_with_mirrors(self, urls: List[str], download_remaining: Callable[[str], None],
+                           state: Dict, lock: threading.Lock) -> None:
+        """
+        在当前镜像上重试download_remaining，重试用尽后切换到下一个镜像继续
+        :param urls: 候选镜像地址
+        :param download_remaining: 从指定镜像下载区间剩余部分的函数
+        :param state: 共享的下载进度，mirror为当前镜像序号
+        :param lock: 进度锁
+        """
+        while True:
+            with lock:
+                mirror = state['mirror']
+            url = urls[mirror]
+            try:
+                self.retry_policy.call(lambda: download_remaining(url), "CDN分段下载", host=url_host(url))
+                return
+            except DownloadCancelled:
+                raise
+            except Exception as e:
+                with lock:
+                    if state['mirror'] == mirror:
+                        if mirror + 1 >= len(urls):
+                            raise
+                        state['mirror'] = mirror + 1
+                        self._report_failure(url, e)
+
+    def _download_range(self, url: str, part_file: PartFile, headers: Dict, byte_range: Tuple[int, int],
+                        resume: ResumeState, state: Dict, lock: threading.Lock,
+                        cancel: threading.Event) -> None:
+        """
+        下载单个字节区间并写入文件对应位置，已写入的部分记录到续传状态中
+        :param url: 文件URL
+        :param part_file: .part文件
+        :param headers: 请求头
+        :param byte_range: (start, end)闭区间
+        :param resume: 续传状态
+        :param state: 共享的下载进度
+        :param lock: 进度锁
+        :param cancel: 取消事件，任一分段失败时置位
+        """
+        start, end = byte_range
+        position = start
+        hasher = state['hasher']
+
+        def write(data: Union[memoryview, bytes]) -> None:
+            nonlocal position
+            part_file.write_at(data, position)
+            hasher.update_at(position, data)
+            position += len(data)
+
+        try:
+            self._read_range(url, headers, byte_range, resume.total_size, write, state, lock, cancel)
+        finally:
+            # pwrite不经过用户态缓冲，记录的区间不会超前于已写入文件的数据
+            resume.add_range(start, position - 1)
+
+    def _read_range(self, url: str, headers: Dict, byte_range: Tuple[int, int], total_size: int,
+                    write: Callable[[bytes], object], state: Dict, lock: threading.Lock,
+                    cancel: threading.Event) -> None:
+        """
+        请求单个字节区间，收到的数据依次交给write
+        :param url: 文件URL
+        :param headers: 请求头
+        :param byte_range: (start, end)闭区间
+        :param total_size: 文件总大小
+        :param write: 接收数据的函数
+        :param state: 共享的下载进度
+        :param lock: 进度锁
+        :param cancel: 取消事件
+        """
+        start, end = byte_range
+        range_headers = dict(headers)
+        range_headers['Range'] = f'bytes={start}-{end}'
+
+        position = start
+        progress = state['progress']
+        with self._connection_slot(url, cancel) as host:
+            response = self.session.get(url, headers=range_headers, stream=True, timeout=30)
+            progress.connection_opened()
+            try:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise Exception(f"服务器未按Range返回分段 (HTTP {response.status_code})")
+                content_range = response.headers.get('content-range', '')
+                if content_range != f'bytes {start}-{end}/{total_size}':
+                    raise Exception(f"服务器返回的分段与请求不一致: {content_range}")
+
+                for chunk in read_chunks(response):
+                    if cancel.is_set():
+                        raise DownloadCancelled()
+                    write(chunk)
+                    position += len(chunk)
+                    progress.add(len(chunk))
+                    if self.throttle is not None:
+                        self.throttle.consume_bytes(len(chunk))
+                    if host is not None:
+                        self.controller.add_bytes(host, len(chunk))
+
+                if position != end + 1:
+                    raise RetryableError(f"分段 {start}-{end} 不完整: 收到 {position - start} 字节")
+            finally:
+                progress.connection_closed()
+                response.close()
@@ -0,0 +1,181 @@
+"""
+DASH流选择模块：按课程配置的分辨率上限、编码偏好、码率上限和音质选择视频流和音频流
+"""
+from typing import Dict, List, Optional, Tuple
+
+# 请求播放地址时的fnval：16 DASH、128 4K、1024 8K、2048 AV1（HEVC包含在DASH中）。
+# 不请求HDR(64)和杜比视界(512)，这两种格式需要支持HDR的播放器
+FNVAL = 16 | 128 | 1024 | 2048
+# 没有配置编码偏好时沿用原来的fnval，只请求DASH，避免在用户不知情时改为下载4K、AV1等很多播放器不支持的文件
+DEFAULT_FNVAL = 16
+# 默认的编码偏好：AVC兼容性最好
+DEFAULT_CODECS = ['avc', 'hevc', 'av1']
+
+# DASH视频流的codecid
+CODEC_IDS = {7: 'avc', 12: 'hevc', 13: 'av1'}
+# codecid缺失时按codecs字符串的前缀判断
+CODEC_PREFIXES = {'avc1': 'avc', 'hev1': 'hevc', 'hvc1': 'hevc', 'av01': 'av1'}
+
+# 音质档位对应的音频流ID上限：30216 64K、30232 132K、30280 192K
+AUDIO_TIERS = {'low': 30216, 'medium': 30232, 'high': 30280, 'hires': 30280}
+
+# stream_policy和course_stream_policy中可以设置的项
+POLICY_OPTIONS = ('max_height', 'codecs', 'max_bandwidth_kbps', 'audio_quality')
+
+
+def policy_options(options: Optional[Dict], source: str) -> Dict:
+    """
+    过滤配置中的选择策略项，未知的项（如拼写错误）给出提示后忽略
+    :param options: 配置中的选择策略
+    :param source: 配置项名称，用于提示
+    :return: 可以传给StreamPolicy的参数
+    """
+    options = options or {}
+    for key in options:
+        if key not in POLICY_OPTIONS:
+            print(f"{source} 中的未知配置项 {key} 已忽略，可用的项: {', '.join(POLICY_OPTIONS)}")
+    return {key: value for key, value in options.items() if key in POLICY_OPTIONS}
+
+
+def video_codec(stream: Dict) -> str:
+    """
+    获取视频流的编码
+    :param stream: DASH中的video条目
+    :return: avc/hevc/av1，无法识别时返回codecs原值
+    """
+    codec = CODEC_IDS.get(stream.get('codecid'))
+    if codec:
+        return codec
+    codecs = stream.get('codecs') or ''
+    return CODEC_PREFIXES.get(codecs.split('.')[0], codecs)
+
+
+class StreamPolicy:
+    """
+    流选择策略。视频：在不超过分辨率上限和码率上限的流中取最高画质，同一画质有多种编码时按编码偏好选择
+    （默认AVC优先，兼容性最好；同画质下AV1通常最小，HEVC次之）；音频：取不超过音质档位的最高码率
+    """
+
+    def __init__(self, max_height: int = 0, codecs: Optional[List[str]] = None,
+                 max_bandwidth_kbps: int = 0, audio_quality: str = 'high',
+                 course_overrides: Optional[Dict[str, Dict]] = None):
+        """
+        初始化选择策略
+        :param max_height: 视频高度上限（如1080），0表示不限
+        :param codecs: 编码偏好，靠前的优先，如 ["av1", "hevc", "avc"]；未列出的编码只在没有其他选择时使用，
+                       默认为 ["avc", "hevc", "av1"]
+        :param max_bandwidth_kbps: 视频码率上限（kbps），0表示不限
+        :param audio_quality: 音质档位：low(64K)/medium(132K)/high(192K)/hires(有无损或杜比音轨时优先使用)
+        :param course_overrides: 按课程ID覆盖的配置，如 {"12345": {"max_height": 720}}
+        """
+        self.max_height = int(max_height or 0)
+        self.codecs = [codec.lower() for codec in (codecs or DEFAULT_CODECS)]
+        self.codecs_configured = bool(codecs)
+        self.max_bandwidth_kbps = int(max_bandwidth_kbps or 0)
+        if audio_quality not in AUDIO_TIERS:
+            print(f"未知的音质档位 {audio_quality}，使用 high")
+            audio_quality = 'high'
+        self.audio_quality = audio_quality
+        self.course_overrides = course_overrides or {}
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'StreamPolicy':
+        """
+        从配置文件创建选择策略
+        :param config: 配置，读取stream_policy和course_stream_policy
+        :return: 选择策略
+        """
+        overrides = {
+            season_id: policy_options(override, f"course_stream_policy.{season_id}")
+            for season_id, override in (config.get('course_stream_policy') or {}).items()
+        }
+        return cls(course_overrides=overrides, **policy_options(config.get('stream_policy'), 'stream_policy'))
+
+    def fnval(self) -> int:
+        """
+        请求播放地址时使用的fnval：配置了编码偏好（全局或任一课程）时请求4K、8K和AV1流，否则沿用原来的DASH
+        :return: fnval
+        """
+        if self.codecs_configured or any(override.get('codecs') for override in self.course_overrides.values()):
+            return FNVAL
+        return DEFAULT_FNVAL
+
+    def for_course(self, season_id: Optional[int]) -> 'StreamPolicy':
+        """
+        获取课程使用的策略：课程有单独配置时覆盖对应的项
+        :param season_id: 课程ID
+        :return: 选择策略
+        """
+        override = self.course_overrides.get(str(season_id))
+        if not override:
+            return self
+        options = {
+            'max_height': self.max_height,
+            'codecs': self.codecs,
+            'max_bandwidth_kbps': self.max_bandwidth_kbps,
+            'audio_quality': self.audio_quality,
+        }
+        options.update(override)
+        return StreamPolicy(**options)
+
+    def _codec_rank(self, stream: Dict) -> int:
+        """
+        编码在偏好中的位置，未列出的编码排在最后
+        :param stream: 视频流
+        :return: 序号
+        """
+        codec = video_codec(stream)
+        return self.codecs.index(codec) if codec in self.codecs else len(self.codecs)
+
+    def select_video(self, videos: List[Dict]) -> Optional[Dict]:
+        """
+        选择视频流
+        :param videos: DASH中的video列表
+        :return: 选中的视频流，列表为空时返回None
+        """
+        if not videos:
+            return None
+        acceptable = [
+            video for video in videos
+            if (not self.max_height or video.get('height', 0) <= self.max_height)
+            and (not self.max_bandwidth_kbps or video.get('bandwidth', 0) <= self.max_bandwidth_kbps * 1000)
+        ]
+        if not acceptable:
+            # 没有满足上限的流时退而选择码率最低的流
+            smallest = min(videos, key=lambda video: video.get('bandwidth', 0))
+            print(f"没有满足分辨率/码率上限的视频流，使用码率最低的流 ({smallest.get('height', 0)}p)")
+            return smallest
+        best_quality = max(video.get('id', 0) for video in acceptable)
+        candidates = [video for video in acceptable if video.get('id', 0) == best_quality]
+        return min(candidates, key=lambda video: (self._codec_rank(video), video.get('bandwidth', 0)))
+
+    def select_audio(self, dash: Dict) -> Optional[Dict]:
+        """
+        选择音频流
+        :param dash: 播放地址中的dash数据
+        :return: 选中的音频流，没有音频流时返回None
+        """
+        if self.audio_quality == 'hires':
+            # 无损(FLAC)优先，其次杜比全景声
+            flac = (dash.get('flac') or {}).get('audio')
+            if flac:
+                return flac
+            dolby = (dash.get('dolby') or {}).get('audio') or []
+            if dolby:
+                return dolby[0]
+        audios = dash.get('audio') or []
+        if not audios:
+            return None
+        ceiling = AUDIO_TIERS[self.audio_quality]
+        acceptable = [audio for audio in audios if audio.get('id', 0) <= ceiling]
+        if not acceptable:
+            return min(audios, key=lambda audio: audio.get('bandwidth', 0))
+        return max(acceptable, key=lambda audio: (audio.get('id', 0), audio.get('bandwidth', 0)))
+
+    def select(self, dash: Dict) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        选择视频流和音频流
+        :param dash: 播放地址中的dash数据
+        :return: (视频流, 音频流)
+        """
+        return self.select_video(dash.get('video') or []), self.select_audio(dash)
@@ -0,0 +1,62 @@
+"""
+run_jobs的测试：账本中已完成的剧集不应请求播放地址
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from bilibili_downloader import BilibiliDownloader
+from download_ledger import DownloadLedger
+from job_scheduler import JobScheduler
+from playurl_prefetcher import PlayurlPrefetcher
+
+
+class CountingCourse:
+    """只统计播放地址请求次数的课程API"""
+
+    def __init__(self):
+        self.playurl_calls = 0
+
+    def get_episode_playurl(self, ep_id, cid):
+        self.playurl_calls += 1
+        return None
+
+
+class RunJobsTest(unittest.TestCase):
+
+    def test_done_episodes_do_not_request_playurl(self):
+        with tempfile.TemporaryDirectory() as base_path:
+            season_id = 7
+            episodes = [{'id': idx, 'cid': idx, 'title': f'第{idx}集', 'duration': 60} for idx in range(1, 11)]
+            course_path = os.path.join(base_path, 'T')
+            os.makedirs(course_path)
+            ledger = DownloadLedger(os.path.join(base_path, 'ledger.db'))
+            for episode in episodes:
+                path = os.path.join(course_path, f"{episode['id']:02d}.mp4")
+                with open(path, 'wb') as f:
+                    f.write(b'x')
+                ledger.mark_episode(season_id, episode['id'], episode['cid'], DownloadLedger.DONE, path)
+
+            course = CountingCourse()
+            prefetcher = PlayurlPrefetcher(course, 2)
+            downloader = BilibiliDownloader(None, base_path, 1, course, ledger, prefetcher)
+            try:
+                plan = main.prepare_course(course, downloader, None, {'season_id': season_id, 'title': 'T'},
+                                           base_path, {'episodes': episodes})
+                scheduler = JobScheduler()
+                scheduler.add_course(season_id, plan['episodes'], context=plan, done=plan['done'])
+                main.run_jobs(downloader, scheduler, 3)
+            finally:
+                prefetcher.shutdown()
+                ledger.close()
+
+            self.assertEqual(course.playurl_calls, 0)
+            self.assertEqual(plan['results'], {idx: True for idx in range(1, 11)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+"""
+限速模块：CDN下载带宽上限和API请求频率限制
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 需要限制请求频率的API主机
+API_HOSTS = ('api.bilibili.com',)
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数，rate<=0表示不限速"""
+
+    def __init__(self, rate: float = 0, burst: Optional[float] = None):
+        """
+        初始化令牌桶
+        :param rate: 每秒令牌数
+        :param burst: 桶容量（允许的突发量），默认为1秒的令牌数
+        """
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.burst = 0.0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate: float, burst: Optional[float] = None) -> None:
+        """
+        运行时修改速率
+        :param rate: 每秒令牌数
+        :param burst: 桶容量
+        """
+        with self._lock:
+            self.rate = max(0.0, float(rate or 0))
+            self.burst = float(burst) if burst else max(self.rate, 1.0)
+            self.tokens = min(self.tokens, self.burst)
+
+    def consume(self, amount: float) -> None:
+        """
+        取出令牌，令牌不足时等待。允许透支，透支量由之后的等待偿还，
+        因此一次取出超过桶容量的令牌也不会卡死
+        :param amount: 令牌数
+        """
+        with self._lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Throttle:
+    """全局限速器，BilibiliDownloader、BilibiliCourse和CoursewareDownloader共用一个实例"""
+
+    def __init__(self, max_speed_mb: float = 0, api_rate: float = 0,
+                 speed_schedule: Optional[List[Dict]] = None, config_path: Optional[str] = None):
+        """
+        初始化限速器
+        :param max_speed_mb: CDN下载总带宽上限（MB/s），0表示不限
+        :param api_rate: api.bilibili.com每秒最多请求数，0表示不限
+        :param speed_schedule: 分时段带宽上限，如 [{"start": "08:00", "end": "22:00", "max_speed_mb": 20}]
+        :param config_path: 配置文件路径，文件修改后自动重新读取限速配置
+        """
+        self.bytes_bucket = TokenBucket()
+        self.api_bucket = TokenBucket()
+        self.config_path = config_path
+        self._lock = threading.Lock()
+        self._config_mtime = self._get_config_mtime()
+        self._last_check = 0.0
+        self.max_speed_mb = 0.0
+        self.api_rate = 0.0
+        self.speed_schedule: List[Dict] = []
+        self.set_limits(max_speed_mb, api_rate, speed_schedule)
+
+    def load_config(self, config: Dict) -> None:
+        """
+        从配置字典读取限速设置
+        :param config: 配置字典
+        """
+        self.set_limits(config.get('max_speed_mb', 0), config.get('api_rate', 4),
+                        config.get('speed_schedule') or [])
+
+    def set_limits(self, max_speed_mb: Optional[float] = None, api_rate: Optional[float] = None,
+                   speed_schedule: Optional[List[Dict]] = None) -> None:
+        """
+        运行时修改限速，参数为None时保持不变
+        :param max_speed_mb: CDN下载总带宽上限（MB/s），0表示不限
+        :param api_rate: api.bilibili.com每秒最多请求数，0表示不限
+        :param speed_schedule: 分时段带宽上限
+        """
+        with self._lock:
+            if max_speed_mb is not None:
+                self.max_speed_mb = float(max_speed_mb)
+            if speed_schedule is not None:
+                self.speed_schedule = list(speed_schedule)
+            if api_rate is not None:
+                self.api_rate = float(api_rate)
+                self.api_bucket.set_rate(self.api_rate)
+        self._apply_schedule()
+
+    def current_speed_limit(self) -> float:
+        """
+        当前时段生效的带宽上限
+        :return: MB/s，0表示不限
+        """
+        now = datetime.now().strftime('%H:%M')
+        with self._lock:
+            for rule in self.speed_schedule:
+                start, end = rule.get('start', '00:00'), rule.get('end', '24:00')
+                # 支持跨午夜的时段，如 22:00-06:00
+                in_range = start <= now < end if start <= end else (now >= start or now < end)
+                if in_range:
+                    return float(rule.get('max_speed_mb', 0))
+            return self.max_speed_mb
+
+    def consume_bytes(self, amount: int) -> None:
+        """
+        CDN下载每收到一块数据调用一次，超出带宽上限时等待
+        :param amount: 字节数
+        """
+        self._maybe_refresh()
+        self.bytes_bucket.consume(amount)
+
+    def acquire_api(self) -> None:
+        """API请求发出前调用，超出请求频率时等待"""
+        self._maybe_refresh()
+        self.api_bucket.consume(1)
+
+    def _apply_schedule(self) -> None:
+        """按当前时段设置带宽令牌桶的速率"""
+        limit = self.current_speed_limit()
+        rate = limit * 1024 * 1024
+        if rate != self.bytes_bucket.rate:
+            self.bytes_bucket.set_rate(rate)
+
+    def _maybe_refresh(self) -> None:
+        """每秒最多检查一次时段切换和配置文件变化"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_check < 1:
+                return
+            self._last_check = now
+        self._reload_config()
+        self._apply_schedule()
+
+    def _get_config_mtime(self) -> float:
+        """
+        获取配置文件修改时间
+        :return: 修改时间，文件不存在时为0
+        """
+        if self.config_path and os.path.exists(self.config_path):
+            return os.path.getmtime(self.config_path)
+        return 0.0
+
+    def _reload_config(self) -> None:
+        """配置文件修改后重新读取限速配置，无需重启"""
+        mtime = self._get_config_mtime()
+        if not mtime or mtime == self._config_mtime:
+            return
+        self._config_mtime = mtime
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"重新读取限速配置失败: {e}")
+            return
+        self.load_config(config)
+        speed = self.current_speed_limit()
+        speed_text = f"{speed:g} MB/s" if speed else "不限"
+        api_text = f"{self.api_rate:g} 次/秒" if self.api_rate else "不限"
+        print(f"\n限速配置已更新: 带宽上限 {speed_text}, API请求 {api_text}")